@@ -39,7 +39,8 @@ COLUMN_DISPLAY_MAP = {
     "vol": "量",
     "amount": "金额",
     "buy_date": "建议买入日期",
-    "gold_date": "AI 观察日"
+    "gold_date": "AI 观察日",
+    "strategy_id": "选股策略"
 }
 
 # 页面配置
@@ -444,7 +445,7 @@ with tab1:
                         t1.buy_date, t1.gold_date, t1.execute_date, t1.execute_time, 
                         t1.ts_code, t2.ts_code_name as stock_name,
                         t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
-                        t1.vol, t1.amount
+                        t1.vol, t1.amount, t1.strategy_id
                     FROM stock_selected t1
                     LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
                     {base_where}
@@ -570,6 +571,50 @@ with tab2:
         
         run_script(script_path_select, [start_str, end_str])
 
+    # 条件漏斗：每次选股各交易日依次满足条件1-4后剩余的记录数，以及各条件的计算耗时
+    st.markdown("### 条件漏斗")
+    df_runs = pd.DataFrame()
+    try:
+        with engine.connect() as conn:
+            df_runs = pd.read_sql(
+                "SELECT DISTINCT run_time FROM stock_select_metrics ORDER BY run_time DESC LIMIT 20", conn
+            )
+    except Exception:
+        pass
+
+    if df_runs.empty:
+        st.info("暂无漏斗统计")
+    else:
+        run_options = df_runs['run_time'].astype(str).tolist()
+        selected_run = st.selectbox("选择选股执行时间", options=run_options, index=0, key="funnel_run")
+        with engine.connect() as conn:
+            df_funnel = pd.read_sql(
+                text("SELECT * FROM stock_select_metrics WHERE run_time = :run_time ORDER BY trade_date"),
+                conn, params={"run_time": selected_run}
+            )
+        summary_rows = df_funnel[df_funnel['trade_date'].isna()]
+        daily_rows = df_funnel[df_funnel['trade_date'].notna()]
+
+        if not summary_rows.empty:
+            summary = summary_rows.iloc[0]
+            stage_labels = ["候选", "条件1", "条件2", "条件3", "条件4"]
+            stage_values = [summary['candidates'], summary['cond1'], summary['cond2'], summary['cond3'], summary['cond4']]
+            metric_cols = st.columns(len(stage_labels))
+            for col, label, value in zip(metric_cols, stage_labels, stage_values):
+                col.metric(label, f"{int(value):,}")
+            timing_cols = ['ref_ms', 'cond1_ms', 'cond2_ms', 'cond3_ms', 'cond4_ms']
+            st.caption("耗时(ms)：" + "，".join(
+                f"{label} {summary[col]:.1f}" for label, col in zip(["REF"] + stage_labels[1:], timing_cols)
+                if pd.notna(summary[col])
+            ))
+
+        if not daily_rows.empty:
+            df_daily = daily_rows[['trade_date', 'candidates', 'cond1', 'cond2', 'cond3', 'cond4']].rename(columns={
+                'trade_date': '交易日期', 'candidates': '候选', 'cond1': '条件1',
+                'cond2': '条件2', 'cond3': '条件3', 'cond4': '条件4(入选)'
+            })
+            st.dataframe(df_daily, use_container_width=True, hide_index=True)
+
 # --- Tab 3: 日K线抽取 ---
 with tab3:
     st.markdown('<span style="color: #C0C0C0;">拉取 Tushare 日线数据并存入数据库。</span>', unsafe_allow_html=True)
@@ -5,6 +5,134 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+# stock_selected 的联合主键（同一股票同一天可被多个策略分别选中）
+STOCK_SELECTED_KEY = ['execute_date', 'execute_time', 'ts_code', 'trade_date', 'strategy_id']
+
+
+def stock_selected_ddl(table_name):
+    """stock_selected 的建表语句（迁移主键时用同一结构创建新表）"""
+    return f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                execute_date DATE NOT NULL COMMENT '选股执行日期',
+                execute_time TIME NOT NULL COMMENT '选股执行时间',
+                ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+                trade_date DATE NOT NULL COMMENT '交易日期',
+                stock_name VARCHAR(50) COMMENT '股票名称',
+                price_open DECIMAL(20, 4),
+                price_high DECIMAL(20, 4),
+                price_low DECIMAL(20, 4),
+                price_close DECIMAL(20, 4),
+                price_pre_close DECIMAL(20, 4),
+                amt_chg DECIMAL(20, 4),
+                pct_chg DECIMAL(20, 4),
+                vol DECIMAL(20, 4),
+                amount DECIMAL(20, 4),
+                buy_date DATE COMMENT '建议买入日期',
+                gold_date DATE COMMENT 'AI观察日',
+                data_version VARCHAR(32) COMMENT '数据版本（回看窗口内日线数据指纹）',
+                strategy_id VARCHAR(50) NOT NULL DEFAULT 'tdx_shrink_pullback' COMMENT '选股策略标识',
+                PRIMARY KEY ({', '.join(STOCK_SELECTED_KEY)})
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+
+# stock_select_runs 的建表语句（选股流程中的 ensure_select_runs_table 共用）
+STOCK_SELECT_RUNS_DDL = """
+            CREATE TABLE IF NOT EXISTS stock_select_runs (
+                start_date DATE NOT NULL COMMENT '选股区间起始日期',
+                end_date DATE NOT NULL COMMENT '选股区间结束日期',
+                params_hash CHAR(32) NOT NULL COMMENT '选股参数MD5',
+                data_version CHAR(32) NOT NULL COMMENT '区间数据版本（各交易日回看窗口指纹的MD5）',
+                params VARCHAR(1024) COMMENT '选股参数（JSON）',
+                content_hash CHAR(32) COMMENT '结果集内容MD5',
+                row_count INT COMMENT '结果集记录数',
+                execute_date DATE COMMENT '结果集在stock_selected中的执行日期',
+                execute_time TIME COMMENT '结果集在stock_selected中的执行时间',
+                first_run_time DATETIME COMMENT '首次运行时间',
+                last_run_time DATETIME COMMENT '最近运行时间',
+                run_count INT DEFAULT 1 COMMENT '运行次数',
+                PRIMARY KEY (start_date, end_date, params_hash, data_version),
+                KEY idx_content_hash (content_hash)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+
+# stock_select_metrics 的建表语句（选股流程中的 ensure_select_metrics_table 共用）
+STOCK_SELECT_METRICS_DDL = """
+            CREATE TABLE IF NOT EXISTS stock_select_metrics (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                run_time DATETIME NOT NULL COMMENT '选股执行时间',
+                strategy_id VARCHAR(50) COMMENT '选股策略标识',
+                trade_date DATE COMMENT '交易日期（为空表示整个区间的汇总行）',
+                candidates INT COMMENT '参与评估的记录数',
+                cond1 INT COMMENT '满足条件1后剩余记录数',
+                cond2 INT COMMENT '依次满足条件1-2后剩余记录数',
+                cond3 INT COMMENT '依次满足条件1-3后剩余记录数',
+                cond4 INT COMMENT '依次满足条件1-4后剩余记录数（入选数）',
+                ref_ms DOUBLE COMMENT '计算REF滞后值耗时（毫秒，仅汇总行）',
+                cond1_ms DOUBLE COMMENT '条件1耗时（毫秒，仅汇总行）',
+                cond2_ms DOUBLE COMMENT '条件2耗时（毫秒，仅汇总行）',
+                cond3_ms DOUBLE COMMENT '条件3耗时（毫秒，仅汇总行）',
+                cond4_ms DOUBLE COMMENT '条件4耗时（毫秒，仅汇总行）',
+                INDEX idx_run_time (run_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+
+def get_primary_key_columns(conn, table_name):
+    """从 information_schema 读取表的实际主键字段（按主键内顺序）"""
+    rows = conn.execute(text("""
+    SELECT column_name FROM information_schema.key_column_usage
+    WHERE table_schema = DATABASE() AND table_name = :table_name AND constraint_name = 'PRIMARY'
+    ORDER BY ordinal_position
+    """), {"table_name": table_name}).fetchall()
+    return [row[0].lower() for row in rows]
+
+
+def migrate_stock_selected_primary_key(conn):
+    """
+    旧版 stock_selected 的主键不含 strategy_id 时迁移到新主键
+
+    TiDB 的聚簇索引表不支持 DROP PRIMARY KEY，且就地改主键不是原子操作，因此：
+    1. 按新结构创建 stock_selected_new（旧表缺少的字段取默认值，旧记录归属 tdx_shrink_pullback）
+    2. INSERT ... SELECT 复制全部记录并核对条数
+    3. 一条 RENAME TABLE 同时把旧表改名为 stock_selected_old、新表改名为 stock_selected
+    迁移期间请勿运行选股任务；确认无误后可手动删除 stock_selected_old
+    """
+    key_columns = get_primary_key_columns(conn, 'stock_selected')
+    if key_columns == STOCK_SELECTED_KEY:
+        return
+    print(f"正在迁移 stock_selected 主键（当前主键：{', '.join(key_columns) or '无'}）...")
+    exists_old = conn.execute(text("""
+    SELECT COUNT(*) FROM information_schema.tables
+    WHERE table_schema = DATABASE() AND table_name = 'stock_selected_old'
+    """)).scalar()
+    if exists_old:
+        raise RuntimeError("stock_selected_old 已存在，请确认上次迁移的备份表可删除后再执行")
+
+    conn.execute(text("DROP TABLE IF EXISTS stock_selected_new"))
+    conn.execute(text(stock_selected_ddl('stock_selected_new')))
+    new_columns = [row[0].lower() for row in conn.execute(text("""
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'stock_selected_new'
+    """)).fetchall()]
+    old_columns = {row[0].lower() for row in conn.execute(text("""
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'stock_selected'
+    """)).fetchall()}
+    columns = ', '.join(col for col in new_columns if col in old_columns)
+    conn.execute(text(f"INSERT INTO stock_selected_new ({columns}) SELECT {columns} FROM stock_selected"))
+    conn.commit()
+
+    old_count = conn.execute(text("SELECT COUNT(*) FROM stock_selected")).scalar()
+    new_count = conn.execute(text("SELECT COUNT(*) FROM stock_selected_new")).scalar()
+    if old_count != new_count:
+        raise RuntimeError(f"stock_selected 复制条数不一致（原表 {old_count}，新表 {new_count}），已保留原表")
+    conn.execute(text("RENAME TABLE stock_selected TO stock_selected_old, stock_selected_new TO stock_selected"))
+    conn.commit()
+    print(f"✅ stock_selected 已迁移 {new_count} 条记录，原表保留为 stock_selected_old")
+
+
 def init_db():
     print("🚀 开始初始化 TiDB 数据库表结构...")
     
@@ -58,26 +186,49 @@ def init_db():
 
             # 3. 创建 stock_selected 表
             print("正在创建 stock_selected 表...")
+            conn.execute(text(stock_selected_ddl('stock_selected')))
+
+            # 3.1 旧版 stock_selected 的主键不含 strategy_id 时，重建表并复制数据
+            migrate_stock_selected_primary_key(conn)
+
+            # 4. 创建 stock_select_runs 表（选股运行记录，指向stock_selected中的结果集）
+            print("正在创建 stock_select_runs 表...")
+            conn.execute(text(STOCK_SELECT_RUNS_DDL))
+
+            # 5. 创建 stock_select_metrics 表（选股条件漏斗统计）
+            print("正在创建 stock_select_metrics 表...")
+            conn.execute(text(STOCK_SELECT_METRICS_DDL))
+
+            # 6. 创建 cn_stock_weekly / cn_stock_monthly 表（由日线聚合，见utils/period_bars.py）
+            for table, name in (('cn_stock_weekly', '周线'), ('cn_stock_monthly', '月线')):
+                print(f"正在创建 {table} 表...")
+                conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+                    trade_date DATE NOT NULL COMMENT '周期内最后一个交易日',
+                    price_open DECIMAL(20, 4) COMMENT '开盘价',
+                    price_high DECIMAL(20, 4) COMMENT '最高价',
+                    price_low DECIMAL(20, 4) COMMENT '最低价',
+                    price_close DECIMAL(20, 4) COMMENT '收盘价',
+                    price_pre_close DECIMAL(20, 4) COMMENT '昨收价',
+                    amt_chg DECIMAL(20, 4) COMMENT '涨跌额',
+                    pct_chg DECIMAL(20, 4) COMMENT '涨跌幅',
+                    vol DECIMAL(20, 4) COMMENT '成交量',
+                    amount DECIMAL(20, 4) COMMENT '成交额',
+                    PRIMARY KEY (ts_code, trade_date)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT '{name}';
+                """))
+
+            # 7. 创建 cn_stock_daily_fingerprint 表（日线按交易日的内容指纹，见utils/tushare_update_daily.py）
+            print("正在创建 cn_stock_daily_fingerprint 表...")
             conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS stock_selected (
-                execute_date DATE NOT NULL COMMENT '选股执行日期',
-                execute_time TIME NOT NULL COMMENT '选股执行时间',
-                ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+            CREATE TABLE IF NOT EXISTS cn_stock_daily_fingerprint (
                 trade_date DATE NOT NULL COMMENT '交易日期',
-                stock_name VARCHAR(50) COMMENT '股票名称',
-                price_open DECIMAL(20, 4),
-                price_high DECIMAL(20, 4),
-                price_low DECIMAL(20, 4),
-                price_close DECIMAL(20, 4),
-                price_pre_close DECIMAL(20, 4),
-                amt_chg DECIMAL(20, 4),
-                pct_chg DECIMAL(20, 4),
-                vol DECIMAL(20, 4),
-                amount DECIMAL(20, 4),
-                buy_date DATE COMMENT '建议买入日期',
-                gold_date DATE COMMENT 'AI观察日',
-                PRIMARY KEY (execute_date, execute_time, ts_code, trade_date)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                row_count INT NOT NULL COMMENT '当日条目数',
+                content_hash CHAR(32) NOT NULL COMMENT '按股票代码排序后内容的MD5',
+                updated_at DATETIME COMMENT '指纹更新时间',
+                PRIMARY KEY (trade_date)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT '日线内容指纹';
             """))
 
             conn.commit()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共夹具：合成日线数据写入临时SQLite库，选股模块改为读取该库
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'utils'))
+
+# 选股模块导入时会按配置创建数据库引擎（不会实际连接），测试时补齐占位配置
+for _key, _value in {'DB_HOST': 'localhost', 'DB_USER': 'test',
+                     'DB_PASSWORD': 'test', 'DB_NAME': 'test'}.items():
+    os.environ.setdefault(_key, _value)
+os.environ['USE_DAILY_CACHE'] = '0'
+
+import select_benchmark  # noqa: E402
+import tushare_select_stock  # noqa: E402
+
+# 停牌与涨停比例高于基准测试默认值，保证评估区间内出现停牌后入选的记录
+SYNTHETIC_CONFIG = {'n_stocks': 120, 'years': 1, 'seed': 7, 'suspend_rate': 0.02, 'limit_up_rate': 0.04}
+
+
+@pytest.fixture(scope='session')
+def synthetic_engine(tmp_path_factory):
+    """写入合成日线数据的SQLite引擎（整个测试会话共用）"""
+    db_path = tmp_path_factory.mktemp('daily') / 'synthetic.db'
+    engine = create_engine(f"sqlite:///{db_path}")
+    select_benchmark.build_benchmark_db(engine, SYNTHETIC_CONFIG)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def select_module(synthetic_engine, monkeypatch):
+    """读取合成数据库的选股模块"""
+    monkeypatch.setattr(tushare_select_stock, 'engine', synthetic_engine)
+    return tushare_select_stock
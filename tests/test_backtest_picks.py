@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+选股回测：不同策略选中的同一股票分别计算与汇总
+"""
+
+import numpy as np
+import pandas as pd
+
+import backtest_picks
+
+
+def _bars(n_days=25):
+    days = pd.bdate_range('2024-01-02', periods=n_days)
+    closes = 10 + np.arange(n_days, dtype=float)
+    return pd.DataFrame({'ts_code': '000001.SZ', 'trade_date': days,
+                         'price_open': closes, 'price_close': closes})
+
+
+def test_same_pick_is_kept_per_strategy():
+    bars = _bars()
+    picks = pd.DataFrame({
+        'strategy_id': ['a', 'b', 'b'],
+        'ts_code': ['000001.SZ'] * 3,
+        'trade_date': [bars['trade_date'][0], bars['trade_date'][0], bars['trade_date'][1]],
+        'buy_date': [bars['trade_date'][1], bars['trade_date'][1], bars['trade_date'][2]],
+    })
+    per_pick = backtest_picks.compute_forward_returns(picks, bars)
+    assert list(per_pick['strategy_id']) == ['a', 'b', 'b']
+    assert per_pick['ret_1d'].iloc[0] == per_pick['ret_1d'].iloc[1]
+
+    summary = backtest_picks.summarize_backtest(per_pick)
+    assert len(summary) == 2 * len(backtest_picks.HORIZONS)
+    counts = summary[summary['horizon'] == 1].set_index('strategy_id')['pick_count']
+    assert counts.to_dict() == {'a': 1, 'b': 2}
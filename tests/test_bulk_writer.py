@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+bulk_upsert / staged_upsert的新增/更新/未变化行数统计与合并语句
+"""
+
+import ast
+import re
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+import bulk_writer
+
+# 目标表已有的行：id -> value
+EXISTING = {1: 'a', 2: 'b', 3: 'c'}
+# 1、2 未变化，3 有变化，4、5 新增
+FRAME = pd.DataFrame({'id': [1, 2, 3, 4, 5], 'value': ['a', 'b', 'x', 'd', 'e']})
+
+
+class _Result:
+    def __init__(self, message):
+        self.message = message
+
+
+class _MySQLCursor:
+    """按MySQL的语义执行 INSERT ... ON DUPLICATE KEY UPDATE，返回影响行数与服务端信息"""
+
+    def __init__(self, table, client_flag):
+        self.table = table
+        self.found_rows = bool(client_flag & bulk_writer.CLIENT_FOUND_ROWS)
+        self.rowcount = 0
+        self._result = None
+
+    def execute(self, sql):
+        values = re.search(r"VALUES (.*) ON DUPLICATE KEY UPDATE", sql).group(1)
+        rows = ast.literal_eval(f"[{values}]")
+        affected, duplicates = 0, 0
+        for key, value in rows:
+            if key not in self.table:
+                affected += 1
+            else:
+                duplicates += 1
+                if self.table[key] != value:
+                    affected += 2
+                elif self.found_rows:
+                    affected += 1
+            self.table[key] = value
+        self.rowcount = affected
+        # 单行INSERT没有服务端信息
+        message = f"Records: {len(rows)}  Duplicates: {duplicates}  Warnings: 0" if len(rows) > 1 else ''
+        self._result = _Result(message)
+
+    def close(self):
+        pass
+
+
+class _MySQLConnection:
+    def __init__(self, table, client_flag):
+        self.table = table
+        self.client_flag = client_flag
+
+    def literal(self, row):
+        return '(' + ','.join(repr(value) for value in row) + ')'
+
+    def cursor(self):
+        return _MySQLCursor(self.table, self.client_flag)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Dialect:
+    name = 'mysql'
+
+
+class _MySQLEngine:
+    dialect = _Dialect()
+
+    def __init__(self, client_flag):
+        self.table = dict(EXISTING)
+        self.client_flag = client_flag
+
+    def raw_connection(self):
+        return _MySQLConnection(self.table, self.client_flag)
+
+
+@pytest.mark.parametrize('client_flag', [0, bulk_writer.CLIENT_FOUND_ROWS])
+def test_counts_with_server_info(client_flag):
+    engine = _MySQLEngine(client_flag)
+    stats = bulk_writer.bulk_upsert(engine, 't', FRAME, ['id'], max_packet_bytes=1 << 20, verbose=False)
+    assert stats['statements'] == 1
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (2, 1, 2)
+    assert engine.table == dict(zip(FRAME['id'], FRAME['value']))
+
+
+def test_counts_without_server_info_found_rows():
+    """逐行写入（无服务端信息）时，设置CLIENT_FOUND_ROWS的连接上更新数仍准确"""
+    engine = _MySQLEngine(bulk_writer.CLIENT_FOUND_ROWS)
+    # 包大小只容得下一行，每行一条语句
+    fixed = len("INSERT INTO t (id, value) VALUES  ON DUPLICATE KEY UPDATE value = VALUES(value)")
+    stats = bulk_writer.bulk_upsert(engine, 't', FRAME, ['id'], max_packet_bytes=fixed + 12, verbose=False)
+    assert stats['statements'] == len(FRAME)
+    assert stats['updated'] == 1
+    assert stats['inserted'] + stats['unchanged'] == 4
+
+
+def test_split_affected_rows():
+    # 2 新增 + 1 更新 + 2 未变化
+    assert bulk_writer.split_affected_rows(5, 2 + 2 * 1 + 2, (5, 3), found_rows=True) == (2, 1, 2)
+    assert bulk_writer.split_affected_rows(5, 2 + 2 * 1, (5, 3), found_rows=False) == (2, 1, 2)
+    # 全部未变化
+    assert bulk_writer.split_affected_rows(3, 3, (3, 3), found_rows=True) == (0, 0, 3)
+    assert bulk_writer.split_affected_rows(3, 0, (3, 3), found_rows=False) == (0, 0, 3)
+
+
+class _RecordingCursor:
+    """记录staged_upsert执行的语句，统计查询返回(已存在数, 有变化数)"""
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return 3, 1
+
+    def close(self):
+        pass
+
+
+class _RecordingConnection(_MySQLConnection):
+    def __init__(self, statements):
+        super().__init__({}, 0)
+        self.statements = statements
+
+    def cursor(self):
+        return _RecordingCursor(self.statements)
+
+
+class _RecordingEngine:
+    dialect = _Dialect()
+
+    def __init__(self):
+        self.statements = []
+
+    def raw_connection(self):
+        return _RecordingConnection(self.statements)
+
+
+@pytest.mark.parametrize('changed_only', [False, True])
+def test_staged_merge_qualifies_update_columns(changed_only):
+    """合并语句关联目标表时，ON DUPLICATE KEY UPDATE的赋值以目标表名限定"""
+    engine = _RecordingEngine()
+    stats = bulk_writer.staged_upsert(engine, 't', FRAME, ['id'], max_packet_bytes=1 << 20, verbose=False,
+                                      changed_only=changed_only)
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (2, 1, 2)
+    merge_sql = next(sql for sql in engine.statements if sql.startswith('INSERT INTO t ('))
+    assert ('LEFT JOIN t t' in merge_sql) == changed_only
+    assert merge_sql.endswith('ON DUPLICATE KEY UPDATE t.value = VALUES(value)')
+
+
+def test_staged_merge_changed_only(tmp_path):
+    """changed_only只合并新增与有变化的行，统计与结果均与全量合并一致"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'staged.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)"))
+        conn.execute(text("INSERT INTO t VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+        # 未变化的行若被重写，触发器会留下记录
+        conn.execute(text("CREATE TABLE touched (id INTEGER)"))
+        conn.execute(text("CREATE TRIGGER t_update AFTER UPDATE ON t BEGIN INSERT INTO touched VALUES (new.id); END"))
+    stats = bulk_writer.staged_upsert(engine, 't', FRAME, ['id'], verbose=False, changed_only=True)
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (2, 1, 2)
+    with engine.connect() as conn:
+        assert dict(conn.execute(text("SELECT id, value FROM t")).fetchall()) == dict(zip(FRAME['id'], FRAME['value']))
+        assert [row[0] for row in conn.execute(text("SELECT id FROM touched"))] == [3]
+    engine.dispose()
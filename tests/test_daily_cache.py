@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+本地日线缓存：缓存未覆盖的区间从数据库补齐
+"""
+
+import pandas as pd
+import pytest
+
+import daily_cache
+from daily_reader import read_daily_typed, read_trade_days
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('CN_STOCK_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _normalize(df):
+    df = df.astype({'ts_code': str}).sort_values(['ts_code', 'trade_date'], kind='mergesort')
+    return df.reset_index(drop=True)
+
+
+def test_head_before_first_sync_is_read_from_db(synthetic_engine, cache_dir):
+    trade_days = read_trade_days(synthetic_engine, '19900101', '20991231')
+    first, middle, last = trade_days[0], trade_days[len(trade_days) // 2], trade_days[-1]
+    daily_cache.sync_daily_cache(synthetic_engine, start_date=middle.strftime('%Y%m%d'),
+                                 end_date=last.strftime('%Y%m%d'))
+    assert daily_cache.load_manifest()['synced_from'] == middle.strftime('%Y%m%d')
+
+    start_date, end_date = first.strftime('%Y%m%d'), last.strftime('%Y%m%d')
+    loaded = daily_cache.load_daily_with_cache(synthetic_engine, start_date, end_date)
+    expected = read_daily_typed(synthetic_engine, start_date, end_date, verbose=False)
+    assert loaded['trade_date'].min() == first
+    pd.testing.assert_frame_equal(_normalize(loaded), _normalize(expected), check_dtype=False)
+
+
+def test_invalidated_range_falls_back_to_db(synthetic_engine, cache_dir):
+    trade_days = read_trade_days(synthetic_engine, '19900101', '20991231')
+    start_date, end_date = trade_days[0].strftime('%Y%m%d'), trade_days[-1].strftime('%Y%m%d')
+    daily_cache.sync_daily_cache(synthetic_engine, start_date=start_date, end_date=end_date)
+    daily_cache.invalidate_daily_cache(trade_days[10].strftime('%Y%m%d'), trade_days[20].strftime('%Y%m%d'))
+
+    loaded = daily_cache.load_daily_with_cache(synthetic_engine, start_date, end_date)
+    expected = read_daily_typed(synthetic_engine, start_date, end_date, verbose=False)
+    pd.testing.assert_frame_equal(_normalize(loaded), _normalize(expected), check_dtype=False)
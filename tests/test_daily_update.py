@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+日线写入：按交易日内容指纹跳过未变化的日期，只合并有变化的行
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+pytest.importorskip('tushare')
+import tushare_update_daily  # noqa: E402
+
+TRADE_DATE = '20240105'
+
+
+def _api_frame(n_rows=20):
+    """与Tushare daily接口字段相同的单日数据"""
+    rng = np.random.default_rng(11)
+    close = rng.uniform(5, 50, n_rows).round(2)
+    return pd.DataFrame({
+        'ts_code': [f"{600000 + i:06d}.SH" for i in range(n_rows)],
+        'trade_date': TRADE_DATE,
+        'open': close, 'high': close + 0.5, 'low': close - 0.5, 'close': close,
+        'pre_close': close - 0.1, 'change': 0.1, 'pct_chg': 1.0,
+        'vol': rng.uniform(1e4, 1e6, n_rows).round(2), 'amount': rng.uniform(1e5, 1e7, n_rows).round(2),
+    })
+
+
+@pytest.fixture
+def daily_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'daily.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE cn_stock_daily (
+            ts_code VARCHAR(20) NOT NULL, trade_date VARCHAR(8) NOT NULL,
+            price_open DOUBLE, price_high DOUBLE, price_low DOUBLE, price_close DOUBLE,
+            price_pre_close DOUBLE, amt_chg DOUBLE, pct_chg DOUBLE, vol DOUBLE, amount DOUBLE,
+            PRIMARY KEY (ts_code, trade_date)
+        )
+        """))
+        conn.execute(text(f"""
+        CREATE TABLE {tushare_update_daily.FINGERPRINT_TABLE} (
+            trade_date VARCHAR(8) NOT NULL PRIMARY KEY, row_count INT NOT NULL,
+            content_hash CHAR(32) NOT NULL, updated_at DATETIME
+        )
+        """))
+    yield engine
+    engine.dispose()
+
+
+def _write(engine, frame, skip_unchanged=True):
+    return tushare_update_daily.write_to_mysql_with_update(frame.copy(), skip_unchanged=skip_unchanged, engine=engine)
+
+
+def test_identical_day_is_skipped(daily_engine):
+    frame = _api_frame()
+    assert _write(daily_engine, frame) == (20, 0, 0)
+    assert _write(daily_engine, frame) == (20, 0, 20)
+    # 关闭指纹对比时整日合并，已存在的条目全部计为更新
+    assert _write(daily_engine, frame, skip_unchanged=False) == (20, 20, 0)
+
+
+def test_deleted_rows_are_restored(daily_engine):
+    """指纹未变但表中当日行数不足时不跳过，只补回被删除的行"""
+    frame = _api_frame()
+    _write(daily_engine, frame)
+    with daily_engine.begin() as conn:
+        conn.execute(text("DELETE FROM cn_stock_daily WHERE ts_code IN ('600000.SH', '600001.SH', '600002.SH')"))
+    assert _write(daily_engine, frame) == (20, 0, 17)
+    assert tushare_update_daily.count_daily_rows(daily_engine, TRADE_DATE) == 20
+
+
+def test_changed_rows_only(daily_engine):
+    frame = _api_frame()
+    _write(daily_engine, frame)
+    frame.loc[4, 'close'] += 1
+    assert _write(daily_engine, frame) == (20, 1, 19)
+    with daily_engine.connect() as conn:
+        close = conn.execute(text("SELECT price_close FROM cn_stock_daily WHERE ts_code = '600004.SH'")).scalar()
+    assert close == pytest.approx(frame.loc[4, 'close'])
+
+
+def test_fingerprint_ignores_order_and_sub_precision_noise():
+    frame = _api_frame().rename(columns=tushare_update_daily.DAILY_COLUMN_MAP)
+    fingerprint = tushare_update_daily.compute_day_fingerprint(frame)
+    shuffled = frame.sample(frac=1, random_state=0)
+    shuffled['price_close'] += 1e-7
+    assert tushare_update_daily.compute_day_fingerprint(shuffled) == fingerprint
+    shuffled.loc[shuffled.index[0], 'vol'] += 1
+    assert tushare_update_daily.compute_day_fingerprint(shuffled) != fingerprint
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+面板增量追加：复查窗口内事后补录的整日数据
+"""
+
+import shutil
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+import panel_store
+from daily_reader import read_trade_days
+
+
+@pytest.fixture
+def daily_engine(synthetic_engine, tmp_path):
+    """合成库的副本（测试中会删除与补录数据）"""
+    db_path = tmp_path / 'daily.db'
+    shutil.copy(synthetic_engine.url.database, db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    yield engine
+    engine.dispose()
+
+
+def _field_by_code(panel, name):
+    return dict(zip(panel['codes'], np.asarray(panel['fields'][name])))
+
+
+def test_backfilled_day_inside_panel_is_added(daily_engine, tmp_path):
+    trade_days = read_trade_days(daily_engine, '19900101', '20991231')
+    start_date, end_date = trade_days[0].strftime('%Y%m%d'), trade_days[-1].strftime('%Y%m%d')
+    gap = trade_days[-5].strftime('%Y%m%d')
+
+    with daily_engine.begin() as conn:
+        rows = conn.execute(text("SELECT * FROM cn_stock_daily WHERE trade_date = :d"), {'d': gap}).mappings().all()
+        conn.execute(text("DELETE FROM cn_stock_daily WHERE trade_date = :d"), {'d': gap})
+    panel_dir = tmp_path / 'panel'
+    panel_dir.mkdir()
+    panel_store.build_panel(daily_engine, start_date, end_date, panel_dir=str(panel_dir), capacity=256)
+    assert len(panel_store.open_panel(str(panel_dir))['dates']) == len(trade_days) - 1
+
+    # 补录缺失的交易日后追加
+    with daily_engine.begin() as conn:
+        columns = list(rows[0].keys())
+        conn.execute(text(f"INSERT INTO cn_stock_daily ({', '.join(columns)}) "
+                          f"VALUES ({', '.join(':' + col for col in columns)})"), [dict(row) for row in rows])
+    panel_store.append_panel(daily_engine, end_date, panel_dir=str(panel_dir))
+    appended = panel_store.open_panel(str(panel_dir))
+
+    rebuilt_dir = tmp_path / 'rebuilt'
+    rebuilt_dir.mkdir()
+    panel_store.build_panel(daily_engine, start_date, end_date, panel_dir=str(rebuilt_dir), capacity=256)
+    rebuilt = panel_store.open_panel(str(rebuilt_dir))
+
+    assert appended['dates'].equals(rebuilt['dates'])
+    for name in panel_store.PANEL_FIELDS:
+        expected = _field_by_code(rebuilt, name)
+        for code, values in _field_by_code(appended, name).items():
+            np.testing.assert_array_equal(values, expected[code])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+周线/月线：周期划分、日线聚合与增量刷新
+"""
+
+import shutil
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+import period_bars
+from daily_reader import BAR_TABLES, read_daily_typed, read_trade_days
+
+
+@pytest.mark.parametrize('start_date, end_date, freq, expected', [
+    ('20241231', '20241231', 'W', ('20241230', '20250105')),
+    ('20240106', '20240108', 'W', ('20240101', '20240114')),
+    ('20240215', '20240215', 'M', ('20240201', '20240229')),
+    ('20231215', '20240110', 'M', ('20231201', '20240131')),
+])
+def test_period_bounds(start_date, end_date, freq, expected):
+    assert period_bars.period_bounds(start_date, end_date, freq) == expected
+
+
+def test_aggregate_bars():
+    # 000001.SZ 同一周三个交易日（周一停牌）；000002.SZ 跨两周
+    daily = pd.DataFrame({
+        'ts_code': ['000001.SZ'] * 3 + ['000002.SZ'] * 2,
+        'trade_date': pd.to_datetime(['20240103', '20240104', '20240105', '20240105', '20240108']),
+        'price_open': [10.0, 11.0, 12.0, 20.0, 21.0],
+        'price_high': [11.0, 13.0, 12.5, 20.5, 22.0],
+        'price_low': [9.5, 10.5, 11.5, 19.5, 20.5],
+        'price_close': [10.5, 12.0, 12.2, 20.2, 21.5],
+        'price_pre_close': [10.0, 10.5, 12.0, 20.0, 20.2],
+        'amt_chg': 0.0, 'pct_chg': 0.0,
+        'vol': [100.0, 200.0, 300.0, 50.0, 60.0],
+        'amount': [1000.0, 2000.0, 3000.0, 500.0, 600.0],
+    })
+    bars = period_bars.aggregate_bars(daily, 'W')
+    assert list(zip(bars['ts_code'], bars['trade_date'].dt.strftime('%Y%m%d'))) == [
+        ('000001.SZ', '20240105'), ('000002.SZ', '20240105'), ('000002.SZ', '20240108')]
+    first = bars.iloc[0]
+    assert (first['price_open'], first['price_high'], first['price_low'], first['price_close']) == (10, 13, 9.5, 12.2)
+    assert (first['price_pre_close'], first['vol'], first['amount']) == (10, 600, 6000)
+    assert first['amt_chg'] == pytest.approx(2.2)
+    assert first['pct_chg'] == pytest.approx(22.0)
+    assert period_bars.aggregate_bars(daily.iloc[0:0], 'M').empty
+
+
+@pytest.fixture
+def daily_engine(synthetic_engine, tmp_path):
+    """合成库的副本（SQLite），另建周线表"""
+    db_path = tmp_path / 'daily.db'
+    shutil.copy(synthetic_engine.url.database, db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE {BAR_TABLES['W']} AS SELECT * FROM cn_stock_daily WHERE 0"))
+        conn.execute(text(f"CREATE UNIQUE INDEX weekly_key ON {BAR_TABLES['W']} (ts_code, trade_date)"))
+    yield engine
+    engine.dispose()
+
+
+def _assert_matches_daily(engine):
+    days = read_trade_days(engine, '19900101', '20991231')
+    start_date, end_date = days[0].strftime('%Y%m%d'), days[-1].strftime('%Y%m%d')
+    expected = period_bars.aggregate_bars(read_daily_typed(engine, start_date, end_date, verbose=False), 'W')
+    stored = read_daily_typed(engine, '19900101', '20991231', verbose=False, freq='W')
+    stored['ts_code'] = stored['ts_code'].astype(str)
+    pd.testing.assert_frame_equal(stored.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, atol=1e-6)
+
+
+def test_refresh_builds_and_updates_current_period(daily_engine):
+    # 表为空时忽略起始日期，从日线最早日期开始全量构建
+    period_bars.refresh_period_bars(daily_engine, 'W', start_date='20991231', end_date='20991231')
+    _assert_matches_daily(daily_engine)
+
+    # 修正某个交易日的收盘价后，只刷新该日所在的周期
+    day = read_trade_days(daily_engine, '19900101', '20991231')[40].strftime('%Y%m%d')
+    with daily_engine.begin() as conn:
+        conn.execute(text("UPDATE cn_stock_daily SET price_close = price_close * 1.05, vol = vol + 1 "
+                          "WHERE trade_date = :day"), {'day': day})
+    summary = period_bars.refresh_period_bars(daily_engine, 'W', start_date=day, end_date=day)
+    assert summary['periods_from'] <= day <= summary['periods_to']
+    _assert_matches_daily(daily_engine)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+增量选股与全量选股的一致性
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HISTORY_START = '20240101'
+END_DATE = '20241231'
+EVAL_START = '20240701'
+
+
+def _pick_keys(df):
+    if df.empty:
+        return set()
+    return set(zip(df['ts_code'].astype(str), pd.to_datetime(df['trade_date'])))
+
+
+def _picks_after_suspension(select_module, full, trade_days, lookback):
+    """入选记录中，回看窗口内（按全市场交易日）存在停牌的记录数"""
+    daily = select_module.load_stock_data(HISTORY_START, END_DATE)
+    bars = set(zip(daily['ts_code'].astype(str), daily['trade_date']))
+    count = 0
+    for code, day in _pick_keys(full):
+        idx = trade_days.searchsorted(day)
+        window = trade_days[idx - lookback:idx + 1]
+        count += any((code, d) not in bars for d in window)
+    return count
+
+
+@pytest.mark.parametrize('prefilter', [False, True])
+@pytest.mark.parametrize('d1', [0, 1])
+def test_incremental_matches_full(select_module, d1, prefilter):
+    trade_days = select_module.get_trade_days(HISTORY_START, END_DATE)
+    fingerprints = select_module.get_day_fingerprints(HISTORY_START, END_DATE)
+    daily = select_module.load_stock_data(HISTORY_START, END_DATE)
+    # 只评估全量模式有入选记录的交易日：与日常增量运行一样，各评估日的回看区间短且互不相连
+    candidates = trade_days[trade_days >= pd.Timestamp(EVAL_START)]
+    pick_days = select_module.select_stocks(daily, d1=d1, eval_dates=candidates)['trade_date'].unique()
+    pending = sorted(pd.to_datetime(pick_days))
+
+    incremental = select_module.evaluate_pending_days(trade_days, pending, fingerprints, d1=d1,
+                                                      prefilter=prefilter)
+    full = select_module.select_stocks(daily, d1=d1, eval_dates=pending)
+
+    assert not full.empty
+    assert _pick_keys(incremental) == _pick_keys(full)
+    # 合成数据中必须有回看窗口内停牌的入选记录，否则本用例无法覆盖停牌补齐
+    assert _picks_after_suspension(select_module, full, trade_days, select_module.get_lookback_days(d1)) > 0
+
+    columns = ['ts_code', 'trade_date', 'price_close', 'price_low', 'vol', 'buy_date', 'gold_date']
+    left = incremental[columns].astype({'ts_code': str}).sort_values(['ts_code', 'trade_date'])
+    right = full[columns].astype({'ts_code': str}).sort_values(['ts_code', 'trade_date'])
+    pd.testing.assert_frame_equal(left.reset_index(drop=True), right.reset_index(drop=True))
+
+
+def test_prefilter_funnel_counts_universe_rows(select_module):
+    """预筛选模式的候选数与非预筛选模式一致：只统计股票池内的记录"""
+    def universe(ts_codes, trade_dates):
+        return np.array(ts_codes.astype(str).str[5] < '5')
+
+    trade_days = select_module.get_trade_days(HISTORY_START, END_DATE)
+    fingerprints = select_module.get_day_fingerprints(HISTORY_START, END_DATE)
+    pending = list(trade_days[trade_days >= pd.Timestamp(EVAL_START)][::20])
+    funnels = {}
+    for prefilter in (False, True):
+        metrics = {}
+        select_module.evaluate_pending_days(trade_days, pending, fingerprints, prefilter=prefilter, metrics=metrics,
+                                            universe=universe)
+        funnel = pd.concat(metrics['funnels'], ignore_index=True)
+        funnel['trade_date'] = funnel['trade_date'].astype('datetime64[ns]')
+        funnels[prefilter] = funnel.groupby('trade_date')['candidates'].sum()
+    assert funnels[True].sum() < sum(int(fingerprints[day].split('|')[0]) for day in pending)
+    pd.testing.assert_series_equal(funnels[True], funnels[False], check_dtype=False)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+公式窗口函数与pandas分组滚动计算的一致性
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import tdx_formula
+from tushare_select_stock import group_positions
+
+
+@pytest.fixture
+def grouped():
+    rng = np.random.default_rng(3)
+    sizes = rng.integers(1, 40, size=60)
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+    values = rng.normal(10, 3, size=len(codes)).round(2)
+    return codes, values, group_positions(codes)
+
+
+@pytest.mark.parametrize('n', [1, 3, 7, 20])
+@pytest.mark.parametrize('block', [8, 64, tdx_formula.WINDOW_SUM_BLOCK])
+def test_window_sum_matches_rolling(grouped, monkeypatch, n, block):
+    codes, values, positions = grouped
+    monkeypatch.setattr(tdx_formula, 'WINDOW_SUM_BLOCK', block)
+    total, count = tdx_formula._window_sum(values, n, positions)
+    rolling = pd.Series(values).groupby(codes).rolling(n, min_periods=1)
+    np.testing.assert_allclose(total, rolling.sum().to_numpy(), rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(count, rolling.count().to_numpy())
+
+
+@pytest.mark.parametrize('n', [1, 3, 7])
+def test_window_extreme_matches_rolling(grouped, n):
+    codes, values, positions = grouped
+    rolling = pd.Series(values).groupby(codes).rolling(n)
+    np.testing.assert_array_equal(tdx_formula._window_extreme(values, n, positions, np.maximum),
+                                  rolling.max().to_numpy())
+    np.testing.assert_array_equal(tdx_formula._window_extreme(values, n, positions, np.minimum),
+                                  rolling.min().to_numpy())
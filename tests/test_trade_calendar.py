@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+交易所交易日历：trade_cal按年缓存，无法获取时以chinese_calendar剔除周末近似
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import trade_calendar
+
+# 2024年国庆：10月1-7日休市，9月29日（周日）、10月12日（周六）调休上班但交易所不开市
+NATIONAL_DAY_2024 = ['20240927', '20240930', '20241008', '20241009', '20241010', '20241011', '20241014']
+
+
+class _FakePro:
+    """按给定开市日返回trade_cal结果，记录调用的年份"""
+
+    def __init__(self, open_days=None, error=None):
+        self.open_days = open_days
+        self.error = error
+        self.years = []
+
+    def trade_cal(self, exchange, start_date, end_date, is_open, fields):
+        self.years.append(int(start_date[:4]))
+        if self.error is not None:
+            raise self.error
+        days = [day for day in (self.open_days or []) if start_date <= day <= end_date]
+        return pd.DataFrame({'cal_date': days})
+
+
+@pytest.fixture(autouse=True)
+def calendar_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('CN_STOCK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(trade_calendar, '_exchange_cache', {})
+    return tmp_path
+
+
+def _days(values):
+    return [pd.Timestamp(day).strftime('%Y%m%d') for day in values]
+
+
+def test_weekday_fallback_skips_makeup_weekends():
+    assert _days(trade_calendar.get_exchange_trade_days('20240927', '20241014')) == NATIONAL_DAY_2024
+
+
+def test_trade_cal_is_cached_per_year(calendar_cache):
+    pro = _FakePro(['20240102', '20240103', '20241231'])
+    days = trade_calendar.get_exchange_trade_days('20240101', '20240131', pro=pro)
+    assert _days(days) == ['20240102', '20240103']
+    assert (calendar_cache / 'calendar' / 'exchange_days_2024.npy').exists()
+
+    # 新进程：只读磁盘缓存，不再调用接口
+    trade_calendar._exchange_cache.clear()
+    assert _days(trade_calendar.get_exchange_trade_days('20241201', '20241231', pro=pro)) == ['20241231']
+    assert pro.years == [2024]
+
+    trade_calendar.get_exchange_trade_days('20240101', '20240131', pro=pro, refresh=True)
+    assert pro.years == [2024, 2024]
+
+
+@pytest.mark.parametrize('pro', [_FakePro([]), _FakePro(error=RuntimeError('rate limited'))])
+def test_unpublished_or_failed_year_is_not_cached(calendar_cache, pro):
+    days = trade_calendar.get_exchange_trade_days('20240927', '20241014', pro=pro)
+    assert _days(days) == NATIONAL_DAY_2024
+    assert not (calendar_cache / 'calendar' / 'exchange_days_2024.npy').exists()
+
+
+def test_unsupported_year_is_skipped():
+    days = trade_calendar.get_exchange_trade_days('20990101', '20990110')
+    assert len(days) == 0 and days.dtype == np.dtype('datetime64[D]')
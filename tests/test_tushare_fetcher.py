@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Tushare并发拉取：令牌桶限流、有序并发拉取与拉取/写入流水线
+"""
+
+import threading
+import time
+
+import pytest
+
+import tushare_fetcher
+
+
+class _FakeClock:
+    """替换tushare_fetcher中的time：sleep只推进时钟，不实际等待"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _FakeClock()
+    monkeypatch.setattr(tushare_fetcher, 'time', fake)
+    return fake
+
+
+def test_token_bucket_paces_after_burst(clock):
+    bucket = tushare_fetcher.TokenBucket(rate_per_minute=60, capacity=2)
+    granted = []
+    for _ in range(5):
+        bucket.acquire()
+        granted.append(round(clock.now, 6))
+    # 桶内2个令牌立即发放，之后每秒1个
+    assert granted == [0.0, 0.0, 1.0, 2.0, 3.0]
+
+
+def test_token_bucket_throttle_and_recover(clock):
+    bucket = tushare_fetcher.TokenBucket(rate_per_minute=120, recover_ratio=0.25)
+    assert bucket.throttle() == pytest.approx(60)
+    assert bucket.tokens == 0
+    for _ in range(10):
+        bucket.throttle()
+    # 不低于默认下限（配额的1/10）
+    assert bucket.rate_per_minute == pytest.approx(12)
+    assert bucket.throttle_count == 11
+    for _ in range(3):
+        bucket.recover()
+    assert bucket.rate_per_minute == pytest.approx(12 + 3 * 30)
+    bucket.recover()
+    assert bucket.rate_per_minute == pytest.approx(120)
+
+
+def test_is_rate_limit_error():
+    assert tushare_fetcher.is_rate_limit_error(Exception('抱歉，您每分钟最多访问该接口500次'))
+    assert tushare_fetcher.is_rate_limit_error(Exception('Too Many Requests'))
+    assert not tushare_fetcher.is_rate_limit_error(Exception('connection reset'))
+
+
+def test_fetch_in_order_delivers_in_input_order_with_bounded_in_flight():
+    started, delivered = [], []
+    lock = threading.Lock()
+
+    def fetch(item):
+        with lock:
+            started.append(item)
+        # 越靠前的任务越慢，完成顺序与输入顺序相反
+        time.sleep(0.002 * (20 - item))
+        return item * 10
+
+    for item, result in tushare_fetcher.fetch_in_order(fetch, range(20), workers=3, max_in_flight=5):
+        with lock:
+            # 正在交付的结果 + 最多max_in_flight个在途任务
+            assert len(started) - len(delivered) <= 5 + 1
+        delivered.append(item)
+        assert result == item * 10
+    assert delivered == list(range(20))
+
+
+def test_fetch_in_order_stops_submitting_when_consumer_exits():
+    started = []
+
+    def fetch(item):
+        started.append(item)
+        return item
+
+    results = tushare_fetcher.fetch_in_order(fetch, range(1000), workers=2, max_in_flight=4)
+    assert [next(results)[0] for _ in range(3)] == [0, 1, 2]
+    results.close()
+    assert len(started) <= 3 + 4
+
+
+def test_run_pipeline_consumes_in_order_with_backpressure():
+    produced, consumed = [], []
+
+    def results():
+        for item in range(30):
+            produced.append(item)
+            yield item
+
+    def consume(item):
+        # 拉取端领先写入端的结果数：队列 + 写入中的1个 + 拉取端正在放入的1个
+        assert len(produced) - len(consumed) <= 2 + 1 + 1
+        time.sleep(0.001)
+        consumed.append(item)
+
+    timer = tushare_fetcher.StageTimer()
+    assert tushare_fetcher.run_pipeline(results(), consume, writers=1, queue_size=2, timer=timer) == 30
+    assert consumed == list(range(30))
+    assert timer.counts['写入'] == 30
+    assert {'等待拉取', '背压等待', '写入空闲'} <= set(timer.totals)
+
+
+def test_run_pipeline_multiple_writers_consume_each_item_once():
+    consumed = []
+    lock = threading.Lock()
+
+    def consume(item):
+        with lock:
+            consumed.append(item)
+
+    assert tushare_fetcher.run_pipeline(range(100), consume, writers=3, queue_size=4) == 100
+    assert sorted(consumed) == list(range(100))
+
+
+def test_run_pipeline_stops_on_writer_error():
+    produced = []
+    closed = []
+
+    def results():
+        try:
+            for item in range(1000):
+                produced.append(item)
+                yield item
+        finally:
+            closed.append(True)
+
+    def consume(item):
+        if item == 3:
+            raise ValueError('write failed')
+        time.sleep(0.001)
+
+    with pytest.raises(ValueError, match='write failed'):
+        tushare_fetcher.run_pipeline(results(), consume, writers=1, queue_size=2)
+    assert len(produced) < 20
+    assert closed == [True]
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+选股结果前瞻收益回测
+====================
+功能说明：
+1. 读取stock_selected中的选股记录（按strategy_id + ts_code + trade_date去重），批量关联cn_stock_daily
+2. 以buy_date开盘价买入（buy_date停牌则顺延到之后第一根K线），全部用数组运算计算：
+   - N日前瞻收益（第N根K线收盘价 / 买入价 - 1），N取HORIZONS
+   - 最长持有期内的最大回撤、最佳持有天数（收盘价最高的K线序号）
+3. 逐条结果写入stock_backtest；行情尚不足最长持有期的记录标记为未完成，
+   重跑时只处理新增的选股记录和未完成的记录；cn_stock_daily最新交易日已超过
+   买入日STALE_DAYS个自然日仍不足最长持有期的记录（退市、长期停牌）标记为终止，不再重算
+4. 按策略与持有期汇总命中率、收益分位数、平均最大回撤，写入stock_backtest_summary
+====================
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, log_task_execution
+    from daily_reader import read_daily_typed
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.daily_reader import read_daily_typed
+
+# 前瞻收益的持有期（K线根数）
+HORIZONS = (1, 3, 5, 10, 20)
+RETURN_COLUMNS = [f"ret_{n}d" for n in HORIZONS]
+# complete字段取值：未完成 / 已覆盖最长持有期 / 终止（行情不会再补齐，只保留已有的收益）
+STATUS_PENDING, STATUS_COMPLETE, STATUS_TERMINATED = 0, 1, 2
+# 买入日之后超过该自然日天数仍不足最长持有期，视为终止（与读取行情的窗口一致）
+STALE_DAYS = max(HORIZONS) * 2 + 30
+
+
+# ========================== 表结构 ==========================
+def _has_strategy_id(conn, table_name):
+    """表存在且已有strategy_id字段时返回True，表不存在时返回None"""
+    columns = {row[0].lower() for row in conn.execute(text("""
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = :table_name
+    """), {"table_name": table_name}).fetchall()}
+    if not columns:
+        return None
+    return 'strategy_id' in columns
+
+
+def ensure_backtest_tables(engine):
+    """
+    创建回测明细表与汇总表（如不存在）
+
+    说明：
+    ----------
+    旧版表没有strategy_id：回测明细可由stock_selected重新计算，直接删除重建；
+    汇总表改名为stock_backtest_summary_old保留历史后重建
+    """
+    ret_cols = ',\n'.join(f"    {col} DOUBLE COMMENT '{n}日收益'" for col, n in zip(RETURN_COLUMNS, HORIZONS))
+    with engine.connect() as conn:
+        if _has_strategy_id(conn, 'stock_backtest') is False:
+            print("ℹ️ stock_backtest 缺少strategy_id，删除后按策略重新回测")
+            conn.execute(text("DROP TABLE stock_backtest"))
+        if _has_strategy_id(conn, 'stock_backtest_summary') is False:
+            print("ℹ️ stock_backtest_summary 缺少strategy_id，原表改名为 stock_backtest_summary_old")
+            conn.execute(text("RENAME TABLE stock_backtest_summary TO stock_backtest_summary_old"))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS stock_backtest (
+            strategy_id VARCHAR(50) NOT NULL COMMENT '选股策略标识',
+            ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+            trade_date DATE NOT NULL COMMENT '选股信号日',
+            buy_date DATE COMMENT '建议买入日期',
+            entry_date DATE COMMENT '实际买入日期（buy_date起第一根K线）',
+            entry_price DOUBLE COMMENT '买入价（开盘价）',
+        {ret_cols},
+            max_drawdown DOUBLE COMMENT '最长持有期内最大回撤',
+            best_hold_days INT COMMENT '最佳持有天数',
+            complete TINYINT NOT NULL DEFAULT 0 COMMENT '0未完成 1已覆盖最长持有期 2终止（退市或长期停牌）',
+            updated_at DATETIME COMMENT '计算时间',
+            PRIMARY KEY (strategy_id, ts_code, trade_date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS stock_backtest_summary (
+            run_time DATETIME NOT NULL COMMENT '汇总时间',
+            strategy_id VARCHAR(50) NOT NULL COMMENT '选股策略标识',
+            horizon INT NOT NULL COMMENT '持有期（K线根数）',
+            pick_count INT COMMENT '有效记录数',
+            hit_rate DOUBLE COMMENT '命中率（收益>0占比）',
+            mean_ret DOUBLE COMMENT '平均收益',
+            p10_ret DOUBLE, p25_ret DOUBLE, median_ret DOUBLE, p75_ret DOUBLE, p90_ret DOUBLE,
+            mean_max_drawdown DOUBLE COMMENT '平均最大回撤（最长持有期）',
+            PRIMARY KEY (run_time, strategy_id, horizon)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        conn.commit()
+
+
+# ========================== 读取待回测记录 ==========================
+def load_pending_picks(engine):
+    """
+    读取尚未回测或回测未完成的选股记录（按strategy_id + ts_code + trade_date去重，
+    不同策略选中的同一股票分别回测）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        strategy_id, ts_code, trade_date, buy_date（datetime类型）
+    """
+    sql = text("""
+    SELECT s.strategy_id, s.ts_code, s.trade_date, MIN(s.buy_date) AS buy_date
+    FROM stock_selected s
+    LEFT JOIN stock_backtest b
+      ON b.strategy_id = s.strategy_id AND b.ts_code = s.ts_code AND b.trade_date = s.trade_date
+    WHERE b.ts_code IS NULL OR b.complete = 0
+    GROUP BY s.strategy_id, s.ts_code, s.trade_date
+    """)
+    with engine.connect() as conn:
+        picks = pd.read_sql(sql, conn)
+    for col in ('trade_date', 'buy_date'):
+        picks[col] = pd.to_datetime(picks[col].astype(str).str.replace('-', ''), format='%Y%m%d')
+    return picks
+
+
+def read_latest_trade_date(engine):
+    """cn_stock_daily的最新交易日（无数据时返回None）"""
+    with engine.connect() as conn:
+        latest = conn.execute(text("SELECT MAX(trade_date) FROM cn_stock_daily")).scalar()
+    if latest is None:
+        return None
+    return pd.to_datetime(str(latest).replace('-', '')[:8], format='%Y%m%d')
+
+
+# ========================== 向量化计算 ==========================
+def compute_forward_returns(picks, bars, horizons=HORIZONS, latest_date=None):
+    """
+    计算每条选股记录的前瞻收益、最大回撤与最佳持有天数（无逐条循环）
+
+    参数说明：
+    ----------
+    picks : pandas.DataFrame
+        ts_code, trade_date, buy_date（其余字段如strategy_id原样保留）
+    bars : pandas.DataFrame
+        日线数据（ts_code, trade_date, price_open, price_close），需覆盖buy_date之后max(horizons)根K线
+    horizons : tuple of int, 可选
+        持有期（K线根数），默认HORIZONS
+    latest_date : datetime, 可选
+        cn_stock_daily的最新交易日；传入时，最新交易日已超过buy_date之后STALE_DAYS个自然日
+        仍不足最长持有期的记录标记为终止（STATUS_TERMINATED）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        picks的字段 + entry_date, entry_price, ret_Nd..., max_drawdown, best_hold_days, complete
+    """
+    max_horizon = max(horizons)
+    result = picks.reset_index(drop=True).copy()
+    if result.empty:
+        return result
+    if bars.empty:
+        for n in horizons:
+            result[f"ret_{n}d"] = np.nan
+        result['max_drawdown'] = np.nan
+        result['best_hold_days'] = np.nan
+        result['entry_date'] = pd.NaT
+        result['entry_price'] = np.nan
+        result['complete'] = _completion_status(np.zeros(len(result), dtype=bool), result['buy_date'], latest_date)
+        return result
+
+    bars = bars.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    # 股票代码统一编码后，用(代码, 日期)组合键一次searchsorted定位每条记录的买入K线
+    categories = pd.Index(sorted(set(bars['ts_code'].astype(str)) | set(result['ts_code'].astype(str))))
+    bar_codes = categories.get_indexer(bars['ts_code'].astype(str)).astype(np.int64)
+    pick_codes = categories.get_indexer(result['ts_code'].astype(str)).astype(np.int64)
+    bar_days = bars['trade_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    pick_days = result['buy_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    day_base = bar_days.min()
+    bar_keys = (bar_codes << 32) | (bar_days - day_base)
+    pick_keys = (pick_codes << 32) | np.maximum(pick_days - day_base, 0)
+    entry_idx = np.searchsorted(bar_keys, pick_keys, side='left')
+
+    opens = bars['price_open'].to_numpy(dtype=np.float64)
+    closes = bars['price_close'].to_numpy(dtype=np.float64)
+
+    # [记录数, 最长持有期]的K线行号矩阵，越界或跨股票的位置记为无效
+    offsets = entry_idx[:, None] + np.arange(max_horizon)[None, :]
+    in_range = offsets < len(bars)
+    offsets = np.where(in_range, offsets, 0)
+    valid = in_range & (bar_codes[offsets] == pick_codes[:, None])
+    path = np.where(valid, closes[offsets], np.nan)
+
+    has_entry = valid[:, 0]
+    entry_price = np.where(has_entry, opens[offsets[:, 0]], np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = path / entry_price[:, None]
+        for n in horizons:
+            result[f"ret_{n}d"] = relative[:, n - 1] - 1
+
+        # 最大回撤：以买入价为起点的滚动最高价（fmax忽略NaN）
+        peaks = np.fmax.accumulate(np.concatenate([entry_price[:, None], path], axis=1), axis=1)[:, 1:]
+        drawdowns = path / peaks - 1
+    no_path = np.all(np.isnan(drawdowns), axis=1)
+    result['max_drawdown'] = np.where(no_path, np.nan, np.nanmin(np.where(no_path[:, None], 0, drawdowns), axis=1))
+    # 最佳持有天数：持有期内收盘价最高的K线序号（从1开始）
+    best = np.argmax(np.where(np.isnan(path), -np.inf, path), axis=1) + 1
+    result['best_hold_days'] = np.where(has_entry, best, np.nan)
+
+    result['entry_date'] = pd.Series(bars['trade_date'].to_numpy()[offsets[:, 0]]).where(has_entry)
+    result['entry_price'] = entry_price
+    result['complete'] = _completion_status(valid[:, -1], result['buy_date'], latest_date)
+    return result
+
+
+def _completion_status(covered, buy_dates, latest_date):
+    """已覆盖最长持有期为完成；否则最新交易日超过买入日STALE_DAYS个自然日为终止，其余为未完成"""
+    status = np.where(covered, STATUS_COMPLETE, STATUS_PENDING)
+    if latest_date is not None:
+        stale = (buy_dates + pd.Timedelta(days=STALE_DAYS) < pd.Timestamp(latest_date)).to_numpy()
+        status = np.where(~covered & stale, STATUS_TERMINATED, status)
+    return status.astype(int)
+
+
+def summarize_backtest(per_pick, horizons=HORIZONS):
+    """
+    按策略与持有期汇总命中率、收益分位数与平均最大回撤
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        每个策略 × 持有期一行（per_pick没有strategy_id字段时只按持有期汇总）
+    """
+    if 'strategy_id' in per_pick.columns:
+        groups = per_pick.groupby('strategy_id', sort=True)
+    else:
+        groups = [(None, per_pick)]
+    rows = []
+    for strategy_id, group in groups:
+        for n in horizons:
+            returns = group[f"ret_{n}d"].dropna().to_numpy()
+            quantiles = np.quantile(returns, [0.1, 0.25, 0.5, 0.75, 0.9]) if len(returns) else [np.nan] * 5
+            row = {} if strategy_id is None else {'strategy_id': strategy_id}
+            row.update({
+                'horizon': n,
+                'pick_count': len(returns),
+                'hit_rate': float((returns > 0).mean()) if len(returns) else np.nan,
+                'mean_ret': float(returns.mean()) if len(returns) else np.nan,
+                'p10_ret': quantiles[0], 'p25_ret': quantiles[1], 'median_ret': quantiles[2],
+                'p75_ret': quantiles[3], 'p90_ret': quantiles[4],
+                'mean_max_drawdown': float(group['max_drawdown'].mean()),
+            })
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# ========================== 写入 ==========================
+def _none_if_nan(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    return value
+
+
+def write_backtest_results(engine, per_pick):
+    """以(strategy_id, ts_code, trade_date)为主键写入stock_backtest（存在则更新）"""
+    columns = ['strategy_id', 'ts_code', 'trade_date', 'buy_date', 'entry_date', 'entry_price'] + RETURN_COLUMNS + \
+              ['max_drawdown', 'best_hold_days', 'complete', 'updated_at']
+    frame = per_pick.copy()
+    frame['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for col in ('trade_date', 'buy_date', 'entry_date'):
+        frame[col] = frame[col].dt.strftime('%Y%m%d')
+    frame['ts_code'] = frame['ts_code'].astype(str)
+    values = [tuple(_none_if_nan(v) for v in row) for row in frame[columns].astype(object).itertuples(index=False)]
+
+    update_str = ', '.join(f"{col} = VALUES({col})" for col in columns
+                           if col not in ('strategy_id', 'ts_code', 'trade_date'))
+    sql = f"""
+    INSERT INTO stock_backtest ({', '.join(columns)})
+    VALUES ({', '.join(['%s'] * len(columns))})
+    ON DUPLICATE KEY UPDATE {update_str}
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        batch_size = 1000
+        for i in range(0, len(values), batch_size):
+            cursor.executemany(sql, values[i:i + batch_size])
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def refresh_summary(engine, horizons=HORIZONS):
+    """基于stock_backtest全部记录按策略重新汇总，写入stock_backtest_summary"""
+    with engine.connect() as conn:
+        per_pick = pd.read_sql(text(f"SELECT strategy_id, {', '.join(RETURN_COLUMNS)}, max_drawdown "
+                                    f"FROM stock_backtest"), conn)
+    summary = summarize_backtest(per_pick, horizons)
+    summary.insert(0, 'run_time', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    summary = summary.astype(object).where(summary.notna(), None)
+    summary.to_sql('stock_backtest_summary', engine, if_exists='append', index=False)
+    return summary
+
+
+# ========================== 主流程 ==========================
+def run_backtest(engine):
+    """
+    增量回测：只处理新增或未完成的选股记录，并刷新汇总表
+
+    返回值：
+    ----------
+    tuple(int, pandas.DataFrame)
+        (本次处理的记录数, 汇总表)
+    """
+    ensure_backtest_tables(engine)
+    picks = load_pending_picks(engine)
+    print(f"📥 待回测选股记录 {len(picks)} 条")
+    if not picks.empty:
+        # 一次批量读取相关股票从最早买入日到最晚买入日之后足够长的行情
+        start_date = picks['buy_date'].min().strftime('%Y%m%d')
+        end_date = (picks['buy_date'].max() + timedelta(days=max(HORIZONS) * 2 + 30)).strftime('%Y%m%d')
+        bars = read_daily_typed(engine, start_date, end_date, fields=['price_open', 'price_close'],
+                                ts_codes=sorted(picks['ts_code'].astype(str).unique()))
+        per_pick = compute_forward_returns(picks, bars, latest_date=read_latest_trade_date(engine))
+        write_backtest_results(engine, per_pick)
+        status = per_pick['complete']
+        print(f"✅ 已写入 {len(per_pick)} 条回测明细（其中 {int((status == STATUS_COMPLETE).sum())} 条已覆盖最长持有期，"
+              f"{int((status == STATUS_TERMINATED).sum())} 条因退市或长期停牌终止）")
+
+    summary = refresh_summary(engine)
+    print("\n📊 ===== 回测汇总 =====")
+    print(summary.to_string(index=False))
+    return len(picks), summary
+
+
+if __name__ == "__main__":
+    engine = get_db_engine()
+    try:
+        log_task_execution("选股回测", "RUNNING", "开始回测选股结果")
+        processed, _ = run_backtest(engine)
+        log_task_execution("选股回测", "SUCCESS", f"本次回测 {processed} 条选股记录")
+    except Exception as e:
+        print(f"❌ 回测出错: {e}")
+        log_task_execution("选股回测", "FAIL", f"执行出错: {e}")
+    finally:
+        engine.dispose()
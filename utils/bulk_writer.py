@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+批量写入（多行VALUES + ON DUPLICATE KEY UPDATE）
+====================
+功能说明：
+1. 在客户端把每行转义为字面量，按服务端max_allowed_packet拼接成尽量大的多行INSERT语句，
+   大结果集只需少量往返
+2. 根据服务端返回的"Records: N  Duplicates: D"信息与影响行数，准确统计新增/更新/未变化行数
+   （影响行数的含义取决于连接是否设置CLIENT_FOUND_ROWS，从连接上读取，见split_affected_rows）
+3. 全部语句在同一事务内执行，出错整体回滚
+4. 输出语句数、写入耗时与吞吐（行/秒、MB/秒）
+5. 兼容SQLite（ON CONFLICT ... DO UPDATE），供离线基准测试使用；SQLite不区分新增与更新
+6. 暂存表合并（staged_upsert）：先把数据整体载入临时表，再用一次关联统计新增/更新/未变化行数，
+   最后用一条 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并到目标表
+====================
+"""
+
+import re
+import time
+
+# 语句之外预留的字节数（包头、ON DUPLICATE子句等）
+PACKET_HEADROOM = 64 * 1024
+# 读取不到服务端配置时使用的默认包大小（MySQL/TiDB的常见默认值）
+DEFAULT_PACKET_BYTES = 4 * 1024 * 1024
+
+# MySQL客户端标志CLIENT_FOUND_ROWS：设置后影响行数按匹配行计（SQLAlchemy的MySQL方言默认设置）
+CLIENT_FOUND_ROWS = 2
+
+_INFO_PATTERN = re.compile(r"Records:\s*(\d+)\s+Duplicates:\s*(\d+)")
+
+
+def get_max_packet_bytes(conn):
+    """
+    读取单条语句的可用字节数：服务端@@max_allowed_packet与客户端上限取较小值
+
+    参数说明：
+    ----------
+    conn : DBAPI连接
+        engine.raw_connection()返回的连接
+    """
+    server_limit = DEFAULT_PACKET_BYTES
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT @@max_allowed_packet")
+        row = cursor.fetchone()
+        if row and row[0]:
+            server_limit = int(row[0])
+    except Exception:
+        pass
+    finally:
+        cursor.close()
+    client_limit = getattr(conn, 'max_allowed_packet', None) or server_limit
+    return max(min(server_limit, client_limit) - PACKET_HEADROOM, PACKET_HEADROOM)
+
+
+def _parse_info(cursor):
+    """解析多行INSERT的服务端信息，返回(记录数, 重复数)，取不到时返回None"""
+    result = getattr(cursor, '_result', None)
+    message = getattr(result, 'message', None)
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'ignore')
+    match = _INFO_PATTERN.search(message or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def found_rows_enabled(engine, conn):
+    """
+    判断连接是否设置了CLIENT_FOUND_ROWS
+
+    说明：
+    ----------
+    优先读取DBAPI连接的client_flag（pymysql）；取不到时按方言判断
+    （SQLAlchemy的MySQL方言在驱动支持时总会加上该标志）
+    """
+    client_flag = getattr(conn, 'client_flag', None)
+    if isinstance(client_flag, int):
+        return bool(client_flag & CLIENT_FOUND_ROWS)
+    dialect_flag = getattr(engine.dialect, '_found_rows_client_flag', None)
+    return callable(dialect_flag) and dialect_flag() is not None
+
+
+def split_affected_rows(n_rows, affected, info, found_rows):
+    """
+    由一条多行 INSERT ... ON DUPLICATE KEY UPDATE 的结果推算(新增, 更新, 未变化)行数
+
+    参数说明：
+    ----------
+    n_rows : int
+        语句中的行数
+    affected : int
+        cursor.rowcount
+    info : tuple or None
+        服务端信息中的(记录数, 重复数)，取不到时为None（单行INSERT没有该信息）
+    found_rows : bool
+        连接是否设置了CLIENT_FOUND_ROWS
+
+    说明：
+    ----------
+    每行对影响行数的贡献：新增1，有变化的更新2；未变化的行在设置CLIENT_FOUND_ROWS时为1，否则为0。
+    因此设置时 影响行数 = 新增 + 2 × 更新 + 未变化，未设置时 影响行数 = 新增 + 2 × 更新
+    """
+    if info is not None:
+        duplicates = info[1]
+        inserted = n_rows - duplicates
+        if found_rows:
+            updated = affected - inserted - duplicates
+        else:
+            updated = (affected - inserted) // 2
+        updated = min(max(updated, 0), duplicates)
+        return inserted, updated, duplicates - updated
+    # 无服务端信息时只能由影响行数推算
+    updated = max(affected - n_rows, 0)
+    if found_rows:
+        # 影响行数 = 行数 + 更新数，更新数准确；新增与未变化的行无法区分，均计为新增
+        return n_rows - updated, updated, 0
+    # 影响行数 = 新增 + 2 × 更新（有变化的更新与未变化的行混合时为近似值）
+    inserted = min(max(affected - 2 * updated, 0), n_rows - updated)
+    return inserted, updated, n_rows - inserted - updated
+
+
+def _sqlite_literal(row):
+    """SQLite连接没有literal方法，按SQL标准转义一行值"""
+    items = []
+    for value in row:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, (bool, int, float)):
+            items.append(repr(float(value)) if isinstance(value, float) else str(int(value)))
+        else:
+            items.append("'" + str(value).replace("'", "''") + "'")
+    return '(' + ','.join(items) + ')'
+
+
+def _value_chunks(frame, to_literal, fixed_bytes, max_packet_bytes):
+    """把每行转义为字面量，按单条语句的字节上限分组，依次产出(字面量列表, 字节数)"""
+    literals, n_bytes = [], 0
+    for row in frame.itertuples(index=False, name=None):
+        literal = to_literal(row)
+        size = len(literal.encode('utf-8')) + 1
+        if literals and fixed_bytes + n_bytes + size > max_packet_bytes:
+            yield literals, n_bytes
+            literals, n_bytes = [], 0
+        literals.append(literal)
+        n_bytes += size
+    if literals:
+        yield literals, n_bytes
+
+
+def _to_object_frame(df):
+    """NaN/NaT统一转为None，其余值转为Python原生类型，便于逐行转义"""
+    return df.astype(object).where(df.notna(), None)
+
+
+def _report(table, stats, label='批量写入'):
+    """打印写入吞吐"""
+    elapsed = max(stats['seconds'], 1e-9)
+    print(f"   {label} {table}：{stats['rows']:,} 行，{stats['statements']} 条语句，"
+          f"耗时 {elapsed:.2f} 秒（{stats['rows'] / elapsed:,.0f} 行/秒，"
+          f"{stats['bytes'] / 1024 / 1024 / elapsed:.1f} MB/秒）")
+
+
+def bulk_upsert(engine, table, df, key_columns, update_columns=None, max_packet_bytes=None, verbose=True,
+                pre_statements=None):
+    """
+    以多行VALUES语句批量写入（主键存在则更新，不存在则插入）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎（MySQL/TiDB；SQLite仅用于离线基准测试）
+    table : str
+        目标表名
+    df : pandas.DataFrame
+        待写入数据，列名即表字段名；NaN/NaT写为NULL
+    key_columns : list
+        主键字段（不参与更新）
+    update_columns : list, 可选
+        冲突时更新的字段，默认除主键外的全部字段
+    max_packet_bytes : int, 可选
+        单条语句的最大字节数，默认按服务端max_allowed_packet自动确定
+    verbose : bool, 可选
+        是否打印写入吞吐，默认True
+    pre_statements : list of str, 可选
+        在同一事务内、写入之前执行的语句（如删除将被重算的旧行）；df为空时仍会执行
+
+    返回值：
+    ----------
+    dict
+        rows（写入行数）、inserted（新增）、updated（内容有变化的更新）、unchanged（主键已存在且内容相同）、
+        statements（语句数）、bytes（SQL字节数）、seconds（耗时）
+    """
+    stats = {'rows': len(df), 'inserted': 0, 'updated': 0, 'unchanged': 0,
+             'statements': 0, 'bytes': 0, 'seconds': 0.0}
+    if df.empty and not pre_statements:
+        return stats
+
+    columns = df.columns.tolist()
+    if update_columns is None:
+        update_columns = [col for col in columns if col not in key_columns]
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    if engine.dialect.name == 'sqlite':
+        if update_columns:
+            suffix = (f" ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+                      + ', '.join(f"{col} = excluded.{col}" for col in update_columns))
+        else:
+            suffix = f" ON CONFLICT ({', '.join(key_columns)}) DO NOTHING"
+    elif update_columns:
+        suffix = " ON DUPLICATE KEY UPDATE " + ', '.join(f"{col} = VALUES({col})" for col in update_columns)
+    else:
+        # 无可更新字段时，主键冲突的行保持不变
+        suffix = " ON DUPLICATE KEY UPDATE " + f"{key_columns[0]} = {key_columns[0]}"
+    # NaN/NaT统一转为None，其余值转为Python原生类型后再转义
+    frame = _to_object_frame(df)
+
+    start_time = time.time()
+    conn = engine.raw_connection()
+    try:
+        if max_packet_bytes is None:
+            max_packet_bytes = get_max_packet_bytes(conn)
+        to_literal = _sqlite_literal if engine.dialect.name == 'sqlite' else conn.literal
+        found_rows = found_rows_enabled(engine, conn)
+        cursor = conn.cursor()
+        for statement in pre_statements or []:
+            cursor.execute(statement)
+            stats['statements'] += 1
+        fixed_bytes = len(prefix.encode('utf-8')) + len(suffix.encode('utf-8'))
+
+        def flush(literals, n_bytes):
+            cursor.execute(prefix + ','.join(literals) + suffix)
+            inserted, updated, unchanged = split_affected_rows(len(literals), cursor.rowcount,
+                                                               _parse_info(cursor), found_rows)
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            stats['unchanged'] += unchanged
+            stats['statements'] += 1
+            stats['bytes'] += fixed_bytes + n_bytes
+
+        for literals, n_bytes in _value_chunks(frame, to_literal, fixed_bytes, max_packet_bytes):
+            flush(literals, n_bytes)
+
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    stats['seconds'] = time.time() - start_time
+    if verbose:
+        _report(table, stats)
+    return stats
+
+
+def staged_upsert(engine, table, df, key_columns, update_columns=None, max_packet_bytes=None, verbose=True,
+                  changed_only=False):
+    """
+    经临时暂存表合并写入（主键存在则更新，不存在则插入）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎（MySQL/TiDB；SQLite仅用于离线基准测试）
+    table : str
+        目标表名
+    df : pandas.DataFrame
+        待写入数据，列名即表字段名；NaN/NaT写为NULL
+    key_columns : list
+        主键字段（不参与更新）
+    update_columns : list, 可选
+        冲突时更新的字段，默认除主键外的全部字段
+    max_packet_bytes : int, 可选
+        载入暂存表时单条语句的最大字节数，默认按服务端max_allowed_packet自动确定
+    verbose : bool, 可选
+        是否打印写入吞吐，默认True
+    changed_only : bool, 可选
+        是否只合并新增或内容有变化的行（未变化的行不再写入，避免无效的更新版本），默认False
+
+    返回值：
+    ----------
+    dict
+        与bulk_upsert相同：rows、inserted、updated、unchanged、statements、bytes、seconds
+
+    说明：
+    ----------
+    1. CREATE TEMPORARY TABLE ... LIKE 目标表（临时表仅当前连接可见，多线程写入互不干扰）
+    2. 多行VALUES载入暂存表（单日数据通常一条语句）
+    3. 暂存表LEFT JOIN目标表一次统计：已存在的主键数、其中内容有变化的行数
+    4. INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 一条语句合并，全部在同一事务内执行；
+       changed_only=True 时合并语句同样关联目标表，只选出主键不存在或内容不同的行
+    """
+    stats = {'rows': len(df), 'inserted': 0, 'updated': 0, 'unchanged': 0,
+             'statements': 0, 'bytes': 0, 'seconds': 0.0}
+    if df.empty:
+        return stats
+
+    is_sqlite = engine.dialect.name == 'sqlite'
+    columns = df.columns.tolist()
+    if update_columns is None:
+        update_columns = [col for col in columns if col not in key_columns]
+    stage = f"{table}_stage"
+    column_list = ', '.join(columns)
+
+    if is_sqlite:
+        create_sql = f"CREATE TEMP TABLE {stage} AS SELECT {column_list} FROM {table} WHERE 0"
+        drop_sql = f"DROP TABLE IF EXISTS temp.{stage}"
+        same = ' AND '.join(f"s.{col} IS t.{col}" for col in update_columns)
+        if update_columns:
+            conflict = ("ON CONFLICT (" + ', '.join(key_columns) + ") DO UPDATE SET "
+                        + ', '.join(f"{col} = excluded.{col}" for col in update_columns))
+        else:
+            conflict = "ON CONFLICT (" + ', '.join(key_columns) + ") DO NOTHING"
+    else:
+        create_sql = f"CREATE TEMPORARY TABLE {stage} LIKE {table}"
+        drop_sql = f"DROP TEMPORARY TABLE IF EXISTS {stage}"
+        same = ' AND '.join(f"s.{col} <=> t.{col}" for col in update_columns)
+        # 合并语句的SELECT关联了目标表（changed_only），赋值左侧需以表名限定，否则字段名有歧义（错误1052）
+        if update_columns:
+            conflict = "ON DUPLICATE KEY UPDATE " + ', '.join(f"{table}.{col} = VALUES({col})"
+                                                              for col in update_columns)
+        else:
+            conflict = f"ON DUPLICATE KEY UPDATE {table}.{key_columns[0]} = {table}.{key_columns[0]}"
+
+    join_on = ' AND '.join(f"s.{col} = t.{col}" for col in key_columns)
+    # 只统计主键已存在（关联成功）且内容不同的行
+    matched = f"t.{key_columns[0]} IS NOT NULL"
+    changed = f"SUM(CASE WHEN {matched} AND NOT ({same}) THEN 1 ELSE 0 END)" if update_columns else "0"
+    # 合并语句均带WHERE子句（SQLite需要它消除INSERT ... SELECT与ON CONFLICT的解析歧义）
+    stage_columns = ', '.join(f"s.{col}" for col in columns)
+    if changed_only:
+        differs = f"t.{key_columns[0]} IS NULL" + (f" OR NOT ({same})" if update_columns else "")
+        merge_sql = (f"INSERT INTO {table} ({column_list}) SELECT {stage_columns} "
+                     f"FROM {stage} s LEFT JOIN {table} t ON {join_on} WHERE {differs} {conflict}")
+    else:
+        merge_sql = f"INSERT INTO {table} ({column_list}) SELECT {stage_columns} FROM {stage} s WHERE 1 {conflict}"
+    count_sql = (f"SELECT COUNT(t.{key_columns[0]}), {changed} "
+                 f"FROM {stage} s LEFT JOIN {table} t ON {join_on}")
+    prefix = f"INSERT INTO {stage} ({column_list}) VALUES "
+    frame = _to_object_frame(df)
+
+    start_time = time.time()
+    conn = engine.raw_connection()
+    try:
+        if max_packet_bytes is None:
+            max_packet_bytes = get_max_packet_bytes(conn)
+        to_literal = _sqlite_literal if is_sqlite else conn.literal
+        cursor = conn.cursor()
+        cursor.execute(drop_sql)
+        cursor.execute(create_sql)
+
+        fixed_bytes = len(prefix.encode('utf-8'))
+        for literals, n_bytes in _value_chunks(frame, to_literal, fixed_bytes, max_packet_bytes):
+            cursor.execute(prefix + ','.join(literals))
+            stats['statements'] += 1
+            stats['bytes'] += fixed_bytes + n_bytes
+
+        cursor.execute(count_sql)
+        existing, n_changed = cursor.fetchone()
+        existing, n_changed = int(existing or 0), int(n_changed or 0)
+        cursor.execute(merge_sql)
+        cursor.execute(drop_sql)
+        stats['statements'] += 2
+
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    stats['inserted'] = stats['rows'] - existing
+    stats['updated'] = n_changed
+    stats['unchanged'] = existing - n_changed
+    stats['seconds'] = time.time() - start_time
+    if verbose:
+        _report(table, stats, label='暂存表合并')
+    return stats
+
+
+def format_upsert_stats(stats):
+    """把bulk_upsert的统计结果格式化为日志文本"""
+    return (f"新增 {stats['inserted']} 行，更新 {stats['updated']} 行，"
+            f"未变化 {stats['unchanged']} 行")
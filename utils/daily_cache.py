@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+cn_stock_daily 本地列式缓存（Parquet，按年分区）
+====================
+功能说明：
+1. 将cn_stock_daily同步到本地 .cache/daily/year=YYYY.parquet，选股/回测直接读本地文件
+2. 增量同步：按交易日指纹（行数|全部字段的行签名汇总，见daily_reader.read_day_fingerprints）与数据库比对，
+   仅重新拉取水位线之后的新交易日、最近recheck_days天内指纹变化的交易日，以及被标记失效的交易日
+3. 一致性校验：逐日比对缓存与数据库的行数
+4. 失效命令：清空整个缓存，或将指定日期区间标记为失效（下次同步时重新拉取）
+5. load_stock_data在配置 USE_DAILY_CACHE=1 时透明读取缓存（缓存起点之前与水位线之后的部分仍从数据库读取）
+
+命令行用法：
+    python utils/daily_cache.py sync [--start 20000101] [--end 20251231]
+    python utils/daily_cache.py verify --start 20250101 --end 20251231
+    python utils/daily_cache.py invalidate [--start 20250101 --end 20250131]
+
+依赖：pyarrow（pandas读写Parquet）
+====================
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_cache_dir, get_db_engine, log_task_execution
+    from daily_reader import read_daily_typed, read_day_fingerprints
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_cache_dir, get_db_engine, log_task_execution
+    from utils.daily_reader import read_daily_typed, read_day_fingerprints
+
+MANIFEST_FILE = 'manifest.json'
+
+
+# ========================== 缓存文件辅助函数 ==========================
+def _cache_dir():
+    return get_cache_dir('daily')
+
+
+def _year_path(year):
+    return os.path.join(_cache_dir(), f"year={year}.parquet")
+
+
+def load_manifest():
+    """
+    读取缓存清单
+
+    返回值：
+    ----------
+    dict
+        - watermark: 已同步的最大交易日（YYYYMMDD），未同步过为None
+        - synced_from: 首次同步的起始日期（YYYYMMDD），缓存只覆盖该日期及之后，未同步过为None
+        - fingerprints: {YYYYMMDD: 指纹}
+        - dirty_from: 被标记失效的最早日期（YYYYMMDD），无则为None
+    """
+    path = os.path.join(_cache_dir(), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'watermark': None, 'synced_from': None, 'fingerprints': {}, 'dirty_from': None}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    # 旧版清单没有synced_from，以最早的已缓存交易日代替
+    if not manifest.get('synced_from') and manifest['fingerprints']:
+        manifest['synced_from'] = min(manifest['fingerprints'])
+    return manifest
+
+
+def save_manifest(manifest):
+    """原子写入缓存清单（先写临时文件再替换）"""
+    path = os.path.join(_cache_dir(), MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_year(year, filters=None, columns=None):
+    path = _year_path(year)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path, filters=filters, columns=columns)
+
+
+def _replace_days(new_df, replace_days):
+    """
+    按年重写分区：删除replace_days中的交易日，再写入new_df中的数据
+
+    参数说明：
+    ----------
+    new_df : pandas.DataFrame
+        新拉取的日线数据（trade_date为datetime）
+    replace_days : list of pandas.Timestamp
+        需要整体替换（或删除）的交易日
+    """
+    replace_days = pd.DatetimeIndex(replace_days)
+    years = sorted(set(replace_days.year))
+    for year in years:
+        old = _read_year(year)
+        parts = []
+        if old is not None:
+            parts.append(old[~old['trade_date'].isin(replace_days)])
+        if not new_df.empty:
+            parts.append(new_df[new_df['trade_date'].dt.year == year])
+        merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if merged.empty:
+            if os.path.exists(_year_path(year)):
+                os.remove(_year_path(year))
+            continue
+        merged['ts_code'] = merged['ts_code'].astype(str)
+        merged = merged.sort_values(['ts_code', 'trade_date'], kind='mergesort')
+        tmp_path = _year_path(year) + '.tmp'
+        merged.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, _year_path(year))
+
+
+def _consecutive_ranges(days, all_days):
+    """将days按在all_days中的连续性合并为[(起始日, 结束日)]，区间内只包含days中的交易日"""
+    positions = all_days.get_indexer(days)
+    ranges = []
+    for pos in sorted(positions):
+        if ranges and pos == ranges[-1][1] + 1:
+            ranges[-1][1] = pos
+        else:
+            ranges.append([pos, pos])
+    return [(all_days[lo], all_days[hi]) for lo, hi in ranges]
+
+
+# ========================== 增量同步 ==========================
+def sync_daily_cache(engine, start_date='20000101', end_date=None, recheck_days=30):
+    """
+    增量同步本地缓存
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date : str, 可选
+        首次同步的起始日期（YYYYMMDD），默认'20000101'
+    end_date : str, 可选
+        同步截止日期（YYYYMMDD），默认今天
+    recheck_days : int, 可选
+        水位线之前重新比对指纹的自然日天数，默认30（覆盖近期的补录/修正）
+
+    返回值：
+    ----------
+    dict
+        {'checked_days': 比对的交易日数, 'pulled_days': 重新拉取的交易日数,
+         'removed_days': 删除的交易日数, 'pulled_rows': 拉取行数, 'watermark': 新水位线}
+    """
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    manifest = load_manifest()
+    cached_fps = manifest['fingerprints']
+
+    # 确定需要比对的区间：首次同步从start_date开始；否则从水位线前recheck_days天或最早失效日开始
+    if manifest['watermark']:
+        watermark = datetime.strptime(manifest['watermark'], '%Y%m%d')
+        check_start = (watermark - timedelta(days=recheck_days)).strftime('%Y%m%d')
+        if manifest.get('dirty_from'):
+            check_start = min(check_start, manifest['dirty_from'])
+    else:
+        check_start = start_date
+        manifest['synced_from'] = start_date
+
+    db_fps = read_day_fingerprints(engine, check_start, end_date)
+    db_days = pd.DatetimeIndex(sorted(db_fps))
+    changed = [day for day in db_days if cached_fps.get(day.strftime('%Y%m%d')) != db_fps[day]]
+    removed = [
+        pd.Timestamp(day) for day in cached_fps
+        if check_start <= day <= end_date and pd.Timestamp(day) not in db_fps
+    ]
+
+    pulled_rows = 0
+    frames = []
+    for lo, hi in _consecutive_ranges(changed, db_days):
+        df = read_daily_typed(engine, lo.strftime('%Y%m%d'), hi.strftime('%Y%m%d'), verbose=False)
+        pulled_rows += len(df)
+        frames.append(df.astype({'ts_code': str}))
+        print(f"   拉取 {lo:%Y%m%d} - {hi:%Y%m%d}：{len(df):,} 行")
+
+    if changed or removed:
+        new_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['ts_code', 'trade_date'])
+        _replace_days(new_df, changed + removed)
+
+    for day in changed:
+        cached_fps[day.strftime('%Y%m%d')] = db_fps[day]
+    for day in removed:
+        cached_fps.pop(day.strftime('%Y%m%d'), None)
+    if cached_fps:
+        manifest['watermark'] = max(cached_fps)
+    manifest['dirty_from'] = None
+    save_manifest(manifest)
+
+    stats = {
+        'checked_days': len(db_days),
+        'pulled_days': len(changed),
+        'removed_days': len(removed),
+        'pulled_rows': pulled_rows,
+        'watermark': manifest['watermark'],
+    }
+    print(f"✅ 缓存同步完成：比对 {stats['checked_days']} 个交易日，重新拉取 {stats['pulled_days']} 天"
+          f"（{pulled_rows:,} 行），删除 {stats['removed_days']} 天，水位线 {stats['watermark']}")
+    return stats
+
+
+# ========================== 缓存读取 ==========================
+def read_cached_daily(start_date, end_date, fields=None, ts_codes=None):
+    """
+    从本地缓存读取日线数据，返回格式与load_stock_data一致
+
+    参数说明：
+    ----------
+    start_date / end_date : str
+        起止日期，格式为YYYYMMDD
+    fields : list, 可选
+        需要的行情字段，默认全部
+    ts_codes : list, 可选
+        只读取这些股票，默认全部
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        按ts_code、trade_date升序，ts_code为Categorical
+    """
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    filters = [('trade_date', '>=', start), ('trade_date', '<=', end)]
+    if ts_codes is not None:
+        filters.append(('ts_code', 'in', list(ts_codes)))
+    columns = ['ts_code', 'trade_date'] + list(fields) if fields is not None else None
+
+    frames = []
+    for year in range(start.year, end.year + 1):
+        df = _read_year(year, filters=filters, columns=columns)
+        if df is not None and not df.empty:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=columns or ['ts_code', 'trade_date'])
+    df = pd.concat(frames, ignore_index=True)
+    df['ts_code'] = df['ts_code'].astype(str)
+    df = df.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    df['ts_code'] = df['ts_code'].astype('category')
+    return df
+
+
+def load_daily_with_cache(engine, start_date, end_date, fields=None):
+    """
+    透明读取：缓存覆盖的部分（synced_from至水位线）读本地缓存，缓存起点之前与水位线之后的部分直接读数据库
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与read_daily_typed相同的格式
+
+    说明：
+    ----------
+    区间与被标记失效（尚未重新同步）的日期相交时，整个区间改读数据库
+    """
+    manifest = load_manifest()
+    watermark, synced_from = manifest['watermark'], manifest.get('synced_from')
+    dirty_from = manifest.get('dirty_from')
+    if (not watermark or not synced_from or watermark < start_date or end_date < synced_from
+            or (dirty_from and dirty_from <= end_date)):
+        return read_daily_typed(engine, start_date, end_date, fields=fields)
+
+    cache_start = max(start_date, synced_from)
+    cache_end = min(end_date, watermark)
+    parts = []
+    if start_date < cache_start:
+        head_end = (datetime.strptime(cache_start, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+        print(f"ℹ️ 本地缓存从 {synced_from} 开始，{start_date} - {head_end} 从数据库读取")
+        parts.append(read_daily_typed(engine, start_date, head_end, fields=fields, verbose=False))
+    parts.append(read_cached_daily(cache_start, cache_end, fields=fields))
+    if end_date > watermark:
+        tail_start = (datetime.strptime(watermark, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+        parts.append(read_daily_typed(engine, tail_start, end_date, fields=fields, verbose=False))
+    if len(parts) == 1:
+        return parts[0]
+
+    df = pd.concat([part.astype({'ts_code': str}) for part in parts], ignore_index=True)
+    df = df.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    df['ts_code'] = df['ts_code'].astype('category')
+    return df
+
+
+# ========================== 校验与失效 ==========================
+def verify_daily_cache(engine, start_date, end_date):
+    """
+    逐日比对缓存与数据库的行数
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        行数不一致的交易日：trade_date, cache_rows, db_rows（全部一致时为空表）
+    """
+    db_fps = read_day_fingerprints(engine, start_date, end_date)
+    db_counts = pd.Series({day: int(fp.split('|')[0]) for day, fp in db_fps.items()}, dtype='int64')
+
+    cached = read_cached_daily(start_date, end_date, fields=[])
+    cache_counts = cached.groupby('trade_date').size() if not cached.empty else pd.Series(dtype='int64')
+
+    compare = pd.DataFrame({'cache_rows': cache_counts, 'db_rows': db_counts}).fillna(0).astype('int64')
+    mismatched = compare[compare['cache_rows'] != compare['db_rows']]
+    mismatched = mismatched.rename_axis('trade_date').reset_index()
+    if mismatched.empty:
+        print(f"✅ 缓存校验通过：{start_date} - {end_date} 共 {len(compare)} 个交易日行数一致")
+    else:
+        print(f"❌ 缓存校验发现 {len(mismatched)} 个交易日行数不一致：")
+        print(mismatched.to_string(index=False))
+    return mismatched
+
+
+def invalidate_daily_cache(start_date=None, end_date=None):
+    """
+    使缓存失效
+
+    参数说明：
+    ----------
+    start_date / end_date : str, 可选
+        均为空时删除整个缓存目录；否则删除该区间的缓存数据与指纹，下次同步时重新拉取
+    """
+    if not start_date and not end_date:
+        shutil.rmtree(_cache_dir(), ignore_errors=True)
+        print("🗑️ 已清空本地日线缓存")
+        return
+
+    start_date = start_date or '19900101'
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    manifest = load_manifest()
+    days = [day for day in manifest['fingerprints'] if start_date <= day <= end_date]
+    for day in days:
+        manifest['fingerprints'].pop(day)
+    if days:
+        _replace_days(pd.DataFrame(columns=['ts_code', 'trade_date']), [pd.Timestamp(day) for day in days])
+    manifest['dirty_from'] = min(filter(None, [manifest.get('dirty_from'), start_date]))
+    save_manifest(manifest)
+    print(f"🗑️ 已标记 {start_date} - {end_date} 的缓存失效（{len(days)} 个交易日），下次同步时重新拉取")
+
+
+# ========================== 命令行入口 ==========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cn_stock_daily 本地缓存管理")
+    parser.add_argument('command', choices=['sync', 'verify', 'invalidate'])
+    parser.add_argument('--start', default=None, help="起始日期 YYYYMMDD")
+    parser.add_argument('--end', default=None, help="结束日期 YYYYMMDD")
+    parser.add_argument('--recheck-days', type=int, default=30, help="同步时回溯比对的自然日天数")
+    args = parser.parse_args()
+
+    if args.command == 'invalidate':
+        invalidate_daily_cache(args.start, args.end)
+        sys.exit(0)
+
+    engine = get_db_engine()
+    try:
+        if args.command == 'sync':
+            log_task_execution("日线缓存同步", "RUNNING", "开始同步本地日线缓存")
+            stats = sync_daily_cache(engine, start_date=args.start or '20000101', end_date=args.end,
+                                     recheck_days=args.recheck_days)
+            log_task_execution("日线缓存同步", "SUCCESS", json.dumps(stats, ensure_ascii=False))
+        else:
+            end_date = args.end or datetime.now().strftime('%Y%m%d')
+            start_date = args.start or (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
+            mismatched = verify_daily_cache(engine, start_date, end_date)
+            sys.exit(1 if not mismatched.empty else 0)
+    except Exception as e:
+        print(f"❌ 缓存操作失败: {e}")
+        if args.command == 'sync':
+            log_task_execution("日线缓存同步", "FAIL", str(e))
+        sys.exit(1)
+    finally:
+        engine.dispose()
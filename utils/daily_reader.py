@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+cn_stock_daily 类型化快速读取
+====================
+功能说明：
+1. DECIMAL字段在SQL中转为DOUBLE返回（+ 0E0），驱动直接解析为float，不再生成decimal.Decimal对象
+2. trade_date在SQL中转为YYYYMMDD整数，客户端只对去重后的日期解析一次为datetime64
+3. 逐批fetchmany并按列写入NumPy数组：价格可选float32/float64，成交量/金额为float64
+4. ts_code存为pandas Categorical（底层为int32编码 + 有序代码表）
+5. 输出读取行数与吞吐（行/秒）
+6. read_jump_candidates / read_daily_windows 支持先在SQL端预筛选大涨记录，再只读取候选股票的短窗口
+7. read_short_codes / read_history_starts 找出区间内有停牌的股票及其自身回看K线的起始日期
+8. read_day_codes 只读取(ts_code, trade_date)，用于按股票池统计各交易日的候选记录数
+====================
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# K线周期 -> 数据表（周线/月线由period_bars.py从日线聚合生成，字段与cn_stock_daily相同）
+BAR_TABLES = {
+    'D': 'cn_stock_daily',
+    'W': 'cn_stock_weekly',
+    'M': 'cn_stock_monthly',
+}
+
+# 字段名 -> 是否为价格类字段（价格类字段支持float32存储）
+DAILY_FIELDS = {
+    'price_open': True,
+    'price_high': True,
+    'price_low': True,
+    'price_close': True,
+    'price_pre_close': True,
+    'amt_chg': True,
+    'pct_chg': True,
+    'vol': False,
+    'amount': False,
+}
+
+
+def _date_int_expr(dialect_name):
+    """trade_date转YYYYMMDD整数的SQL表达式（SQLite中trade_date以YYYYMMDD文本存储）"""
+    if dialect_name == 'sqlite':
+        return "CAST(REPLACE(trade_date, '-', '') AS INTEGER)"
+    return "YEAR(trade_date) * 10000 + MONTH(trade_date) * 100 + DAY(trade_date)"
+
+
+def parse_date_ints(date_ints):
+    """
+    YYYYMMDD整数数组 -> datetime64[ns]数组（只解析去重后的日期）
+    """
+    unique_ints, inverse = np.unique(date_ints, return_inverse=True)
+    unique_dates = pd.to_datetime(unique_ints.astype(str), format='%Y%m%d').to_numpy()
+    return unique_dates[inverse]
+
+
+def read_daily_typed(engine, start_date, end_date, fields=None, ts_codes=None,
+                     price_dtype=np.float64, fetch_size=50000, verbose=True, freq='D'):
+    """
+    按日期区间读取cn_stock_daily（或周线/月线表），直接解码为紧凑的NumPy列
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        数据起止日期，格式为YYYYMMDD
+    fields : list, 可选
+        需要读取的行情字段（DAILY_FIELDS的子集），默认全部
+    ts_codes : list, 可选
+        只读取这些股票，默认全部
+    price_dtype : numpy.dtype, 可选
+        价格类字段的存储类型，默认float64；float32可再减半内存，但临界值附近的比较结果可能与float64不同
+    fetch_size : int, 可选
+        每批fetchmany的行数，默认50000
+    verbose : bool, 可选
+        是否打印读取吞吐，默认True
+    freq : str, 可选
+        K线周期：D（日线，默认）、W（周线）、M（月线），见BAR_TABLES
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        按ts_code、trade_date升序排列，字段与load_stock_data一致：
+        ts_code（Categorical）、trade_date（datetime64）及各行情字段（float）
+    """
+    fields = list(fields or DAILY_FIELDS)
+    sql = f"""
+    SELECT ts_code, {_date_int_expr(engine.dialect.name)}, {_select_columns(fields)}
+    FROM {BAR_TABLES[freq]}
+    WHERE trade_date BETWEEN %s AND %s
+    """
+    params = [start_date, end_date]
+    if ts_codes is not None:
+        if len(ts_codes) == 0:
+            return pd.DataFrame(columns=['ts_code', 'trade_date'] + fields)
+        sql += f" AND ts_code IN ({', '.join(['%s'] * len(ts_codes))})"
+        params.extend(ts_codes)
+    sql += " ORDER BY ts_code, trade_date"
+
+    start_time = time.time()
+    parts = _fetch_typed(engine, [(sql, params)], fields, price_dtype, fetch_size)
+    df = _build_frame(parts, fields)
+    if verbose:
+        _report_throughput(df, start_time)
+    return df
+
+
+def _select_columns(fields):
+    """行情字段在SQL中转为DOUBLE（+ 0E0），驱动直接返回float"""
+    return ', '.join(f"{field} + 0E0" for field in fields)
+
+
+def _fetch_typed(engine, statements, fields, price_dtype=np.float64, fetch_size=50000):
+    """
+    依次执行若干条查询（结果列：ts_code, YYYYMMDD整数, 各字段），逐批fetchmany并按列收集为NumPy数组
+
+    返回值：
+    ----------
+    tuple(list, list, dict)
+        (代码数组列表, 日期整数数组列表, {字段: 数组列表})
+    """
+    code_parts, date_parts = [], []
+    value_parts = {field: [] for field in fields}
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for sql, params in statements:
+            if engine.dialect.name == 'sqlite':
+                sql = sql.replace('%s', '?')
+            cursor.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                columns = list(zip(*batch))
+                code_parts.append(np.array(columns[0], dtype=object))
+                date_parts.append(np.array(columns[1], dtype=np.int64))
+                for i, field in enumerate(fields):
+                    dtype = price_dtype if DAILY_FIELDS[field] else np.float64
+                    # NULL解析为None，转换为NaN
+                    value_parts[field].append(np.array(columns[i + 2], dtype=np.float64).astype(dtype, copy=False))
+        cursor.close()
+    finally:
+        conn.close()
+    return code_parts, date_parts, value_parts
+
+
+def _build_frame(parts, fields, resort=False):
+    """把_fetch_typed收集的数组拼接为DataFrame（ts_code为Categorical，按ts_code、trade_date排序）"""
+    code_parts, date_parts, value_parts = parts
+    if not code_parts:
+        return pd.DataFrame(columns=['ts_code', 'trade_date'] + fields)
+
+    codes = np.concatenate(code_parts)
+    # factorize(sort=True)得到有序代码表与int32编码
+    code_ids, categories = pd.factorize(codes, sort=True)
+    df = pd.DataFrame({
+        'ts_code': pd.Categorical.from_codes(code_ids.astype(np.int32), categories=categories),
+        'trade_date': parse_date_ints(np.concatenate(date_parts)),
+    })
+    for field in fields:
+        df[field] = np.concatenate(value_parts[field])
+    if resort:
+        # 多条查询的结果各自有序，合并后重新排序
+        df = df.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    return df
+
+
+def _report_throughput(df, start_time):
+    elapsed = max(time.time() - start_time, 1e-9)
+    memory_mb = df.memory_usage(deep=False).sum() / 1024 / 1024
+    print(f"   类型化读取 {len(df):,} 行，耗时 {elapsed:.2f} 秒（{len(df) / elapsed:,.0f} 行/秒，约 {memory_mb:.1f} MB）")
+
+
+def read_daily_windows(engine, windows, fields=None, price_dtype=np.float64, codes_per_query=1000,
+                       fetch_size=50000, verbose=True):
+    """
+    按(股票, 日期区间)读取cn_stock_daily，只传输指定股票在各自区间内的K线
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    windows : pandas.DataFrame
+        ts_code, start_date, end_date（YYYYMMDD字符串）；同一股票的区间不应重叠
+    fields / price_dtype / fetch_size / verbose :
+        同read_daily_typed
+    codes_per_query : int, 可选
+        每条查询包含的股票数上限，默认1000
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        字段与read_daily_typed一致，按ts_code、trade_date升序排列
+
+    说明：
+    ----------
+    区间相同的股票合并为 trade_date BETWEEN ... AND ts_code IN (...) 一个条件，
+    每个条件都能走(ts_code, trade_date)主键的范围扫描
+    """
+    fields = list(fields or DAILY_FIELDS)
+    if windows.empty:
+        return pd.DataFrame(columns=['ts_code', 'trade_date'] + fields)
+
+    base_sql = f"""
+    SELECT ts_code, {_date_int_expr(engine.dialect.name)}, {_select_columns(fields)}
+    FROM cn_stock_daily
+    WHERE """
+    order_by = " ORDER BY ts_code, trade_date"
+    statements = []
+    clauses, params, n_codes = [], [], 0
+    for (start_date, end_date), group in windows.groupby(['start_date', 'end_date'], sort=True):
+        codes = sorted(group['ts_code'].astype(str).unique())
+        for i in range(0, len(codes), codes_per_query):
+            batch = codes[i:i + codes_per_query]
+            clauses.append(f"(trade_date BETWEEN %s AND %s AND ts_code IN ({', '.join(['%s'] * len(batch))}))")
+            params.extend([start_date, end_date, *batch])
+            n_codes += len(batch)
+            if n_codes >= codes_per_query:
+                statements.append((base_sql + ' OR '.join(clauses) + order_by, params))
+                clauses, params, n_codes = [], [], 0
+    if clauses:
+        statements.append((base_sql + ' OR '.join(clauses) + order_by, params))
+
+    start_time = time.time()
+    parts = _fetch_typed(engine, statements, fields, price_dtype, fetch_size)
+    df = _build_frame(parts, fields, resort=len(statements) > 1)
+    if verbose:
+        _report_throughput(df, start_time)
+    return df
+
+
+def read_jump_candidates(engine, start_date, end_date, min_ratio, jump_start=None):
+    """
+    在SQL端找出收盘价相对上一根K线涨幅超过min_ratio的(ts_code, trade_date)，用于选股的预筛选
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        K线区间，格式为YYYYMMDD；上一根K线只在该区间内查找（与在该区间数据上计算REF一致）
+    min_ratio : float
+        price_close / 上一根K线price_close 的下限（不含）
+    jump_start : str, 可选
+        只返回该日期及之后的大涨记录，默认start_date
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        ts_code, trade_date（datetime类型）
+
+    说明：
+    ----------
+    使用窗口函数LAG按股票取上一根已入库的K线，而不是pct_chg：
+    停牌复牌或缺失K线时pct_chg的前收盘价与上一根已入库K线的收盘价可能不同
+    """
+    sql = f"""
+    SELECT ts_code, {_date_int_expr(engine.dialect.name)}
+    FROM (
+        SELECT ts_code, trade_date, price_close,
+               LAG(price_close) OVER (PARTITION BY ts_code ORDER BY trade_date) AS prev_close
+        FROM cn_stock_daily
+        WHERE trade_date BETWEEN %s AND %s
+    ) bars
+    WHERE trade_date >= %s AND price_close > prev_close * %s
+    """
+    params = [start_date, end_date, jump_start or start_date, float(min_ratio)]
+    if engine.dialect.name == 'sqlite':
+        sql = sql.replace('%s', '?')
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    if not rows:
+        return pd.DataFrame({'ts_code': pd.Series(dtype=object), 'trade_date': pd.Series(dtype='datetime64[ns]')})
+    codes, date_ints = zip(*rows)
+    return pd.DataFrame({
+        'ts_code': np.array(codes, dtype=object),
+        'trade_date': parse_date_ints(np.array(date_ints, dtype=np.int64)),
+    })
+
+
+def read_short_codes(engine, start_date, end_date, n_bars, active_from=None):
+    """
+    找出[start_date, end_date]区间内K线数少于n_bars的股票（区间内停牌、缺失K线或区间内上市）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        区间起止日期，格式为YYYYMMDD
+    n_bars : int
+        区间内的全市场交易日数
+    active_from : str, 可选
+        只返回在该日期及之后仍有K线的股票（之后没有K线的股票不会被评估），默认start_date
+
+    返回值：
+    ----------
+    list
+        股票代码列表
+    """
+    sql = text("""
+    SELECT ts_code FROM cn_stock_daily
+    WHERE trade_date BETWEEN :start_date AND :end_date
+    GROUP BY ts_code
+    HAVING COUNT(*) < :n_bars AND MAX(trade_date) >= :active_from
+    """)
+    params = {"start_date": start_date, "end_date": end_date, "n_bars": int(n_bars),
+              "active_from": active_from or start_date}
+    with engine.connect() as conn:
+        return sorted(row[0] for row in conn.execute(sql, params).fetchall())
+
+
+def read_day_codes(engine, start_date, end_date):
+    """
+    读取[start_date, end_date]区间内每条K线的(ts_code, trade_date)，不读取行情字段
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        ts_code（str）、trade_date（datetime64）
+    """
+    sql = f"""
+    SELECT ts_code, {_date_int_expr(engine.dialect.name)}
+    FROM cn_stock_daily
+    WHERE trade_date BETWEEN %s AND %s
+    """
+    code_parts, date_parts, _ = _fetch_typed(engine, [(sql, [start_date, end_date])], [])
+    if not code_parts:
+        return pd.DataFrame({'ts_code': pd.Series(dtype=object), 'trade_date': pd.Series(dtype='datetime64[ns]')})
+    return pd.DataFrame({
+        'ts_code': np.concatenate(code_parts),
+        'trade_date': parse_date_ints(np.concatenate(date_parts)),
+    })
+
+
+def read_history_starts(engine, ts_codes, before_date, n_bars, codes_per_query=1000):
+    """
+    查询每只股票在before_date之前倒数第n_bars根K线的日期（不足n_bars根时为最早一根）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    ts_codes : list
+        股票代码
+    before_date : str
+        截止日期（不含），格式为YYYYMMDD
+    n_bars : int
+        向前回看的K线根数
+    codes_per_query : int, 可选
+        每条查询包含的股票数上限，默认1000
+
+    返回值：
+    ----------
+    dict
+        {股票代码: YYYYMMDD字符串}；before_date之前没有K线的股票不在结果中
+    """
+    starts = {}
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(ts_codes), codes_per_query):
+            batch = list(ts_codes[i:i + codes_per_query])
+            sql = f"""
+            SELECT ts_code, MIN(date_int)
+            FROM (
+                SELECT ts_code, {_date_int_expr(engine.dialect.name)} AS date_int,
+                       ROW_NUMBER() OVER (PARTITION BY ts_code ORDER BY trade_date DESC) AS rn
+                FROM cn_stock_daily
+                WHERE trade_date < %s AND ts_code IN ({', '.join(['%s'] * len(batch))})
+            ) bars
+            WHERE rn <= %s
+            GROUP BY ts_code
+            """
+            if engine.dialect.name == 'sqlite':
+                sql = sql.replace('%s', '?')
+            cursor.execute(sql, [before_date, *batch, int(n_bars)])
+            starts.update({code: str(int(date_int)) for code, date_int in cursor.fetchall()})
+        cursor.close()
+    finally:
+        conn.close()
+    return starts
+
+
+def _row_signature_expr():
+    """单行内容签名的SQL表达式：ts_code与全部行情字段拼接后的CRC32（NULL写为空串，避免字段错位）"""
+    columns = ['ts_code'] + list(DAILY_FIELDS)
+    return "CRC32(CONCAT_WS('|', " + ', '.join(f"IFNULL({col}, '')" for col in columns) + "))"
+
+
+def read_day_fingerprints(engine, start_date, end_date):
+    """
+    按交易日汇总cn_stock_daily的内容指纹（行数|行签名异或|行签名合计）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        起止日期，格式为YYYYMMDD
+
+    返回值：
+    ----------
+    dict
+        {交易日(Timestamp): 指纹字符串}，行数为指纹的第一段
+
+    说明：
+    ----------
+    行签名覆盖ts_code与DAILY_FIELDS全部字段（选股公式读取的最低价、写入结果的开盘价/最高价/成交额等），
+    任一字段被修正后当日指纹随之变化；
+    SQLite（仅离线基准测试使用）没有CRC32，改为各字段合计
+    """
+    if engine.dialect.name == 'sqlite':
+        aggregates = ', '.join(f"TOTAL({col})" for col in DAILY_FIELDS)
+    else:
+        signature = _row_signature_expr()
+        aggregates = f"BIT_XOR({signature}), SUM({signature})"
+    sql = text(f"""
+    SELECT trade_date, COUNT(*) AS row_count, {aggregates}
+    FROM cn_stock_daily
+    WHERE trade_date BETWEEN :start_date AND :end_date
+    GROUP BY trade_date
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(sql, {"start_date": start_date, "end_date": end_date}).fetchall()
+    return {
+        pd.Timestamp(str(row[0])): '|'.join(str(value) for value in row[1:])
+        for row in rows
+    }
+
+
+def read_trade_days(engine, start_date, end_date):
+    """
+    读取cn_stock_daily中[start_date, end_date]区间内有数据的交易日
+
+    返回值：
+    ----------
+    pandas.DatetimeIndex
+        升序排列的交易日
+    """
+    sql = text("""
+    SELECT DISTINCT trade_date FROM cn_stock_daily
+    WHERE trade_date BETWEEN :start_date AND :end_date
+    ORDER BY trade_date
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(sql, {"start_date": start_date, "end_date": end_date}).fetchall()
+    return pd.DatetimeIndex([pd.Timestamp(str(row[0])) for row in rows])
@@ -31,6 +31,19 @@ def get_config(key, default=None):
         
     return default
 
+def get_cache_dir(*sub_dirs):
+    """
+    获取本地缓存目录（不存在则自动创建）
+
+    默认位于项目根目录下的 .cache，可通过配置项 CN_STOCK_CACHE_DIR 覆盖
+    """
+    base_dir = get_config('CN_STOCK_CACHE_DIR')
+    if not base_dir:
+        base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+    cache_dir = os.path.join(base_dir, *sub_dirs)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
 def get_db_engine():
     """获取数据库连接引擎"""
     db_host = get_config('DB_HOST')
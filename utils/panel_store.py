@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+内存映射的稠密行情面板（股票 × 交易日）
+====================
+功能说明：
+1. 由cn_stock_daily构建每个字段一个二进制文件（open/high/low/close/vol/amount），
+   按交易日对齐，停牌（当日无K线）为NaN；附带股票代码、交易日索引文件
+2. 磁盘按“交易日 × 股票容量”行优先存储：追加新交易日只需在文件末尾追加，不重写历史数据；
+   新股票占用预留的股票列，超出容量时才需要重建
+3. open_panel只做np.memmap映射，启动几乎零开销；返回[n_stocks, n_days]的零拷贝视图
+4. select_stocks_panel在面板上执行选股公式：REF按交易日偏移，停牌日为NaN，
+   不会像长表shift那样跨停牌错位
+5. 追加时按交易日指纹（daily_reader.read_day_fingerprints）复查最近recheck_days天，
+   cn_stock_daily中被修正的交易日在原位置重写（行优先存储，每个交易日是一段连续字节）
+
+目录结构（.cache/panel）：
+    meta.json      字段、数据类型、股票容量、股票数、交易日数
+    codes.txt      股票代码（按列序号排列，追加新股票时写在末尾）
+    dates.npy      交易日（datetime64[D]）
+    fingerprints.json  各交易日写入面板时的数据库指纹（YYYYMMDD -> 指纹）
+    <field>.bin    float64数组，形状[n_days, capacity]
+====================
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_cache_dir, get_db_engine
+    from daily_reader import read_daily_typed, read_day_fingerprints, read_trade_days
+    from tushare_select_stock import DEFAULT_THRESHOLDS, compute_buy_gold_dates, compute_conditions
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_cache_dir, get_db_engine
+    from utils.daily_reader import read_daily_typed, read_day_fingerprints, read_trade_days
+    from utils.tushare_select_stock import DEFAULT_THRESHOLDS, compute_buy_gold_dates, compute_conditions
+
+# 面板字段：公式变量名 -> cn_stock_daily字段名
+PANEL_FIELDS = {
+    'open': 'price_open',
+    'high': 'price_high',
+    'low': 'price_low',
+    'close': 'price_close',
+    'vol': 'vol',
+    'amount': 'amount',
+}
+PANEL_DTYPE = np.float64
+DEFAULT_CAPACITY = 8192
+# 追加时重新比对指纹的自然日天数（与daily_cache的recheck_days一致）
+DEFAULT_RECHECK_DAYS = 30
+
+
+# ========================== 元数据读写 ==========================
+def _panel_dir(panel_dir=None):
+    return panel_dir or get_cache_dir('panel')
+
+
+def _read_meta(panel_dir):
+    path = os.path.join(panel_dir, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_index(panel_dir, meta, codes, dates, fingerprints):
+    """先写索引文件，最后原子替换meta.json（meta中的计数决定可见的数据范围）"""
+    with open(os.path.join(panel_dir, 'codes.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(codes))
+    np.save(os.path.join(panel_dir, 'dates.npy'), np.asarray(dates, dtype='datetime64[D]'))
+    with open(os.path.join(panel_dir, 'fingerprints.json'), 'w', encoding='utf-8') as f:
+        json.dump(fingerprints, f)
+    tmp_path = os.path.join(panel_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(panel_dir, 'meta.json'))
+
+
+def _read_codes(panel_dir):
+    with open(os.path.join(panel_dir, 'codes.txt'), 'r', encoding='utf-8') as f:
+        content = f.read()
+    return content.split('\n') if content else []
+
+
+def _read_fingerprints(panel_dir):
+    """读取各交易日写入时的指纹（旧版面板没有该文件，复查窗口内的交易日会全部重写一次）"""
+    path = os.path.join(panel_dir, 'fingerprints.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _fingerprint_map(fingerprints):
+    """{Timestamp: 指纹} -> {YYYYMMDD: 指纹}"""
+    return {day.strftime('%Y%m%d'): fp for day, fp in fingerprints.items()}
+
+
+# ========================== 写入 ==========================
+def _build_blocks(capacity, codes, code_index, days, df):
+    """
+    将若干交易日的数据整理为{字段: [len(days), capacity]的块}
+
+    新出现的股票会追加到codes/code_index中（原地修改）
+    """
+    for code in pd.unique(df['ts_code'].astype(str)):
+        if code not in code_index:
+            code_index[code] = len(codes)
+            codes.append(code)
+    if len(codes) > capacity:
+        raise ValueError(f"股票数 {len(codes)} 超过面板容量 {capacity}，请使用更大的capacity重建面板")
+
+    day_pos = np.searchsorted(days.to_numpy(), df['trade_date'].to_numpy())
+    stock_pos = df['ts_code'].astype(str).map(code_index).to_numpy()
+    blocks = {}
+    for name, column in PANEL_FIELDS.items():
+        block = np.full((len(days), capacity), np.nan, dtype=PANEL_DTYPE)
+        block[day_pos, stock_pos] = df[column].to_numpy(dtype=PANEL_DTYPE)
+        blocks[name] = block
+    return blocks
+
+
+def _append_days(panel_dir, capacity, codes, code_index, days, df):
+    """将若干交易日的数据整理为[len(days), capacity]的块并追加到各字段文件末尾"""
+    if len(days) == 0:
+        return
+    for name, block in _build_blocks(capacity, codes, code_index, days, df).items():
+        with open(os.path.join(panel_dir, f"{name}.bin"), 'ab') as f:
+            f.write(block.tobytes())
+
+
+def _rewrite_days(panel_dir, capacity, codes, code_index, first_row, days, df):
+    """在原位置重写从第first_row个交易日开始的连续若干交易日（文件长度不变）"""
+    row_bytes = capacity * np.dtype(PANEL_DTYPE).itemsize
+    for name, block in _build_blocks(capacity, codes, code_index, days, df).items():
+        with open(os.path.join(panel_dir, f"{name}.bin"), 'r+b') as f:
+            f.seek(first_row * row_bytes)
+            f.write(block.tobytes())
+
+
+def _recheck_days(engine, panel_dir, capacity, codes, dates, stored_fps, db_fps, check_from):
+    """
+    比对面板中check_from及之后交易日的指纹，重写与数据库不一致的交易日
+
+    数据库中已删除的交易日整行重写为NaN；返回重写的交易日数
+    """
+    panel_days = pd.DatetimeIndex(dates)
+    rows = np.nonzero(panel_days >= pd.Timestamp(check_from))[0]
+    changed = [row for row in rows
+               if stored_fps.get(panel_days[row].strftime('%Y%m%d')) != db_fps.get(panel_days[row])]
+    if not changed:
+        return 0
+
+    code_index = {code: i for i, code in enumerate(codes)}
+    # 连续的交易日合并为一次读取与写入
+    breaks = np.nonzero(np.diff(changed) > 1)[0] + 1
+    for run in np.split(np.array(changed), breaks):
+        run_days = panel_days[run[0]:run[-1] + 1]
+        df = read_daily_typed(engine, run_days[0].strftime('%Y%m%d'), run_days[-1].strftime('%Y%m%d'),
+                              fields=list(PANEL_FIELDS.values()), verbose=False)
+        df = df[df['trade_date'].isin(run_days)]
+        _rewrite_days(panel_dir, capacity, codes, code_index, int(run[0]), run_days, df)
+        print(f"   面板重写 {run_days[0]:%Y%m%d} - {run_days[-1]:%Y%m%d}：{len(run_days)} 个交易日，{len(df):,} 行")
+    return len(changed)
+
+
+def build_panel(engine, start_date, end_date=None, panel_dir=None, capacity=DEFAULT_CAPACITY):
+    """
+    从cn_stock_daily重建面板（按年分批读取，内存占用与单年数据量相当）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        起止日期，格式为YYYYMMDD；end_date默认今天
+    panel_dir : str, 可选
+        面板目录，默认 .cache/panel
+    capacity : int, 可选
+        预留的股票列数，默认8192
+    """
+    panel_dir = _panel_dir(panel_dir)
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    for name in list(PANEL_FIELDS) + ['meta.json']:
+        path = os.path.join(panel_dir, name if name.endswith('.json') else f"{name}.bin")
+        if os.path.exists(path):
+            os.remove(path)
+
+    trade_days = read_trade_days(engine, start_date, end_date)
+    codes, code_index = [], {}
+    for year in sorted(set(trade_days.year)):
+        year_days = trade_days[trade_days.year == year]
+        df = read_daily_typed(engine, year_days[0].strftime('%Y%m%d'), year_days[-1].strftime('%Y%m%d'),
+                              fields=list(PANEL_FIELDS.values()), verbose=False)
+        _append_days(panel_dir, capacity, codes, code_index, year_days, df)
+        print(f"   面板写入 {year} 年：{len(year_days)} 个交易日，{len(df):,} 行")
+
+    meta = {'fields': list(PANEL_FIELDS), 'dtype': np.dtype(PANEL_DTYPE).str, 'capacity': capacity,
+            'n_stocks': len(codes), 'n_days': len(trade_days)}
+    fingerprints = _fingerprint_map(read_day_fingerprints(engine, start_date, end_date))
+    _write_index(panel_dir, meta, codes, trade_days.to_numpy(), fingerprints)
+    print(f"✅ 面板构建完成：{len(codes)} 只股票 × {len(trade_days)} 个交易日")
+
+
+def append_panel(engine, end_date=None, panel_dir=None, recheck_days=DEFAULT_RECHECK_DAYS):
+    """
+    追加面板最后一个交易日之后的新交易日（只在文件末尾追加，不重写历史数据），
+    并复查最近recheck_days天：指纹与数据库不一致（数据被修正或补录）的交易日在原位置重写；
+    复查窗口内数据库有、面板没有的交易日（事后补录的整日数据）无法原位插入，
+    从该交易日起截断面板后重新追加
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    end_date : str, 可选
+        追加到该日期为止，格式为YYYYMMDD，默认今天
+    panel_dir : str, 可选
+        面板目录，默认 .cache/panel
+    recheck_days : int, 可选
+        面板最后一个交易日之前重新比对指纹的自然日天数，默认30；None表示复查全部交易日
+
+    返回值：
+    ----------
+    int
+        追加的交易日数（含截断后重新追加的交易日）
+    """
+    panel_dir = _panel_dir(panel_dir)
+    meta = _read_meta(panel_dir)
+    if meta is None:
+        raise FileNotFoundError("面板不存在，请先执行build_panel")
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+
+    dates = np.load(os.path.join(panel_dir, 'dates.npy'))[:meta['n_days']]
+    codes = _read_codes(panel_dir)[:meta['n_stocks']]
+    stored_fps = _read_fingerprints(panel_dir)
+    next_day = (pd.Timestamp(dates[-1]) + pd.Timedelta(days=1)).strftime('%Y%m%d') if len(dates) else '19900101'
+    if not len(dates):
+        check_from = next_day
+    elif recheck_days is None:
+        check_from = pd.Timestamp(dates[0]).strftime('%Y%m%d')
+    else:
+        check_from = (pd.Timestamp(dates[-1]) - pd.Timedelta(days=recheck_days)).strftime('%Y%m%d')
+
+    # 一次读取复查窗口与新交易日的指纹
+    db_fps = read_day_fingerprints(engine, check_from, end_date)
+
+    # 面板范围内补录的交易日：从最早的一个起截断，之后的交易日全部重新追加
+    panel_days = set(pd.DatetimeIndex(dates))
+    missing = sorted(day for day in db_fps if day < pd.Timestamp(next_day) and day not in panel_days)
+    if missing:
+        keep = int(np.searchsorted(dates, np.datetime64(missing[0], 'D')))
+        print(f"   面板缺少补录的交易日 {missing[0]:%Y%m%d} 等 {len(missing)} 个，"
+              f"从该日起截断 {len(dates) - keep} 个交易日后重新追加")
+        dates = dates[:keep]
+        meta['n_days'] = keep
+        stored_fps = {day: fp for day, fp in stored_fps.items() if day < missing[0].strftime('%Y%m%d')}
+        next_day = missing[0].strftime('%Y%m%d')
+    new_days = pd.DatetimeIndex(sorted(day for day in db_fps if day >= pd.Timestamp(next_day)))
+
+    # 截掉上次追加失败可能残留的多余数据，保证文件长度与meta一致
+    row_bytes = meta['capacity'] * np.dtype(meta['dtype']).itemsize
+    for name in meta['fields']:
+        with open(os.path.join(panel_dir, f"{name}.bin"), 'r+b') as f:
+            f.truncate(meta['n_days'] * row_bytes)
+
+    rewritten = _recheck_days(engine, panel_dir, meta['capacity'], codes, dates, stored_fps, db_fps, check_from)
+
+    df = pd.DataFrame(columns=['ts_code', 'trade_date'])
+    if len(new_days):
+        df = read_daily_typed(engine, new_days[0].strftime('%Y%m%d'), new_days[-1].strftime('%Y%m%d'),
+                              fields=list(PANEL_FIELDS.values()), verbose=False)
+        code_index = {code: i for i, code in enumerate(codes)}
+        _append_days(panel_dir, meta['capacity'], codes, code_index, new_days, df)
+    if not len(new_days) and not rewritten:
+        print("⚠️ 没有需要追加或重写的交易日")
+        return 0
+
+    # 复查窗口与新交易日的指纹以数据库为准，更早的交易日沿用已保存的指纹
+    stored_fps.update(_fingerprint_map(db_fps))
+    meta['n_stocks'] = len(codes)
+    meta['n_days'] = len(dates) + len(new_days)
+    _write_index(panel_dir, meta, codes, np.concatenate([dates, new_days.to_numpy().astype('datetime64[D]')]),
+                 stored_fps)
+    print(f"✅ 面板追加 {len(new_days)} 个交易日（{len(df):,} 行），重写 {rewritten} 个交易日，"
+          f"当前 {meta['n_stocks']} 只股票 × {meta['n_days']} 个交易日")
+    return len(new_days)
+
+
+# ========================== 读取 ==========================
+def open_panel(panel_dir=None):
+    """
+    以内存映射方式打开面板（不读取数据，只建立映射）
+
+    返回值：
+    ----------
+    dict
+        - codes: numpy.ndarray，股票代码
+        - dates: pandas.DatetimeIndex，交易日
+        - fields: {字段名: [n_stocks, n_days]的只读零拷贝视图}
+    """
+    panel_dir = _panel_dir(panel_dir)
+    meta = _read_meta(panel_dir)
+    if meta is None:
+        raise FileNotFoundError("面板不存在，请先执行build_panel")
+    n_days, n_stocks, capacity = meta['n_days'], meta['n_stocks'], meta['capacity']
+    fields = {}
+    for name in meta['fields']:
+        if n_days == 0:
+            fields[name] = np.empty((n_stocks, 0), dtype=meta['dtype'])
+            continue
+        mapped = np.memmap(os.path.join(panel_dir, f"{name}.bin"), dtype=meta['dtype'], mode='r',
+                           shape=(n_days, capacity))
+        fields[name] = mapped[:, :n_stocks].T
+    return {
+        'codes': np.array(_read_codes(panel_dir)[:n_stocks], dtype=object),
+        'dates': pd.DatetimeIndex(np.load(os.path.join(panel_dir, 'dates.npy'))[:n_days]),
+        'fields': fields,
+    }
+
+
+def panel_window(panel, start_date, end_date, lookback=0):
+    """
+    取[start_date, end_date]（向前多取lookback个交易日）的交易日切片，返回(起始列, 结束列)
+    """
+    dates = panel['dates']
+    lo = max(dates.searchsorted(pd.Timestamp(start_date), side='left') - lookback, 0)
+    hi = dates.searchsorted(pd.Timestamp(end_date), side='right')
+    return lo, hi
+
+
+def _panel_ref(window):
+    """二维面板上的REF：沿交易日轴偏移，前n列为NaN"""
+    cache = {}
+
+    def ref(name, n):
+        key = (name, n)
+        if key not in cache:
+            values = window[name]
+            if n == 0:
+                cache[key] = values
+            else:
+                shifted = np.full(values.shape, np.nan, dtype=values.dtype)
+                shifted[:, n:] = values[:, :-n]
+                cache[key] = shifted
+        return cache[key]
+
+    return ref
+
+
+def select_stocks_panel(panel, start_date, end_date, d1=0, **thresholds):
+    """
+    在面板上执行选股公式（REF按交易日对齐，停牌日为NaN）
+
+    参数说明：
+    ----------
+    panel : dict
+        open_panel的返回值
+    start_date / end_date : str
+        评估区间，格式为YYYYMMDD（会自动向前多取d1+4个交易日作为回看）
+    d1 / **thresholds :
+        同select_stocks
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        入选记录：ts_code, trade_date, 面板字段对应的行情列, buy_date, gold_date（按ts_code、trade_date升序）
+    """
+    lookback = d1 + 4
+    lo, hi = panel_window(panel, start_date, end_date, lookback=lookback)
+    eval_lo = panel_window(panel, start_date, end_date)[0] - lo
+    window = {name: panel['fields'][name][:, lo:hi] for name in ('close', 'vol', 'low')}
+    params = {**DEFAULT_THRESHOLDS, **thresholds}
+    with np.errstate(invalid='ignore'):
+        mask = np.logical_and.reduce(compute_conditions(_panel_ref(window), d1=d1, **params))
+    mask[:, :eval_lo] = False
+
+    stock_idx, day_idx = np.nonzero(mask)
+    if len(stock_idx) == 0:
+        return pd.DataFrame()
+    Stock_Selected = pd.DataFrame({
+        'ts_code': panel['codes'][stock_idx],
+        'trade_date': panel['dates'][lo + day_idx],
+    })
+    for name, column in PANEL_FIELDS.items():
+        Stock_Selected[column] = panel['fields'][name][stock_idx, lo + day_idx]
+    Stock_Selected = Stock_Selected.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    Stock_Selected['buy_date'], Stock_Selected['gold_date'] = compute_buy_gold_dates(
+        Stock_Selected['trade_date'], d1=d1
+    )
+    return Stock_Selected
+
+
+# ========================== 命令行入口 ==========================
+if __name__ == "__main__":
+    # 用法：python utils/panel_store.py build 20200101 [20251231] / python utils/panel_store.py append [20251231] [30]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'append'
+    engine = get_db_engine()
+    try:
+        if command == 'build':
+            build_panel(engine, sys.argv[2] if len(sys.argv) > 2 else '20000101',
+                        sys.argv[3] if len(sys.argv) > 3 else None)
+        else:
+            append_panel(engine, sys.argv[2] if len(sys.argv) > 2 else None,
+                         recheck_days=int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_RECHECK_DAYS)
+    finally:
+        engine.dispose()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+多进程分片选股
+====================
+功能说明：
+1. 将排序后的全市场数组按股票边界切分为若干分片（每只股票只属于一个分片）
+2. 价格/成交量/组内序号数组放入共享内存（multiprocessing.shared_memory），
+   子进程按名称挂载后直接切片使用，不序列化DataFrame
+3. 子进程只返回命中行号，主进程合并后生成与select_stocks完全一致的结果表
+
+适用场景：2000年至今的全历史回测等大数据量选股
+====================
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入选股模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from tushare_select_stock import (
+        DEFAULT_THRESHOLDS, compute_buy_gold_dates, compute_conditions, make_ref, prepare_panel, restrict_to_universe
+    )
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.tushare_select_stock import (
+        DEFAULT_THRESHOLDS, compute_buy_gold_dates, compute_conditions, make_ref, prepare_panel, restrict_to_universe
+    )
+
+
+# ========================== 共享内存辅助函数 ==========================
+def _to_shared(array):
+    """将数组复制到新建的共享内存块，返回(共享内存对象, 描述信息)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[:] = array
+    return shm, (shm.name, array.dtype.str, array.shape)
+
+
+def _attach(spec):
+    """子进程按描述信息挂载共享内存，返回(共享内存对象, 数组视图)"""
+    name, dtype, shape = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def split_shards(positions, n_shards):
+    """
+    按股票边界把行区间切分为行数大致相等的分片
+
+    参数说明：
+    ----------
+    positions : numpy.ndarray
+        组内序号（prepare_panel的返回值）
+    n_shards : int
+        期望的分片数
+
+    返回值：
+    ----------
+    list
+        [(起始行, 结束行)]，左闭右开
+    """
+    n_rows = len(positions)
+    group_starts = np.flatnonzero(positions == 0)
+    targets = np.linspace(0, n_rows, n_shards + 1)[1:-1]
+    # 每个切分点向后对齐到最近的股票起始行
+    cuts = group_starts[np.minimum(np.searchsorted(group_starts, targets), len(group_starts) - 1)]
+    bounds = np.unique(np.concatenate([[0], cuts, [n_rows]]))
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+# ========================== 子进程任务 ==========================
+def _select_shard(task):
+    """
+    在单个分片上计算选股条件
+
+    参数说明：
+    ----------
+    task : dict
+        specs（共享数组描述）、lo/hi（分片行区间）、d1、thresholds
+
+    返回值：
+    ----------
+    numpy.ndarray
+        命中行在全市场数组中的行号
+    """
+    handles = []
+    try:
+        views = {}
+        for name, spec in task['specs'].items():
+            shm, array = _attach(spec)
+            handles.append(shm)
+            views[name] = array[task['lo']:task['hi']]
+        positions = views.pop('positions')
+        ref = make_ref(views, positions)
+        mask = np.logical_and.reduce(compute_conditions(ref, d1=task['d1'], **task['thresholds']))
+        return np.flatnonzero(mask) + task['lo']
+    finally:
+        # 释放数组视图后再关闭共享内存
+        views = ref = positions = None
+        for shm in handles:
+            shm.close()
+
+
+# ========================== 并行选股主流程 ==========================
+def select_stocks_parallel(df, d1=0, workers=None, eval_dates=None, universe=None, **thresholds):
+    """
+    多进程分片版select_stocks，参数与返回值同select_stocks
+
+    参数说明：
+    ----------
+    workers : int, 可选
+        进程数（同时也是分片数），默认CPU核数
+    """
+    if universe is not None:
+        df = restrict_to_universe(df, universe, eval_dates)
+    if df.empty:
+        return pd.DataFrame()
+
+    start_time = time.time()
+    df, positions, arrays = prepare_panel(df)
+    workers = workers or os.cpu_count() or 1
+    shards = split_shards(positions, workers)
+
+    owned = []
+    try:
+        specs = {}
+        for name, array in {**arrays, 'positions': positions}.items():
+            shm, spec = _to_shared(np.ascontiguousarray(array))
+            owned.append(shm)
+            specs[name] = spec
+
+        params = {**DEFAULT_THRESHOLDS, **thresholds}
+        tasks = [
+            {'specs': specs, 'lo': lo, 'hi': hi, 'd1': d1, 'thresholds': params}
+            for lo, hi in shards
+        ]
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            shard_hits = list(pool.map(_select_shard, tasks))
+    finally:
+        for shm in owned:
+            shm.close()
+            shm.unlink()
+
+    # 分片按行区间顺序返回，拼接后即为全市场有序行号
+    hit_index = np.concatenate(shard_hits) if shard_hits else np.empty(0, dtype=np.int64)
+    final_condition = np.zeros(len(df), dtype=bool)
+    final_condition[hit_index] = True
+    if eval_dates is not None:
+        final_condition &= df['trade_date'].isin(pd.to_datetime(eval_dates)).to_numpy()
+    if universe is not None:
+        final_condition &= universe(df['ts_code'], df['trade_date'])
+    print(f"   并行选股：{len(shards)} 个分片，{len(df):,} 行，耗时 {time.time() - start_time:.2f} 秒")
+    if not final_condition.any():
+        return pd.DataFrame()
+
+    Stock_Selected = df[final_condition].reset_index(drop=True)
+    Stock_Selected['buy_date'], Stock_Selected['gold_date'] = compute_buy_gold_dates(
+        Stock_Selected['trade_date'], d1=d1
+    )
+    return Stock_Selected
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+周线 / 月线K线表（由cn_stock_daily聚合生成）
+====================
+功能说明：
+1. cn_stock_weekly / cn_stock_monthly 字段与cn_stock_daily相同，每只股票每个周期一行：
+   trade_date为该周期最后一个交易日；开盘价取首日开盘、收盘价取末日收盘、最高/最低取极值，
+   前收盘价取首日前收盘，成交量/成交额为合计，涨跌额/涨跌幅按周期收盘价与前收盘价重新计算
+2. 增量刷新：只重算与给定日期区间相交的周期（日常运行即当前周/当前月），
+   删除这些周期的旧行与写入新行在同一事务内完成（周期内新增交易日后trade_date会后移，不能只做upsert；
+   同一事务保证读取方不会看到周期K线缺失的中间状态）
+3. 表为空时（无论是否指定起始日期）按年分批从全部日线历史构建（分批边界与周期对齐）
+4. 读取与日线共用同一接口：load_stock_data(start, end, freq='W'/'M')、read_daily_typed(..., freq='W'/'M')
+5. tushare_update_daily.py写入日线后自动刷新涉及的周期
+
+命令行用法：
+    python utils/period_bars.py refresh [--freq W,M] [--start 20250101] [--end 20251231]
+    python utils/period_bars.py rebuild [--freq W,M]
+====================
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, log_task_execution
+    from daily_reader import BAR_TABLES, DAILY_FIELDS, read_daily_typed
+    from bulk_writer import bulk_upsert
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.daily_reader import BAR_TABLES, DAILY_FIELDS, read_daily_typed
+    from utils.bulk_writer import bulk_upsert
+
+PERIOD_FREQS = ('W', 'M')
+PERIOD_NAMES = {'W': '周线', 'M': '月线'}
+
+
+# ========================== 周期划分 ==========================
+def period_starts(dates, freq):
+    """
+    各日期所属周期的起始日（周线为周一，月线为当月1日）
+
+    返回值：
+    ----------
+    numpy.ndarray
+        datetime64[D]数组
+    """
+    days = np.asarray(pd.to_datetime(dates).to_numpy(), dtype='datetime64[D]')
+    if freq == 'W':
+        # 1970-01-01为周四，(天数 + 3) % 7 即周一为0的星期序号
+        weekday = (days.astype(np.int64) + 3) % 7
+        return days - weekday.astype('timedelta64[D]')
+    if freq == 'M':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"不支持的K线周期: {freq}")
+
+
+def period_bounds(start_date, end_date, freq):
+    """把[start_date, end_date]扩展为完整周期，返回(周期起始日, 周期结束日)的YYYYMMDD字符串"""
+    first = period_starts([pd.Timestamp(start_date)], freq)[0]
+    last = period_starts([pd.Timestamp(end_date)], freq)[0]
+    if freq == 'W':
+        last_end = last + np.timedelta64(6, 'D')
+    else:
+        next_month = (last.astype('datetime64[M]') + np.timedelta64(1, 'M')).astype('datetime64[D]')
+        last_end = next_month - np.timedelta64(1, 'D')
+    return pd.Timestamp(first).strftime('%Y%m%d'), pd.Timestamp(last_end).strftime('%Y%m%d')
+
+
+def aggregate_bars(daily, freq):
+    """
+    将日线聚合为周线/月线
+
+    参数说明：
+    ----------
+    daily : pandas.DataFrame
+        read_daily_typed/load_stock_data返回的日线数据（需包含完整周期的全部交易日）
+    freq : str
+        W（周线）或 M（月线）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        字段与cn_stock_daily相同，按ts_code、trade_date升序排列
+    """
+    columns = ['ts_code', 'trade_date'] + list(DAILY_FIELDS)
+    if daily.empty:
+        return pd.DataFrame(columns=columns)
+    df = daily.sort_values(['ts_code', 'trade_date'], kind='mergesort')
+    df = df.assign(period=period_starts(df['trade_date'], freq))
+    bars = df.groupby(['ts_code', 'period'], sort=True, observed=True).agg(
+        trade_date=('trade_date', 'last'),
+        price_open=('price_open', 'first'),
+        price_high=('price_high', 'max'),
+        price_low=('price_low', 'min'),
+        price_close=('price_close', 'last'),
+        price_pre_close=('price_pre_close', 'first'),
+        vol=('vol', 'sum'),
+        amount=('amount', 'sum'),
+    ).reset_index()
+    bars['amt_chg'] = (bars['price_close'] - bars['price_pre_close']).round(4)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bars['pct_chg'] = (bars['amt_chg'] / bars['price_pre_close'] * 100).round(4)
+    bars['pct_chg'] = bars['pct_chg'].replace([np.inf, -np.inf], np.nan)
+    bars['ts_code'] = bars['ts_code'].astype(str)
+    return bars[columns]
+
+
+# ========================== 建表与刷新 ==========================
+def ensure_period_table(engine, freq):
+    """确保周线/月线表存在（字段与cn_stock_daily相同）"""
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {BAR_TABLES[freq]} (
+            ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+            trade_date DATE NOT NULL COMMENT '周期内最后一个交易日',
+            price_open DECIMAL(20, 4) COMMENT '开盘价',
+            price_high DECIMAL(20, 4) COMMENT '最高价',
+            price_low DECIMAL(20, 4) COMMENT '最低价',
+            price_close DECIMAL(20, 4) COMMENT '收盘价',
+            price_pre_close DECIMAL(20, 4) COMMENT '昨收价',
+            amt_chg DECIMAL(20, 4) COMMENT '涨跌额',
+            pct_chg DECIMAL(20, 4) COMMENT '涨跌幅',
+            vol DECIMAL(20, 4) COMMENT '成交量',
+            amount DECIMAL(20, 4) COMMENT '成交额',
+            PRIMARY KEY (ts_code, trade_date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT '{PERIOD_NAMES[freq]}'
+        """))
+        conn.commit()
+
+
+def _refresh_range(engine, freq, start_date, end_date):
+    """在同一事务内删除并重算[start_date, end_date]（已与周期对齐）内的周期K线，返回写入统计"""
+    table = BAR_TABLES[freq]
+    daily = read_daily_typed(engine, start_date, end_date, verbose=False)
+    bars = aggregate_bars(daily, freq)
+    bars['trade_date'] = pd.to_datetime(bars['trade_date']).dt.strftime('%Y%m%d')
+    # 起止日期由period_bounds生成（YYYYMMDD），直接写入语句
+    delete_sql = f"DELETE FROM {table} WHERE trade_date BETWEEN '{start_date}' AND '{end_date}'"
+    stats = bulk_upsert(engine, table, bars, key_columns=['ts_code', 'trade_date'], verbose=False,
+                        pre_statements=[delete_sql])
+    stats['daily_rows'] = len(daily)
+    return stats
+
+
+def refresh_period_bars(engine, freq, start_date=None, end_date=None):
+    """
+    增量刷新周线或月线表
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    freq : str
+        W（周线）或 M（月线）
+    start_date / end_date : str, 可选
+        日线有变化的日期区间（YYYYMMDD），自动扩展为完整周期；
+        start_date默认取表中最后一根K线所在周期的起始日（即只重算当前周期及之后）；
+        表为空时忽略start_date，从日线最早日期开始按年分批构建；end_date默认今天
+
+    返回值：
+    ----------
+    dict
+        periods_from / periods_to（刷新的日期范围）、daily_rows（读取的日线行数）、rows（写入的周期K线数）、seconds
+    """
+    table = BAR_TABLES[freq]
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    start_time = time.time()
+
+    with engine.connect() as conn:
+        last_date = conn.execute(text(f"SELECT MAX(trade_date) FROM {table}")).scalar()
+        # 表为空时只刷新给定区间会得到残缺的历史，改为全量构建
+        build_all = last_date is None
+        if build_all:
+            last_date = conn.execute(text("SELECT MIN(trade_date) FROM cn_stock_daily")).scalar()
+    if build_all or start_date is None:
+        if last_date is None:
+            print(f"⚠️ cn_stock_daily 没有数据，跳过{PERIOD_NAMES[freq]}刷新")
+            return {'periods_from': None, 'periods_to': None, 'daily_rows': 0, 'rows': 0, 'seconds': 0.0}
+        if build_all:
+            print(f"ℹ️ {table} 为空，从日线最早日期开始全量构建")
+        start_date = pd.Timestamp(str(last_date)).strftime('%Y%m%d')
+    range_start, range_end = period_bounds(start_date, end_date, freq)
+
+    # 按年分批（边界与周期对齐），控制单批读取的日线行数
+    chunks = [(range_start, range_end)]
+    if build_all:
+        chunks = []
+        chunk_start = pd.Timestamp(range_start)
+        while chunk_start <= pd.Timestamp(range_end):
+            # 下一批从次年1月1日所在周期开始（周线的该周一可能落在上一年）
+            year = chunk_start.year + 1
+            boundary = pd.Timestamp(period_starts([pd.Timestamp(year=year, month=1, day=1)], freq)[0])
+            if boundary <= chunk_start:
+                boundary = pd.Timestamp(period_starts([pd.Timestamp(year=year + 1, month=1, day=1)], freq)[0])
+            chunk_end = min(boundary - pd.Timedelta(days=1), pd.Timestamp(range_end))
+            chunks.append((chunk_start.strftime('%Y%m%d'), chunk_end.strftime('%Y%m%d')))
+            chunk_start = chunk_end + pd.Timedelta(days=1)
+
+    summary = {'periods_from': range_start, 'periods_to': range_end, 'daily_rows': 0, 'rows': 0}
+    for chunk_start, chunk_end in chunks:
+        stats = _refresh_range(engine, freq, chunk_start, chunk_end)
+        summary['daily_rows'] += stats['daily_rows']
+        summary['rows'] += stats['rows']
+        if build_all:
+            print(f"   {PERIOD_NAMES[freq]} {chunk_start} - {chunk_end}：{stats['rows']:,} 行")
+    summary['seconds'] = time.time() - start_time
+    print(f"✅ {PERIOD_NAMES[freq]}刷新 {range_start} - {range_end}：读取日线 {summary['daily_rows']:,} 行，"
+          f"写入 {summary['rows']:,} 行，耗时 {summary['seconds']:.2f} 秒")
+    return summary
+
+
+def refresh_all_period_bars(engine, start_date=None, end_date=None, freqs=PERIOD_FREQS):
+    """依次刷新周线与月线（参数同refresh_period_bars）"""
+    return {freq: refresh_period_bars(engine, freq, start_date, end_date) for freq in freqs}
+
+
+# ========================== 命令行入口 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="周线/月线K线表维护")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    refresh_parser = subparsers.add_parser('refresh', help='增量刷新（默认只重算当前周期）')
+    refresh_parser.add_argument('--freq', default='W,M', help='逗号分隔的周期：W,M')
+    refresh_parser.add_argument('--start', default=None, help='日线有变化的起始日期 YYYYMMDD')
+    refresh_parser.add_argument('--end', default=None, help='结束日期 YYYYMMDD，默认今天')
+
+    rebuild_parser = subparsers.add_parser('rebuild', help='清空后从全部日线历史重建')
+    rebuild_parser.add_argument('--freq', default='W,M', help='逗号分隔的周期：W,M')
+
+    args = parser.parse_args()
+    engine = get_db_engine()
+    freqs = [freq.strip().upper() for freq in args.freq.split(',') if freq.strip()]
+    try:
+        for freq in freqs:
+            ensure_period_table(engine, freq)
+            if args.command == 'rebuild':
+                with engine.connect() as conn:
+                    conn.execute(text(f"DELETE FROM {BAR_TABLES[freq]}"))
+                    conn.commit()
+                refresh_period_bars(engine, freq)
+            else:
+                refresh_period_bars(engine, freq, args.start, args.end)
+        log_task_execution("周期K线", "SUCCESS", f"{args.command} {','.join(freqs)} 完成")
+    except Exception as e:
+        print(f"❌ 周期K线刷新失败: {e}")
+        log_task_execution("周期K线", "FAIL", str(e))
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+选股引擎基准测试（合成数据，离线运行）
+====================
+功能说明：
+1. 确定性生成合成日线数据（股票数 × 年数可配置，含停牌区间、次新股上市、涨停日），
+   写入本地SQLite（或通过--db-url指定的独立MySQL测试库）的cn_stock_daily表
+2. 分阶段计时：load_stock_data / select_stocks / select_stocks_streaming / 结果批量写入，
+   记录每个阶段的耗时、峰值内存（RSS）与吞吐（行/秒），输出为JSON
+3. 与保存的基线比较，任一阶段耗时（或峰值内存）超过基线一定比例时返回非零退出码
+
+使用方法：
+    python utils/select_benchmark.py --stocks 5000 --years 10 --save-baseline   # 生成基线
+    python utils/select_benchmark.py --stocks 5000 --years 10                   # 与基线比较
+
+说明：
+- 合成数据按周一至周五生成交易日，与真实交易日历无关；相同参数与种子生成的数据完全一致
+- SQLite数据库按参数缓存在 <缓存目录>/benchmark 下，重复运行直接复用（--rebuild 强制重建）
+- 结果写入阶段写入独立的stock_selected_benchmark表，不会影响stock_selected
+====================
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# 添加当前目录到系统路径，以便导入选股模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+# 选股模块导入时会按配置创建数据库引擎（不会实际连接），离线运行时补齐占位配置；
+# 基准测试固定读取数据库，不走本地日线缓存
+for _key, _value in {'DB_HOST': 'localhost', 'DB_USER': 'benchmark',
+                     'DB_PASSWORD': 'benchmark', 'DB_NAME': 'benchmark'}.items():
+    os.environ.setdefault(_key, _value)
+os.environ['USE_DAILY_CACHE'] = '0'
+
+try:
+    import tushare_select_stock as select_module
+    from bulk_writer import bulk_upsert
+    from db_utils import get_cache_dir
+    from tushare_fetcher import StageTimer
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    import utils.tushare_select_stock as select_module
+    from utils.bulk_writer import bulk_upsert
+    from utils.db_utils import get_cache_dir
+    from utils.tushare_fetcher import StageTimer
+
+STAGES = ('load_stock_data', 'select_stocks', 'select_streaming', 'result_write')
+# 合成数据的最后一个交易日（保证在chinese_calendar支持的年份内，buy_date/gold_date可正常换算）
+SYNTHETIC_END_DATE = '20241231'
+# 每批生成的股票数（随机数按批次独立播种，结果与总股票数无关）
+GENERATE_BLOCK = 500
+BENCHMARK_TABLE = 'stock_selected_benchmark'
+
+
+# ========================== 合成数据 ==========================
+def synthetic_codes(n_stocks):
+    """按沪主板/深主板/创业板/科创板轮换生成股票代码"""
+    prefixes = [(600000, 'SH'), (0, 'SZ'), (300000, 'SZ'), (688000, 'SH')]
+    codes = []
+    for i in range(n_stocks):
+        base, market = prefixes[i % len(prefixes)]
+        codes.append(f"{base + i // len(prefixes) + 1:06d}.{market}")
+    return codes
+
+
+def iter_synthetic_daily(n_stocks=5000, years=10, seed=42, suspend_rate=0.002, limit_up_rate=0.01,
+                         end_date=SYNTHETIC_END_DATE):
+    """
+    按股票分批生成合成日线数据
+
+    参数说明：
+    ----------
+    n_stocks : int
+        股票数量，默认5000
+    years : int
+        年数，默认10
+    seed : int
+        随机种子，默认42
+    suspend_rate : float
+        每个交易日开始停牌的概率（停牌持续1-20个交易日），默认0.002
+    limit_up_rate : float
+        每个交易日涨停（+10%，收盘即最高）的概率，默认0.01
+    end_date : str
+        最后一个交易日，格式为YYYYMMDD
+
+    返回值：
+    ----------
+    generator of pandas.DataFrame
+        字段与cn_stock_daily一致，trade_date为YYYYMMDD字符串，按ts_code、trade_date排序
+    """
+    end = pd.Timestamp(end_date)
+    days = pd.bdate_range(end - pd.DateOffset(years=years) + pd.Timedelta(days=1), end)
+    day_strs = np.array(days.strftime('%Y%m%d'))
+    n_days = len(days)
+    codes = np.array(synthetic_codes(n_stocks))
+
+    for block_idx, lo in enumerate(range(0, n_stocks, GENERATE_BLOCK)):
+        hi = min(lo + GENERATE_BLOCK, n_stocks)
+        n = hi - lo
+        rng = np.random.default_rng([seed, block_idx])
+
+        # 日收益：正态扰动，按概率设置涨停日，并限制在±10%以内
+        returns = rng.normal(0.0003, 0.025, (n, n_days))
+        limit_up = rng.random((n, n_days)) < limit_up_rate
+        returns = np.where(limit_up, 0.10, np.clip(returns, -0.10, 0.10))
+        base_price = rng.uniform(3, 80, (n, 1))
+        close = np.round(base_price * np.cumprod(1 + returns, axis=1), 2)
+        pre_close = np.concatenate([base_price.round(2), close[:, :-1]], axis=1)
+        open_ = np.round(pre_close * (1 + rng.normal(0, 0.01, (n, n_days))), 2)
+        high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, (n, n_days)))), 2)
+        low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, (n, n_days)))), 2)
+        # 涨停日收盘即最高价
+        high = np.where(limit_up, close, high)
+        vol = np.round(rng.lognormal(11, 0.7, (n, n_days)), 2)
+
+        # 停牌区间：差分数组标记每段停牌的起止，累加后大于0即停牌
+        starts = np.argwhere(rng.random((n, n_days)) < suspend_rate)
+        lengths = rng.integers(1, 21, len(starts))
+        marks = np.zeros((n, n_days + 1), dtype=np.int32)
+        np.add.at(marks, (starts[:, 0], starts[:, 1]), 1)
+        np.add.at(marks, (starts[:, 0], np.minimum(starts[:, 1] + lengths, n_days)), -1)
+        keep = np.cumsum(marks[:, :-1], axis=1) == 0
+        # 约20%的股票在区间内才上市
+        listing = np.where(rng.random(n) < 0.2, rng.integers(0, n_days, n), 0)
+        keep &= np.arange(n_days)[None, :] >= listing[:, None]
+
+        rows, cols = np.nonzero(keep)
+        amt_chg = close - pre_close
+        yield pd.DataFrame({
+            'ts_code': codes[lo:hi][rows],
+            'trade_date': day_strs[cols],
+            'price_open': open_[rows, cols],
+            'price_high': high[rows, cols],
+            'price_low': low[rows, cols],
+            'price_close': close[rows, cols],
+            'price_pre_close': pre_close[rows, cols],
+            'amt_chg': np.round(amt_chg[rows, cols], 2),
+            'pct_chg': np.round(amt_chg[rows, cols] / pre_close[rows, cols] * 100, 4),
+            'vol': vol[rows, cols],
+            'amount': np.round(vol[rows, cols] * close[rows, cols] * 100, 2),
+        })
+
+
+def build_benchmark_db(engine, config):
+    """
+    创建cn_stock_daily表并写入合成数据
+
+    返回值：
+    ----------
+    int
+        写入的行数
+    """
+    with engine.connect() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cn_stock_daily (
+            ts_code VARCHAR(20) NOT NULL,
+            trade_date VARCHAR(8) NOT NULL,
+            price_open DOUBLE, price_high DOUBLE, price_low DOUBLE, price_close DOUBLE,
+            price_pre_close DOUBLE, amt_chg DOUBLE, pct_chg DOUBLE, vol DOUBLE, amount DOUBLE,
+            PRIMARY KEY (ts_code, trade_date)
+        )
+        """))
+        conn.commit()
+    total_rows = 0
+    for block in iter_synthetic_daily(**config):
+        block.to_sql('cn_stock_daily', engine, if_exists='append', index=False, chunksize=50000)
+        total_rows += len(block)
+        print(f"   已写入合成数据 {total_rows:,} 行")
+    return total_rows
+
+
+def open_benchmark_db(config, db_url=None, rebuild=False):
+    """
+    打开（必要时构建）基准测试数据库
+
+    返回值：
+    ----------
+    tuple(sqlalchemy.engine.Engine, float or None)
+        (数据库引擎, 构建耗时；复用已有数据时为None)
+    """
+    if db_url:
+        engine = create_engine(db_url)
+    else:
+        name = f"bench_{config['n_stocks']}x{config['years']}_s{config['seed']}" \
+               f"_p{config['suspend_rate']}_l{config['limit_up_rate']}.db"
+        db_path = os.path.join(get_cache_dir('benchmark'), name)
+        if rebuild and os.path.exists(db_path):
+            os.remove(db_path)
+        engine = create_engine(f"sqlite:///{db_path}")
+
+    with engine.connect() as conn:
+        try:
+            existing_rows = conn.execute(text("SELECT COUNT(*) FROM cn_stock_daily")).scalar()
+        except Exception:
+            existing_rows = 0
+    if existing_rows:
+        print(f"♻️ 复用已有合成数据：{existing_rows:,} 行")
+        return engine, None
+
+    print("🧪 正在生成合成日线数据...")
+    start_time = time.time()
+    build_benchmark_db(engine, config)
+    return engine, time.time() - start_time
+
+
+# ========================== 计时与内存采样 ==========================
+def _stage_record(timer, name, rows):
+    """StageTimer(sample_rss=True)中单个阶段的耗时、吞吐与峰值内存"""
+    seconds = timer.totals[name]
+    return {
+        'seconds': round(seconds, 4),
+        'rows': int(rows),
+        'rows_per_sec': round(rows / max(seconds, 1e-9), 1),
+        'peak_rss_mb': round(timer.peak_rss_mb[name], 1),
+        'rss_delta_mb': round(timer.peak_rss_mb[name] - timer.start_rss_mb[name], 1),
+    }
+
+
+def _format_selected(Stock_Selected):
+    """按主程序的口径整理选股结果（执行时间字段 + YYYYMMDD日期字符串）"""
+    result = Stock_Selected.copy()
+    now = datetime.now()
+    result.insert(0, 'execute_time', now.strftime('%H:%M:%S'))
+    result.insert(0, 'execute_date', now.strftime('%Y-%m-%d'))
+    for col in ('trade_date', 'buy_date', 'gold_date'):
+        result[col] = result[col].dt.strftime('%Y%m%d')
+    result['ts_code'] = result['ts_code'].astype(str)
+    return result
+
+
+# ========================== 基准测试主流程 ==========================
+def run_benchmark(engine, stages=STAGES, memory_budget_mb=256):
+    """
+    依次执行各阶段并计时
+
+    返回值：
+    ----------
+    dict
+        {阶段名: {seconds, rows, rows_per_sec, peak_rss_mb, rss_delta_mb}}
+    """
+    select_module.engine = engine
+    with engine.connect() as conn:
+        start_date, end_date = conn.execute(text("SELECT MIN(trade_date), MAX(trade_date) FROM cn_stock_daily")).first()
+    start_date, end_date = str(start_date).replace('-', ''), str(end_date).replace('-', '')
+
+    results = {}
+    timer = StageTimer(sample_rss=True)
+    stock_df = Stock_Selected = None
+    if 'load_stock_data' in stages or 'select_stocks' in stages or 'result_write' in stages:
+        with timer.stage('load_stock_data'):
+            stock_df = select_module.load_stock_data(start_date=start_date, end_date=end_date)
+        if 'load_stock_data' in stages:
+            results['load_stock_data'] = _stage_record(timer, 'load_stock_data', len(stock_df))
+
+    if 'select_stocks' in stages or 'result_write' in stages:
+        with timer.stage('select_stocks'):
+            Stock_Selected = select_module.select_stocks(stock_df, d1=0)
+        if 'select_stocks' in stages:
+            results['select_stocks'] = _stage_record(timer, 'select_stocks', len(stock_df))
+        print(f"   选股结果 {len(Stock_Selected)} 条")
+
+    if 'select_streaming' in stages:
+        n_rows = len(stock_df) if stock_df is not None else 0
+        stock_df = None
+        with timer.stage('select_streaming'):
+            streamed = select_module.select_stocks_streaming(start_date, end_date, d1=0,
+                                                             memory_budget_mb=memory_budget_mb)
+        results['select_streaming'] = _stage_record(timer, 'select_streaming', n_rows)
+        if Stock_Selected is not None and len(streamed) != len(Stock_Selected):
+            raise AssertionError(f"流式选股结果（{len(streamed)}条）与整体选股（{len(Stock_Selected)}条）不一致")
+
+    if 'result_write' in stages:
+        stock_df = None
+        formatted = _format_selected(Stock_Selected)
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}"))
+            conn.commit()
+        # 以空表建立字段后补主键，保持与stock_selected相同的写入语义
+        columns_sql = ', '.join(
+            f"{col} VARCHAR(20)" if formatted[col].dtype == object else f"{col} DOUBLE"
+            for col in formatted.columns
+        )
+        with engine.connect() as conn:
+            conn.execute(text(f"""
+            CREATE TABLE {BENCHMARK_TABLE} ({columns_sql},
+                PRIMARY KEY (execute_date, execute_time, ts_code, trade_date))
+            """))
+            conn.commit()
+        with timer.stage('result_write'):
+            bulk_upsert(engine, BENCHMARK_TABLE, formatted,
+                        key_columns=['execute_date', 'execute_time', 'ts_code', 'trade_date'])
+        results['result_write'] = _stage_record(timer, 'result_write', len(formatted))
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}"))
+            conn.commit()
+    return results
+
+
+def compare_with_baseline(report, baseline, threshold=0.25, rss_threshold=0.5, min_seconds=0.05):
+    """
+    与基线比较，返回退化的阶段说明列表（空列表表示通过）
+
+    参数说明：
+    ----------
+    threshold : float
+        耗时允许的增长比例，默认0.25（即慢25%以上视为退化）
+    rss_threshold : float
+        峰值内存允许的增长比例，默认0.5
+    min_seconds : float
+        耗时增长的绝对容差（秒），避免极短阶段的计时抖动误报，默认0.05
+    """
+    if baseline.get('config') != report['config']:
+        print("⚠️ 基线的数据配置与本次不同，跳过比较")
+        return []
+    regressions = []
+    for stage, current in report['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            continue
+        if current['seconds'] > base['seconds'] * (1 + threshold) and \
+                current['seconds'] - base['seconds'] > min_seconds:
+            regressions.append(f"{stage} 耗时 {current['seconds']:.3f}s，基线 {base['seconds']:.3f}s")
+        if current['peak_rss_mb'] > base['peak_rss_mb'] * (1 + rss_threshold):
+            regressions.append(f"{stage} 峰值内存 {current['peak_rss_mb']:.0f}MB，基线 {base['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def _print_report(report):
+    print("\n📊 ===== 基准测试结果 =====")
+    for stage, record in report['stages'].items():
+        print(f"   {stage:<18} {record['seconds']:>9.3f} 秒  {record['rows_per_sec']:>14,.0f} 行/秒  "
+              f"峰值内存 {record['peak_rss_mb']:>8.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="选股引擎基准测试（合成数据）")
+    parser.add_argument('--stocks', type=int, default=5000, help="股票数量")
+    parser.add_argument('--years', type=int, default=10, help="年数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--suspend-rate', type=float, default=0.002, help="每日开始停牌的概率")
+    parser.add_argument('--limit-up-rate', type=float, default=0.01, help="每日涨停的概率")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help="要计时的阶段")
+    parser.add_argument('--memory-mb', type=int, default=256, help="流式选股的内存预算（MB）")
+    parser.add_argument('--db-url', default=None, help="使用独立的MySQL测试库（默认本地SQLite）")
+    parser.add_argument('--rebuild', action='store_true', help="重新生成合成数据")
+    parser.add_argument('--output', default=None, help="结果JSON路径")
+    parser.add_argument('--baseline', default=None, help="基线JSON路径")
+    parser.add_argument('--save-baseline', action='store_true', help="将本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=0.25, help="耗时退化阈值（比例）")
+    parser.add_argument('--rss-threshold', type=float, default=0.5, help="峰值内存退化阈值（比例）")
+    args = parser.parse_args()
+
+    config = {
+        'n_stocks': args.stocks, 'years': args.years, 'seed': args.seed,
+        'suspend_rate': args.suspend_rate, 'limit_up_rate': args.limit_up_rate,
+    }
+    engine, build_seconds = open_benchmark_db(config, db_url=args.db_url, rebuild=args.rebuild)
+    try:
+        stages = run_benchmark(engine, stages=args.stages, memory_budget_mb=args.memory_mb)
+    finally:
+        engine.dispose()
+
+    report = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': engine.dialect.name,
+        },
+        'db_build_seconds': round(build_seconds, 2) if build_seconds is not None else None,
+        'stages': stages,
+    }
+    _print_report(report)
+
+    bench_dir = get_cache_dir('benchmark')
+    output_path = args.output or os.path.join(bench_dir, f"result_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存：{output_path}")
+
+    baseline_path = args.baseline or os.path.join(bench_dir, 'baseline.json')
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 基线已保存：{baseline_path}")
+        sys.exit(0)
+
+    if not os.path.exists(baseline_path):
+        print("⚠️ 未找到基线文件，使用 --save-baseline 生成")
+        sys.exit(0)
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(report, baseline, args.threshold, args.rss_threshold)
+    if regressions:
+        print("\n❌ 性能退化：")
+        for item in regressions:
+            print(f"   - {item}")
+        sys.exit(1)
+    print("\n✅ 未发现性能退化")
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+选股参数批量扫描工具
+====================
+功能说明：
+1. 一次读取日线数据，按参数网格（d1、涨幅比、缩量系数、放量倍数）批量评估选股公式
+2. 同一d1下的所有阈值组合共享REF滞后数组，只计算一次
+3. 按d1拆分任务，在多进程中并行执行（Linux下fork子进程直接共享已加载的数组，无需序列化）
+4. 输出每组参数的命中数、涉及股票数、涉及交易日数，可选输出具体选股明细
+
+使用示例：
+    grid = build_param_grid(d1_values=[0, 1, 2], jump_ratios=[1.06, 1.08, 1.1])
+    summary, picks = sweep_stocks('20200101', '20251231', grid, return_picks=True)
+====================
+"""
+
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入选股模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from tushare_select_stock import (
+        DEFAULT_THRESHOLDS, compute_conditions, load_stock_data, make_ref, prepare_panel
+    )
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.tushare_select_stock import (
+        DEFAULT_THRESHOLDS, compute_conditions, load_stock_data, make_ref, prepare_panel
+    )
+
+# 当前扫描使用的数组（fork出的子进程继承此全局变量，按写时复制共享内存）
+_panel = {}
+
+
+# ========================== 参数网格 ==========================
+def build_param_grid(d1_values=(0,), jump_ratios=None, shrink_ratios=None, surge_ratios=None):
+    """
+    生成参数网格（笛卡尔积）
+
+    参数说明：
+    ----------
+    d1_values : iterable of int
+        D1参数取值
+    jump_ratios / shrink_ratios / surge_ratios : iterable of float, 可选
+        条件1涨幅比、条件2缩量系数、条件3放量倍数取值，默认使用DEFAULT_THRESHOLDS
+
+    返回值：
+    ----------
+    list
+        [{'d1':..., 'jump_ratio':..., 'shrink_ratio':..., 'surge_ratio':...}, ...]
+    """
+    jump_ratios = jump_ratios or [DEFAULT_THRESHOLDS['jump_ratio']]
+    shrink_ratios = shrink_ratios or [DEFAULT_THRESHOLDS['shrink_ratio']]
+    surge_ratios = surge_ratios or [DEFAULT_THRESHOLDS['surge_ratio']]
+    return [
+        {'d1': d1, 'jump_ratio': jump, 'shrink_ratio': shrink, 'surge_ratio': surge}
+        for d1, jump, shrink, surge in itertools.product(d1_values, jump_ratios, shrink_ratios, surge_ratios)
+    ]
+
+
+# ========================== 子进程任务 ==========================
+def _evaluate_task(task):
+    """
+    评估同一d1下的一批参数组合（REF数组在本批次内共享）
+
+    参数说明：
+    ----------
+    task : tuple(int, list)
+        (d1, [(组合序号, 参数字典), ...])
+
+    返回值：
+    ----------
+    list
+        [(组合序号, 命中行号数组), ...]
+    """
+    d1, combos = task
+    ref = make_ref(_panel['arrays'], _panel['positions'])
+    results = []
+    for combo_id, params in combos:
+        thresholds = {key: params[key] for key in DEFAULT_THRESHOLDS}
+        mask = np.logical_and.reduce(compute_conditions(ref, d1=d1, **thresholds))
+        results.append((combo_id, np.flatnonzero(mask)))
+    return results
+
+
+def _split_tasks(grid, workers):
+    """按d1分组，并把每组切成若干批，使任务数不少于进程数"""
+    by_d1 = {}
+    for combo_id, params in enumerate(grid):
+        by_d1.setdefault(params['d1'], []).append((combo_id, params))
+    chunks_per_d1 = max(1, -(-workers // len(by_d1)))
+    tasks = []
+    for d1, combos in by_d1.items():
+        chunk_size = max(1, -(-len(combos) // chunks_per_d1))
+        for i in range(0, len(combos), chunk_size):
+            tasks.append((d1, combos[i:i + chunk_size]))
+    return tasks
+
+
+# ========================== 扫描主流程 ==========================
+def run_sweep(df, grid, workers=None, return_picks=False):
+    """
+    在已加载的日线数据上批量评估参数网格
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        股票日线数据（来自load_stock_data函数的返回值）
+    grid : list
+        build_param_grid生成的参数网格
+    workers : int, 可选
+        并行进程数，默认CPU核数；为1或当前平台不支持fork时在本进程内执行
+    return_picks : bool, 可选
+        是否返回每组参数的选股明细，默认False
+
+    返回值：
+    ----------
+    tuple(pandas.DataFrame, pandas.DataFrame or None)
+        (汇总表, 明细表)
+        汇总表字段：combo_id, d1, jump_ratio, shrink_ratio, surge_ratio,
+                   hit_count（命中条数）, stock_count（涉及股票数）, day_count（涉及交易日数）
+        明细表字段：combo_id, ts_code, trade_date（return_picks=False时为None）
+    """
+    global _panel
+
+    if df.empty or not grid:
+        return pd.DataFrame(), None
+
+    df, positions, arrays = prepare_panel(df)
+    _panel = {'positions': positions, 'arrays': arrays}
+
+    workers = workers or os.cpu_count() or 1
+    tasks = _split_tasks(grid, workers)
+    start_time = time.time()
+    try:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(processes=min(workers, len(tasks))) as pool:
+                task_results = pool.map(_evaluate_task, tasks)
+        else:
+            task_results = [_evaluate_task(task) for task in tasks]
+    finally:
+        _panel = {}
+
+    hits = dict(pair for batch in task_results for pair in batch)
+    codes = df['ts_code'].to_numpy()
+    dates = df['trade_date'].to_numpy()
+
+    summary_rows = []
+    pick_frames = []
+    for combo_id, params in enumerate(grid):
+        idx = hits[combo_id]
+        summary_rows.append({
+            'combo_id': combo_id,
+            **params,
+            'hit_count': len(idx),
+            'stock_count': len(np.unique(codes[idx])),
+            'day_count': len(np.unique(dates[idx])),
+        })
+        if return_picks and len(idx):
+            pick_frames.append(pd.DataFrame({'combo_id': combo_id, 'ts_code': codes[idx], 'trade_date': dates[idx]}))
+
+    summary = pd.DataFrame(summary_rows)
+    print(f"✅ 参数扫描完成：{len(grid)} 组参数，{len(df):,} 行数据，耗时 {time.time() - start_time:.2f} 秒")
+
+    picks = None
+    if return_picks:
+        picks = pd.concat(pick_frames, ignore_index=True) if pick_frames else \
+            pd.DataFrame(columns=['combo_id', 'ts_code', 'trade_date'])
+    return summary, picks
+
+
+def sweep_stocks(start_date, end_date, grid, workers=None, return_picks=False):
+    """
+    读取一次日线数据后执行参数扫描（参数与返回值同run_sweep）
+
+    参数说明：
+    ----------
+    start_date / end_date : str
+        数据起止日期，格式为YYYYMMDD
+    """
+    print(f"📥 正在读取 {start_date} 至 {end_date} 的股票日线数据...")
+    stock_df = load_stock_data(start_date=start_date, end_date=end_date)
+    return run_sweep(stock_df, grid, workers=workers, return_picks=return_picks)
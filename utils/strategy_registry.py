@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+选股策略注册表
+====================
+功能说明：
+1. 每个策略登记：策略标识、名称、回看K线数、所需cn_stock_daily字段、D1参数与评估函数
+   - register_strategy：以装饰器登记Python实现的策略
+   - register_formula_strategy：以通达信公式登记策略（回看天数与字段由公式编译结果自动推出）
+   - register_rank_strategy：登记截面排名策略（每个交易日按指标取全市场前N名）
+2. 一次运行只读取一次日线数据：窗口为所有策略回看天数的并集（取最大值），
+   所有策略共用同一份排序数组与REF缓存，每个策略只是一次廉价的数组运算
+3. 结果附带strategy_id字段，可直接写入stock_selected（主键含strategy_id）
+
+使用方法：
+    SELECT_STRATEGIES=all python utils/tushare_select_stock.py
+    SELECT_STRATEGIES=tdx_shrink_pullback,breakout_20d python utils/tushare_select_stock.py
+====================
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入选股模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from tushare_select_stock import (
+        DEFAULT_STRATEGY_ID, DEFAULT_THRESHOLDS, FORMULA_FIELDS, attach_data_versions, compute_buy_gold_dates,
+        compute_conditions, cross_section_top_n, ensure_data_version_column, get_lookback_days, load_stock_data,
+        prepare_panel, ref_array, restrict_to_universe
+    )
+    from tdx_formula import compile_formula, evaluate_formula
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.tushare_select_stock import (
+        DEFAULT_STRATEGY_ID, DEFAULT_THRESHOLDS, FORMULA_FIELDS, attach_data_versions, compute_buy_gold_dates,
+        compute_conditions, cross_section_top_n, ensure_data_version_column, get_lookback_days, load_stock_data,
+        prepare_panel, ref_array, restrict_to_universe
+    )
+    from utils.tdx_formula import compile_formula, evaluate_formula
+
+# 策略标识 -> {strategy_id, name, lookback, fields, d1, evaluate}
+STRATEGIES = {}
+
+
+# ========================== 策略登记 ==========================
+def register_strategy(strategy_id, name, lookback, fields, d1=0):
+    """
+    装饰器：登记Python实现的选股策略
+
+    参数说明：
+    ----------
+    strategy_id : str
+        策略标识（写入stock_selected.strategy_id，最长50字符）
+    name : str
+        策略名称
+    lookback : int
+        评估一个交易日需要向前回看的K线数
+    fields : iterable
+        策略用到的cn_stock_daily字段
+    d1 : int, 可选
+        计算buy_date/gold_date使用的D1参数，默认值0
+
+    被装饰函数：
+    ----------
+    evaluate(panel) -> bool数组；panel包含positions（组内序号）、dates（交易日期数组）、
+    arrays（{字段名: float64数组}）、ref（带缓存的REF函数，ref(字段名, N)，所有策略共用）、
+    universe（股票池行掩码，未指定股票池时为None）
+    """
+    def decorator(evaluate):
+        if strategy_id in STRATEGIES:
+            raise ValueError(f"策略标识重复: {strategy_id}")
+        STRATEGIES[strategy_id] = {
+            'strategy_id': strategy_id,
+            'name': name,
+            'lookback': int(lookback),
+            'fields': set(fields),
+            'd1': d1,
+            'evaluate': evaluate,
+        }
+        return evaluate
+    return decorator
+
+
+def register_formula_strategy(strategy_id, name, formula, params=None):
+    """
+    以通达信公式登记选股策略，回看K线数与所需字段由编译结果自动推出
+
+    参数说明：
+    ----------
+    formula : str
+        通达信风格的公式字符串（见tdx_formula.py）
+    params : dict, 可选
+        公式参数，默认 {'D1': 0}；D1同时用于计算buy_date
+    """
+    params = params or {'D1': 0}
+    compiled = compile_formula(formula, params)
+    d1 = int({key.upper(): value for key, value in params.items()}.get('D1', 0))
+
+    def evaluate(panel):
+        result = evaluate_formula(compiled, panel['positions'], panel['arrays'])
+        # 算术表达式按通达信习惯视非零为真
+        return result if result.dtype == bool else (result != 0) & ~np.isnan(result)
+
+    register_strategy(strategy_id, name, compiled['lookback'], compiled['fields'], d1=d1)(evaluate)
+
+
+def register_rank_strategy(strategy_id, name, score, lookback, fields, top_n=20, largest=True):
+    """
+    登记截面排名策略：每个交易日按score在全市场取前top_n名（见cross_section_top_n）
+
+    参数说明：
+    ----------
+    score : function
+        score(panel) -> float64数组，排名指标（NaN不参与排名）
+    lookback / fields :
+        同register_strategy
+    top_n : int, 可选
+        每个交易日入选的股票数，默认20
+    largest : bool, 可选
+        True（默认）取指标最大的N个，False取最小的N个
+
+    说明：
+    ----------
+    排名范围是本次读取的全部股票（指定股票池时只在股票池内排名）；
+    增量/分段运行时每个交易日仍是完整截面，结果与全量运行一致
+    """
+    def evaluate(panel):
+        values = score(panel)
+        if panel['universe'] is not None:
+            values = np.where(panel['universe'], values, np.nan)
+        return cross_section_top_n(values, panel['dates'], panel['positions'], top_n, largest=largest) > 0
+
+    register_strategy(strategy_id, name, lookback, fields)(evaluate)
+
+
+def _volume_ratio(panel):
+    """量比：当日成交量 / 前5日平均成交量"""
+    previous = np.mean([panel['ref']('vol', n) for n in range(1, 6)], axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return panel['arrays']['vol'] / previous
+
+
+# ========================== 内置策略 ==========================
+@register_strategy(DEFAULT_STRATEGY_ID, '涨停放量后缩量回踩', lookback=get_lookback_days(0),
+                   fields=FORMULA_FIELDS.values(), d1=0)
+def _shrink_pullback(panel):
+    """tushare_select_stock.select_stocks的条件1-4（默认阈值）"""
+    def ref(name, n):
+        return panel['ref'](FORMULA_FIELDS[name], n)
+    return np.logical_and.reduce(compute_conditions(ref, d1=0, **DEFAULT_THRESHOLDS))
+
+
+register_formula_strategy(
+    'breakout_20d', '放量突破20日新高',
+    "XG:CLOSE>REF(HHV(HIGH,20),1) AND VOL>2*MA(VOL,5);"
+)
+
+
+register_rank_strategy('top20_amount', '成交额前20', lambda panel: panel['arrays']['amount'],
+                       lookback=0, fields=['amount'])
+register_rank_strategy('top20_pct_chg', '涨幅前20', lambda panel: panel['arrays']['pct_chg'],
+                       lookback=0, fields=['pct_chg'])
+register_rank_strategy('top20_volume_ratio', '量比前20', _volume_ratio, lookback=5, fields=['vol'])
+
+
+def resolve_strategy_ids(value=None):
+    """
+    解析策略列表：策略标识列表，或逗号分隔的配置字符串（all或空表示全部已登记策略）
+
+    返回值：
+    ----------
+    list
+        策略标识列表
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'all')):
+        return list(STRATEGIES)
+    if isinstance(value, str):
+        value = value.split(',')
+    strategy_ids = [item.strip() for item in value if item.strip()]
+    unknown = [item for item in strategy_ids if item not in STRATEGIES]
+    if unknown:
+        raise ValueError(f"未登记的策略: {', '.join(unknown)}（可选: {', '.join(STRATEGIES)}）")
+    return strategy_ids
+
+
+def get_union_lookback(strategy_ids=None):
+    """所有策略回看K线数的并集（取最大值）"""
+    return max(STRATEGIES[strategy_id]['lookback'] for strategy_id in resolve_strategy_ids(strategy_ids))
+
+
+# ========================== 多策略评估 ==========================
+def run_strategies(df, strategy_ids=None, eval_dates=None, universe=None):
+    """
+    在同一份日线数据上评估多个策略
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        股票日线数据（来自load_stock_data函数的返回值），需包含各策略所需字段
+    strategy_ids : list or str, 可选
+        要评估的策略，默认全部已登记策略
+    eval_dates : array-like, 可选
+        仅评估这些交易日，默认None表示评估全部行
+    universe : function, 可选
+        股票池过滤函数（同select_stocks），在整理数据之前剔除股票池外的股票
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        各策略的入选记录（字段同select_stocks，另附strategy_id），按策略登记顺序拼接
+    """
+    strategy_ids = resolve_strategy_ids(strategy_ids)
+    if universe is not None:
+        df = restrict_to_universe(df, universe, eval_dates)
+    if df.empty:
+        return pd.DataFrame()
+
+    strategies = [STRATEGIES[strategy_id] for strategy_id in strategy_ids]
+    fields = set().union(*(strategy['fields'] for strategy in strategies))
+    start_time = time.time()
+    df, positions, arrays = prepare_panel(df, {field: field for field in sorted(fields)})
+    cache = {}
+
+    def ref(field, n):
+        key = (field, n)
+        if key not in cache:
+            cache[key] = ref_array(arrays[field], n, positions)
+        return cache[key]
+
+    in_universe = universe(df['ts_code'], df['trade_date']) if universe is not None else None
+    panel = {'positions': positions, 'dates': df['trade_date'].to_numpy(), 'arrays': arrays, 'ref': ref,
+             'universe': in_universe}
+    eval_mask = None
+    if eval_dates is not None:
+        eval_mask = df['trade_date'].isin(pd.to_datetime(eval_dates)).to_numpy()
+    if in_universe is not None:
+        eval_mask = in_universe if eval_mask is None else eval_mask & in_universe
+    print(f"   数据整理 {len(df):,} 行，耗时 {time.time() - start_time:.2f} 秒")
+
+    result_list = []
+    for strategy in strategies:
+        start_time = time.time()
+        mask = np.asarray(strategy['evaluate'](panel), dtype=bool)
+        if eval_mask is not None:
+            mask = mask & eval_mask
+        print(f"   策略 {strategy['strategy_id']}（{strategy['name']}）：入选 {int(mask.sum())} 条，"
+              f"耗时 {time.time() - start_time:.2f} 秒")
+        if not mask.any():
+            continue
+        selected = df[mask].reset_index(drop=True)
+        selected['buy_date'], selected['gold_date'] = compute_buy_gold_dates(selected['trade_date'],
+                                                                            d1=strategy['d1'])
+        selected['strategy_id'] = strategy['strategy_id']
+        result_list.append(selected)
+
+    if not result_list:
+        return pd.DataFrame()
+    return pd.concat(result_list, ignore_index=True)
+
+
+def select_strategies(start_date, end_date, strategy_ids=None, universe=None):
+    """
+    读取一次并集窗口的日线数据，评估多个策略并附加各自口径的data_version
+
+    参数说明：
+    ----------
+    start_date / end_date : str
+        评估起止日期，格式为YYYYMMDD
+    strategy_ids : list or str, 可选
+        要评估的策略，默认全部已登记策略
+    universe : function, 可选
+        股票池过滤函数（同run_strategies）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        各策略的入选记录，附strategy_id与data_version字段
+    """
+    strategy_ids = resolve_strategy_ids(strategy_ids)
+    lookback = get_union_lookback(strategy_ids)
+    start = datetime.strptime(start_date, '%Y%m%d')
+    # 预留足够的自然日以覆盖长假，确保能取到lookback个交易日
+    history_start = (start - timedelta(days=lookback * 2 + 30)).strftime('%Y%m%d')
+    print(f"\n📥 多策略选股：{len(strategy_ids)} 个策略，读取 {history_start} 至 {end_date}（回看 {lookback} 个交易日）")
+    df = load_stock_data(start_date=history_start, end_date=end_date)
+    if df.empty:
+        return pd.DataFrame()
+    eval_dates = df.loc[df['trade_date'] >= start, 'trade_date'].drop_duplicates()
+    Stock_Selected = run_strategies(df, strategy_ids, eval_dates=eval_dates, universe=universe)
+    if Stock_Selected.empty:
+        return Stock_Selected
+
+    # data_version按各策略自己的回看窗口计算
+    ensure_data_version_column()
+    versioned = []
+    for strategy_id, group in Stock_Selected.groupby('strategy_id', sort=False):
+        strategy = STRATEGIES[strategy_id]
+        versioned.append(attach_data_versions(group.copy(), d1=strategy['d1'], lookback=strategy['lookback'],
+                                              salt=getattr(universe, 'spec', '')))
+    return pd.concat(versioned, ignore_index=True)
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+通达信公式编译器
+====================
+功能说明：
+1. 解析通达信风格的选股公式字符串，例如：
+       REF(CLOSE,D1+3)/REF(CLOSE,D1+4)>1.08 AND REF(VOL,D1+3)>=1.5*REF(VOL,D1+4)
+   支持中间变量（X1:=...;）、输出行（XG:...;），行尾分号可省略
+2. 支持的函数：REF、MA、HHV、LLV、CROSS、COUNT、EVERY；
+   支持的运算：+ - * / > < >= <= = <> AND OR NOT
+3. 参数（如D1）在编译时代入为常量，常量子表达式直接折叠
+4. 编译为按拓扑顺序排列的执行计划，相同子表达式只计算一次（公共子表达式消除），
+   每个REF(字段,N)在整个公式中只生成一个数组
+5. 在全市场排序数组上执行（与select_stocks共用prepare_panel/ref_array），
+   所有窗口函数均按股票分组边界截断，不会跨股票取值
+
+行情字段：OPEN/O, HIGH/H, LOW/L, CLOSE/C, VOL/V, AMOUNT
+====================
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到系统路径，以便导入选股模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from tushare_select_stock import compute_buy_gold_dates, prepare_panel, ref_array
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.tushare_select_stock import compute_buy_gold_dates, prepare_panel, ref_array
+
+# 公式变量名 -> cn_stock_daily字段名
+FIELD_ALIASES = {
+    'OPEN': 'price_open', 'O': 'price_open',
+    'HIGH': 'price_high', 'H': 'price_high',
+    'LOW': 'price_low', 'L': 'price_low',
+    'CLOSE': 'price_close', 'C': 'price_close',
+    'VOL': 'vol', 'V': 'vol',
+    'AMOUNT': 'amount',
+}
+
+# 函数名 -> 参数个数
+FUNCTIONS = {'REF': 2, 'MA': 2, 'HHV': 2, 'LLV': 2, 'CROSS': 2, 'COUNT': 2, 'EVERY': 2}
+
+# 滚动求和时累加和重新从0开始的块长（行数）
+WINDOW_SUM_BLOCK = 4096
+
+# 默认选股公式（与select_stocks的条件1-4一致）
+DEFAULT_FORMULA = """
+COND1:=REF(CLOSE,D1+3)/REF(CLOSE,D1+4)>1.08;
+COND2:=REF(VOL,D1+0)*1.1<REF(VOL,D1+3) AND REF(VOL,D1+1)*1.1<REF(VOL,D1+2) AND REF(VOL,D1+2)*1.1<REF(VOL,D1+3);
+COND3:=REF(VOL,D1+3)>=1.5*REF(VOL,D1+4);
+AVGP:=(REF(LOW,D1+3)+REF(CLOSE,D1+3))/2;
+COND4:=REF(LOW,D1+0)>AVGP AND REF(LOW,D1+1)>AVGP AND REF(LOW,D1+2)>AVGP;
+XG:COND1 AND COND2 AND COND3 AND COND4;
+"""
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.\d*|\.\d+|\d+)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>:=|>=|<=|<>|!=|[-+*/()<>=,:;])
+    )""", re.VERBOSE)
+
+
+class FormulaError(ValueError):
+    """公式语法错误或不支持的用法"""
+
+
+# ========================== 词法/语法解析 ==========================
+def _tokenize(source):
+    """将公式字符串切分为(类型, 值)记号列表"""
+    tokens = []
+    pos = 0
+    source = source.strip()
+    while pos < len(source):
+        match = _TOKEN_PATTERN.match(source, pos)
+        if not match or match.end() == pos:
+            raise FormulaError(f"无法识别的字符：{source[pos:pos + 10]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name':
+            value = value.upper()
+        tokens.append((kind, value))
+    tokens.append(('end', None))
+    return tokens
+
+
+class _Parser:
+    """递归下降解析器：输出以元组表示的语法树，并完成参数代入与常量折叠"""
+
+    def __init__(self, source, params):
+        self.tokens = _tokenize(source)
+        self.pos = 0
+        self.params = {key.upper(): value for key, value in params.items()}
+        self.variables = {}
+
+    def peek(self, value=None):
+        kind, token = self.tokens[self.pos]
+        if value is None:
+            return token
+        return kind in ('op', 'name') and token == value
+
+    def take(self, value=None):
+        kind, token = self.tokens[self.pos]
+        if value is not None and token != value:
+            raise FormulaError(f"此处应为 {value!r}，实际为 {token!r}")
+        self.pos += 1
+        return kind, token
+
+    def parse_program(self):
+        """语句序列：NAME:=expr; / NAME:expr; / expr; 结果取输出行（无输出行则取最后一条）"""
+        output = None
+        last = None
+        while self.tokens[self.pos][0] != 'end':
+            if self.peek(';'):
+                self.take(';')
+                continue
+            kind, token = self.tokens[self.pos]
+            next_token = self.tokens[self.pos + 1][1]
+            if kind == 'name' and next_token in (':=', ':'):
+                self.pos += 2
+                node = self.parse_or()
+                self.variables[token] = node
+                if next_token == ':':
+                    output = node
+            else:
+                node = self.parse_or()
+            last = node
+            if not self.peek(';') and self.tokens[self.pos][0] != 'end':
+                raise FormulaError(f"多余的内容：{self.peek()!r}")
+        result = output if output is not None else last
+        if result is None:
+            raise FormulaError("公式为空")
+        return result
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek('OR'):
+            self.take()
+            node = _fold(('OR', node, self.parse_and()))
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek('AND'):
+            self.take()
+            node = _fold(('AND', node, self.parse_not()))
+        return node
+
+    def parse_not(self):
+        if self.peek('NOT'):
+            self.take()
+            return _fold(('NOT', self.parse_not()))
+        return self.parse_compare()
+
+    def parse_compare(self):
+        node = self.parse_additive()
+        while self.peek() in ('>', '<', '>=', '<=', '=', '<>', '!='):
+            _, op = self.take()
+            op = '<>' if op == '!=' else op
+            node = _fold((op, node, self.parse_additive()))
+        return node
+
+    def parse_additive(self):
+        node = self.parse_term()
+        while self.peek() in ('+', '-'):
+            _, op = self.take()
+            node = _fold((op, node, self.parse_term()))
+        return node
+
+    def parse_term(self):
+        node = self.parse_unary()
+        while self.peek() in ('*', '/'):
+            _, op = self.take()
+            node = _fold((op, node, self.parse_unary()))
+        return node
+
+    def parse_unary(self):
+        if self.peek() == '-':
+            self.take()
+            return _fold(('NEG', self.parse_unary()))
+        if self.peek() == '+':
+            self.take()
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, token = self.take()
+        if kind == 'number':
+            return ('num', float(token))
+        if token == '(':
+            node = self.parse_or()
+            self.take(')')
+            return node
+        if kind != 'name':
+            raise FormulaError(f"此处应为表达式，实际为 {token!r}")
+        if token in FUNCTIONS:
+            self.take('(')
+            args = [self.parse_or()]
+            while self.peek(','):
+                self.take(',')
+                args.append(self.parse_or())
+            self.take(')')
+            if len(args) != FUNCTIONS[token]:
+                raise FormulaError(f"{token} 需要 {FUNCTIONS[token]} 个参数")
+            return _make_call(token, args)
+        if token in self.variables:
+            return self.variables[token]
+        if token in self.params:
+            return ('num', float(self.params[token]))
+        if token in FIELD_ALIASES:
+            return ('field', FIELD_ALIASES[token])
+        raise FormulaError(f"未定义的变量或参数：{token}")
+
+
+_CONST_OPS = {
+    '+': lambda a, b: a + b, '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b, '/': lambda a, b: a / b if b else float('nan'),
+    '>': lambda a, b: float(a > b), '<': lambda a, b: float(a < b),
+    '>=': lambda a, b: float(a >= b), '<=': lambda a, b: float(a <= b),
+    '=': lambda a, b: float(a == b), '<>': lambda a, b: float(a != b),
+    'AND': lambda a, b: float(bool(a) and bool(b)), 'OR': lambda a, b: float(bool(a) or bool(b)),
+}
+
+
+def _fold(node):
+    """常量折叠：操作数全部为常量时直接求值"""
+    op, *args = node
+    if not all(arg[0] == 'num' for arg in args):
+        return node
+    values = [arg[1] for arg in args]
+    if op == 'NEG':
+        return ('num', -values[0])
+    if op == 'NOT':
+        return ('num', float(not values[0]))
+    return ('num', _CONST_OPS[op](*values))
+
+
+def _make_call(name, args):
+    """函数调用节点：窗口长度参数必须是非负整数常量"""
+    data, period = args
+    if name == 'CROSS':
+        return ('CROSS', data, period)
+    if period[0] != 'num' or period[1] != int(period[1]) or period[1] < 0:
+        raise FormulaError(f"{name} 的周期参数必须是非负整数常量")
+    period = int(period[1])
+    if name != 'REF' and period < 1:
+        raise FormulaError(f"{name} 的周期参数必须大于0")
+    return (name, data, period)
+
+
+# ========================== 编译：生成执行计划 ==========================
+def compile_formula(formula, params=None):
+    """
+    编译公式为去重后的执行计划
+
+    参数说明：
+    ----------
+    formula : str
+        通达信风格的公式字符串
+    params : dict, 可选
+        公式参数，例如 {'D1': 0}
+
+    返回值：
+    ----------
+    dict
+        - plan: [(节点编号, 运算, 参数)]，按拓扑顺序排列，相同子表达式只出现一次
+        - output: 结果节点编号
+        - fields: 公式用到的cn_stock_daily字段集合
+        - lookback: 公式需要的最大回看K线数
+    """
+    tree = _Parser(formula, params or {}).parse_program()
+    slots = {}
+    plan = []
+    fields = set()
+
+    def visit(node):
+        if node in slots:
+            return slots[node]
+        op = node[0]
+        if op == 'num':
+            args = (node[1],)
+        elif op == 'field':
+            args = (node[1],)
+            fields.add(node[1])
+        elif op in FUNCTIONS and op != 'CROSS':
+            args = (visit(node[1]), node[2])
+        else:
+            args = tuple(visit(child) for child in node[1:])
+        slot = len(plan)
+        plan.append((slot, op, args))
+        slots[node] = slot
+        return slot
+
+    output = visit(tree)
+    return {'plan': plan, 'output': output, 'fields': fields, 'lookback': _lookback(tree)}
+
+
+def _lookback(node):
+    """估算公式需要的最大回看K线数（REF(X,N)为N，窗口函数为N-1，CROSS为1）"""
+    op = node[0]
+    if op in ('num', 'field'):
+        return 0
+    if op == 'CROSS':
+        return 1 + max(_lookback(node[1]), _lookback(node[2]))
+    if op in FUNCTIONS:
+        extra = node[2] if op == 'REF' else node[2] - 1
+        return extra + _lookback(node[1])
+    return max(_lookback(child) for child in node[1:])
+
+
+# ========================== 执行：向量化内核 ==========================
+def _as_float(values):
+    return values.astype(np.float64) if values.dtype == bool else values
+
+
+def _as_bool(values):
+    if values.dtype == bool:
+        return values
+    return (values != 0) & ~np.isnan(values)
+
+
+def _window_sum(values, n, positions):
+    """
+    组内滚动求和（窗口在股票起始处截断），返回(窗口和, 窗口内实际K线数)；values中不能有NaN
+
+    累加和每WINDOW_SUM_BLOCK行重新从0开始（块长不小于N，窗口最多跨两个块），
+    窗口和 = 窗口末行的块内累加和 - 窗口首行之前的块内累加和（跨块时加上前一块的合计），
+    总计算量与N无关；浮点误差只随块长增长，不随全市场总行数增长
+    """
+    data = values.astype(np.float64)
+    count = np.minimum(positions + 1, n)
+    n_rows = len(data)
+    if n_rows == 0:
+        return data, count
+    block = max(WINDOW_SUM_BLOCK, n)
+    n_blocks = -(-n_rows // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:n_rows] = data
+    block_prefix = np.cumsum(padded.reshape(n_blocks, block), axis=1)
+    prefix = block_prefix.ravel()[:n_rows]
+
+    rows = np.arange(n_rows, dtype=np.int64)
+    first = rows - count + 1
+    first_block = first // block
+    before_first = prefix[first] - data[first]
+    carry = np.where(first_block == rows // block, 0.0, block_prefix[first_block, -1])
+    return prefix + carry - before_first, count
+
+
+def _window_extreme(values, n, positions, reducer):
+    """
+    组内滚动最大/最小值，不足N根K线时为NaN
+
+    只保留组内已有N根K线的行，这些行的窗口不会跨股票，直接在sliding_window_view上一次归约，
+    不复制数据
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) >= n:
+        result[n - 1:] = reducer.reduce(np.lib.stride_tricks.sliding_window_view(values, n), axis=1)
+    result[positions < n - 1] = np.nan
+    return result
+
+
+_BINARY_KERNELS = {
+    '+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide,
+    '>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal,
+    '=': np.equal, '<>': np.not_equal,
+}
+
+
+def evaluate_formula(compiled, positions, arrays):
+    """
+    在排序后的全市场数组上执行编译后的公式
+
+    参数说明：
+    ----------
+    compiled : dict
+        compile_formula的返回值
+    positions : numpy.ndarray
+        组内序号（prepare_panel的返回值）
+    arrays : dict
+        {cn_stock_daily字段名: float64数组}
+
+    返回值：
+    ----------
+    numpy.ndarray
+        结果数组（比较/逻辑表达式为bool数组，算术表达式为float64数组）
+    """
+    n_rows = len(positions)
+    values = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for slot, op, args in compiled['plan']:
+            if op == 'num':
+                result = np.full(n_rows, args[0])
+            elif op == 'field':
+                result = arrays[args[0]]
+            elif op == 'REF':
+                result = ref_array(_as_float(values[args[0]]), args[1], positions)
+            elif op == 'MA':
+                data = _as_float(values[args[0]])
+                missing = np.isnan(data)
+                total, count = _window_sum(np.where(missing, 0.0, data), args[1], positions)
+                missing_count, _ = _window_sum(missing.astype(np.float64), args[1], positions)
+                result = np.where((count == args[1]) & (missing_count == 0), total / args[1], np.nan)
+            elif op == 'HHV':
+                result = _window_extreme(_as_float(values[args[0]]), args[1], positions, np.maximum)
+            elif op == 'LLV':
+                result = _window_extreme(_as_float(values[args[0]]), args[1], positions, np.minimum)
+            elif op == 'COUNT':
+                result, _ = _window_sum(_as_bool(values[args[0]]).astype(np.float64), args[1], positions)
+            elif op == 'EVERY':
+                total, count = _window_sum(_as_bool(values[args[0]]).astype(np.float64), args[1], positions)
+                result = (count == args[1]) & (total == args[1])
+            elif op == 'CROSS':
+                a = _as_float(values[args[0]])
+                b = _as_float(values[args[1]])
+                result = (a > b) & (ref_array(a, 1, positions) <= ref_array(b, 1, positions))
+            elif op == 'AND':
+                result = _as_bool(values[args[0]]) & _as_bool(values[args[1]])
+            elif op == 'OR':
+                result = _as_bool(values[args[0]]) | _as_bool(values[args[1]])
+            elif op == 'NOT':
+                result = ~_as_bool(values[args[0]])
+            elif op == 'NEG':
+                result = -_as_float(values[args[0]])
+            else:
+                result = _BINARY_KERNELS[op](_as_float(values[args[0]]), _as_float(values[args[1]]))
+            values[slot] = result
+    return values[compiled['output']]
+
+
+# ========================== 公式选股 ==========================
+def select_by_formula(df, formula=DEFAULT_FORMULA, params=None, eval_dates=None):
+    """
+    按公式字符串选股，输出字段与select_stocks一致
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        股票日线数据（来自load_stock_data函数的返回值）
+    formula : str, 可选
+        通达信风格的公式字符串，默认DEFAULT_FORMULA
+    params : dict, 可选
+        公式参数，默认 {'D1': 0}；D1同时用于计算buy_date
+    eval_dates : array-like, 可选
+        仅评估这些交易日，默认None表示评估全部行
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        符合公式条件的股票数据（按ts_code、trade_date升序），包含buy_date、gold_date字段
+    """
+    params = params or {'D1': 0}
+    if df.empty:
+        return pd.DataFrame()
+
+    compiled = compile_formula(formula, params)
+    df, positions, arrays = prepare_panel(df, {field: field for field in compiled['fields']})
+    final_condition = _as_bool(evaluate_formula(compiled, positions, arrays))
+    if eval_dates is not None:
+        final_condition &= df['trade_date'].isin(pd.to_datetime(eval_dates)).to_numpy()
+    if not final_condition.any():
+        return pd.DataFrame()
+
+    Stock_Selected = df[final_condition].reset_index(drop=True)
+    d1 = int({key.upper(): value for key, value in params.items()}.get('D1', 0))
+    Stock_Selected['buy_date'], Stock_Selected['gold_date'] = compute_buy_gold_dates(
+        Stock_Selected['trade_date'], d1=d1
+    )
+    return Stock_Selected
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+工作日日历查询工具
+====================
+功能说明：
+1. 基于chinese_calendar按年生成排序后的工作日数组（跳过周末和法定节假日）
+2. 按年缓存到本地磁盘（.npy），后续运行直接读取，不再逐日调用is_workday
+3. 对整列日期用numpy.searchsorted批量计算：
+   - 下一个工作日（含当天）
+   - 向前推N个工作日（不含当天）
+   - 上一个工作日（含当天）
+4. 沪深交易所交易日历（get_exchange_trade_days）：按年缓存Tushare trade_cal的开市日，
+   无Tushare连接或该年尚未发布时，以chinese_calendar工作日剔除周末（调休的周六/周日不开市）代替
+====================
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import chinese_calendar
+from chinese_calendar import is_workday
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_cache_dir
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_cache_dir
+
+# 进程内缓存：{年份: datetime64[D]数组}
+_year_cache = {}
+# 交易日历进程内缓存：{年份: datetime64[D]数组}
+_exchange_cache = {}
+
+
+# ========================== 工作日数组构建 ==========================
+def _build_year_workdays(year):
+    """逐日调用is_workday生成某一年的工作日数组（仅在缓存缺失时执行）"""
+    current = date(year, 1, 1)
+    workdays = []
+    while current.year == year:
+        if is_workday(current):
+            workdays.append(current)
+        current += timedelta(days=1)
+    return np.array(workdays, dtype='datetime64[D]')
+
+
+def get_year_workdays(year):
+    """
+    获取某一年的工作日数组（进程内缓存 -> 磁盘缓存 -> 重新计算）
+
+    参数说明：
+    ----------
+    year : int
+        年份
+
+    返回值：
+    ----------
+    numpy.ndarray
+        升序排列的datetime64[D]数组
+
+    异常：
+    ----------
+    NotImplementedError
+        chinese_calendar尚未收录该年份的节假日安排
+    """
+    if year in _year_cache:
+        return _year_cache[year]
+
+    # 缓存文件名带上chinese_calendar版本号，升级节假日数据后自动失效
+    cache_file = os.path.join(
+        get_cache_dir('calendar'),
+        f"workdays_{year}_{chinese_calendar.__version__}.npy"
+    )
+    if os.path.exists(cache_file):
+        workdays = np.load(cache_file)
+    else:
+        workdays = _build_year_workdays(year)
+        np.save(cache_file, workdays)
+
+    _year_cache[year] = workdays
+    return workdays
+
+
+def get_workdays(start_year, end_year):
+    """
+    获取[start_year, end_year]区间内全部工作日（chinese_calendar未收录的年份自动跳过）
+
+    返回值：
+    ----------
+    numpy.ndarray
+        升序排列的datetime64[D]数组
+    """
+    arrays = []
+    for year in range(start_year, end_year + 1):
+        try:
+            arrays.append(get_year_workdays(year))
+        except NotImplementedError:
+            continue
+    if not arrays:
+        return np.empty(0, dtype='datetime64[D]')
+    return np.concatenate(arrays)
+
+
+# ========================== 批量日期查询 ==========================
+def _prepare(dates):
+    """将输入日期统一为datetime64[D]数组，并加载覆盖前后各一年的工作日数组"""
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]')
+    if len(days) == 0:
+        return days, np.empty(0, dtype='datetime64[D]')
+    years = days.astype('datetime64[Y]').astype(int) + 1970
+    workdays = get_workdays(int(years.min()) - 1, int(years.max()) + 1)
+    return days, workdays
+
+
+def _take(workdays, idx):
+    """按索引取工作日，越界说明日期超出日历覆盖范围"""
+    if len(idx) and (idx.min() < 0 or idx.max() >= len(workdays)):
+        raise ValueError("日期超出chinese_calendar支持的年份范围，无法计算工作日")
+    return pd.Series(workdays[idx].astype('datetime64[ns]'))
+
+
+def next_workday(dates):
+    """
+    批量日期向后顺延：获取每个日期当天或之后最近的工作日
+
+    参数说明：
+    ----------
+    dates : array-like
+        日期序列（datetime/字符串/datetime64均可）
+
+    返回值：
+    ----------
+    pandas.Series
+        datetime64[ns]类型的工作日序列（索引从0开始，与输入顺序一致）
+    """
+    days, workdays = _prepare(dates)
+    idx = np.searchsorted(workdays, days, side='left')
+    return _take(workdays, idx)
+
+
+def prev_workday(dates):
+    """
+    批量日期向前回溯：获取每个日期当天或之前最近的工作日
+
+    参数说明：
+    ----------
+    dates : array-like
+        日期序列（datetime/字符串/datetime64均可）
+
+    返回值：
+    ----------
+    pandas.Series
+        datetime64[ns]类型的工作日序列（索引从0开始，与输入顺序一致）
+    """
+    days, workdays = _prepare(dates)
+    idx = np.searchsorted(workdays, days, side='right') - 1
+    return _take(workdays, idx)
+
+
+def minus_workdays(dates, n):
+    """
+    批量日期向前推N个工作日（不含当天，与逐日回溯计数的结果一致）
+
+    参数说明：
+    ----------
+    dates : array-like
+        日期序列（datetime/字符串/datetime64均可）
+    n : int
+        要向前推的工作日数量
+
+    返回值：
+    ----------
+    pandas.Series
+        datetime64[ns]类型的工作日序列（索引从0开始，与输入顺序一致）
+    """
+    days, workdays = _prepare(dates)
+    # searchsorted(left)得到严格早于该日期的工作日个数，再向前退n位
+    idx = np.searchsorted(workdays, days, side='left') - n
+    return _take(workdays, idx)
+
+
+# ========================== 交易所交易日历 ==========================
+def _fetch_exchange_year(pro, year):
+    """从Tushare trade_cal读取某一年上交所的开市日（深交所与上交所休市安排相同），未发布时返回None"""
+    df = pro.trade_cal(exchange='SSE', start_date=f"{year}0101", end_date=f"{year}1231",
+                       is_open='1', fields='cal_date')
+    if df is None or df.empty:
+        return None
+    return np.sort(pd.to_datetime(df['cal_date'], format='%Y%m%d').to_numpy().astype('datetime64[D]'))
+
+
+def _weekday_workdays(year):
+    """chinese_calendar工作日中剔除周末（调休上班的周末交易所不开市），作为交易日历的近似"""
+    workdays = get_year_workdays(year)
+    # 1970-01-01为周四，(天数 + 3) % 7 < 5 即周一至周五
+    return workdays[(workdays.astype(np.int64) + 3) % 7 < 5]
+
+
+def get_exchange_trade_days(start_date, end_date, pro=None, refresh=False):
+    """
+    获取[start_date, end_date]区间内沪深交易所的交易日
+
+    参数说明：
+    ----------
+    start_date / end_date : str
+        起止日期，格式为YYYYMMDD
+    pro : tushare.pro_api, 可选
+        Tushare接口；缓存缺失时用trade_cal刷新，默认None（只用本地缓存或chinese_calendar）
+    refresh : bool, 可选
+        是否忽略本地缓存重新从trade_cal读取，默认False
+
+    返回值：
+    ----------
+    numpy.ndarray
+        升序排列的datetime64[D]数组
+
+    说明：
+    ----------
+    trade_cal的结果按年缓存到 .cache/calendar/exchange_days_YYYY.npy，之后不再调用接口；
+    无法从trade_cal获得的年份不写缓存，每次用chinese_calendar工作日剔除周末近似
+    """
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+    end = np.datetime64(pd.Timestamp(end_date).date(), 'D')
+    arrays = []
+    for year in range(pd.Timestamp(start_date).year, pd.Timestamp(end_date).year + 1):
+        if year not in _exchange_cache or refresh:
+            cache_file = os.path.join(get_cache_dir('calendar'), f"exchange_days_{year}.npy")
+            days = None
+            if os.path.exists(cache_file) and not refresh:
+                days = np.load(cache_file)
+            elif pro is not None:
+                try:
+                    days = _fetch_exchange_year(pro, year)
+                except Exception as e:
+                    print(f"⚠️ 读取 {year} 年交易日历失败，改用chinese_calendar: {e}")
+                if days is not None:
+                    np.save(cache_file, days)
+            if days is None:
+                try:
+                    days = _weekday_workdays(year)
+                except NotImplementedError:
+                    continue
+            else:
+                _exchange_cache[year] = days
+        else:
+            days = _exchange_cache[year]
+        arrays.append(days[(days >= start) & (days <= end)])
+    if not arrays:
+        return np.empty(0, dtype='datetime64[D]')
+    return np.concatenate(arrays)
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Tushare并发拉取调度工具
+====================
+功能说明：
+1. 令牌桶限流（TokenBucket）：按账户每分钟配额匀速发放调用令牌，多线程共享
+2. 自适应降速：接口返回频率限制错误时速率减半并清空令牌，之后每次成功逐步恢复到配额
+3. 有序并发拉取（fetch_in_order）：线程池并发执行拉取函数，结果按输入顺序逐个交付，
+   同时在途的任务数有上限，内存中最多保留这几天的数据
+4. 拉取/写入流水线（run_pipeline）：拉取结果放入有界队列，由一个或多个写入线程消费，
+   队列满时拉取端阻塞（背压），并按阶段累计耗时（StageTimer），便于判断瓶颈在网络还是数据库
+====================
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_config
+
+# 默认并发线程数与每分钟调用配额（可通过 TUSHARE_FETCH_WORKERS / TUSHARE_RATE_PER_MINUTE 覆盖）
+DEFAULT_WORKERS = 4
+DEFAULT_RATE_PER_MINUTE = 200
+# 默认写入线程数与写入队列长度（可通过 DAILY_WRITE_WORKERS / DAILY_WRITE_QUEUE_SIZE 覆盖）
+DEFAULT_WRITERS = 1
+DEFAULT_QUEUE_SIZE = 4
+# Tushare频率限制报错中的关键字
+RATE_LIMIT_KEYWORDS = ('最多访问', '频率', '每分钟', 'too many', 'rate limit')
+
+
+# ========================== 令牌桶限流 ==========================
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器
+
+    参数说明：
+    ----------
+    rate_per_minute : float
+        每分钟允许的调用次数（账户配额）
+    capacity : int, 可选
+        桶容量，即允许的瞬时突发调用数，默认为每秒速率（至少1）
+    min_rate_per_minute : float, 可选
+        降速下限，默认配额的1/10
+    recover_ratio : float, 可选
+        每次成功调用后恢复的速率（占配额的比例），默认0.05
+
+    说明：
+    ----------
+    acquire() 阻塞到拿到令牌为止；throttle() 在被接口限流时调用，速率减半并清空令牌；
+    recover() 在调用成功后调用，速率按recover_ratio逐步回升到配额
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, min_rate_per_minute=None, recover_ratio=0.05):
+        self.max_rate = float(rate_per_minute) / 60.0
+        self.rate = self.max_rate
+        self.min_rate = (float(min_rate_per_minute) / 60.0) if min_rate_per_minute else self.max_rate / 10
+        self.capacity = capacity or max(1, int(self.max_rate))
+        self.recover_step = self.max_rate * recover_ratio
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.throttle_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """按流逝时间补充令牌（调用方需持有锁）"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """取走一个令牌，令牌不足时睡眠到下一个令牌生成"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        """接口提示限流：速率减半（不低于下限）并清空令牌，返回降速后的每分钟速率"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.throttle_count += 1
+            return self.rate * 60
+
+    def recover(self):
+        """调用成功：速率逐步回升到配额"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.recover_step)
+
+    @property
+    def rate_per_minute(self):
+        return self.rate * 60
+
+
+def is_rate_limit_error(exc):
+    """判断异常是否为Tushare的频率限制报错"""
+    message = str(exc).lower()
+    return any(keyword in message for keyword in RATE_LIMIT_KEYWORDS)
+
+
+def get_fetch_settings(workers=None, rate_per_minute=None):
+    """读取并发线程数与每分钟配额（参数优先，其次配置项，最后默认值）"""
+    if workers is None:
+        workers = int(get_config('TUSHARE_FETCH_WORKERS', DEFAULT_WORKERS))
+    if rate_per_minute is None:
+        rate_per_minute = float(get_config('TUSHARE_RATE_PER_MINUTE', DEFAULT_RATE_PER_MINUTE))
+    return max(1, workers), rate_per_minute
+
+
+# ========================== 有序并发拉取 ==========================
+def fetch_in_order(fetch_func, items, workers=DEFAULT_WORKERS, max_in_flight=None):
+    """
+    线程池并发执行 fetch_func(item)，按items的顺序逐个交付结果
+
+    参数说明：
+    ----------
+    fetch_func : callable
+        单个任务的拉取函数（需自行处理限流与重试）
+    items : iterable
+        任务列表（如交易日），交付顺序与其一致
+    workers : int, 可选
+        线程数，默认4
+    max_in_flight : int, 可选
+        同时已提交但尚未交付的任务上限，默认workers的2倍
+
+    返回值：
+    ----------
+    generator
+        依次产出 (item, result)
+
+    说明：
+    ----------
+    队首任务完成前，后续已完成的结果在内存中等待，因此内存中最多保留max_in_flight个结果；
+    每交付一个结果前先补提交下一个任务，消费方处理结果（如写库）期间线程池不会空闲
+    """
+    max_in_flight = max(workers, max_in_flight or workers * 2)
+    items = iter(items)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tushare-fetch')
+    try:
+        for item in items:
+            pending.append((item, pool.submit(fetch_func, item)))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            next_item = next(items, None)
+            if next_item is not None:
+                pending.append((next_item, pool.submit(fetch_func, next_item)))
+            yield item, result
+    finally:
+        # 消费方提前退出或出错时，取消尚未开始的任务
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+# ========================== 拉取/写入流水线 ==========================
+def _current_rss_mb():
+    """当前进程的常驻内存（MB），优先读取/proc，其次使用getrusage的历史峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    """
+    线程安全的分阶段耗时累计器
+
+    参数说明：
+    ----------
+    sample_rss : bool, 可选
+        是否在阶段执行期间由后台线程采样峰值RSS，默认False
+    interval : float, 可选
+        RSS采样间隔（秒），默认0.005
+
+    说明：
+    ----------
+    各线程用 with timer.stage('名称'): ... 包住一段操作，耗时与次数按阶段名累加；
+    多线程并行的阶段累计值是各线程耗时之和，可能大于总耗时。
+    sample_rss=True 时另按阶段名记录开始时的RSS（start_rss_mb）与阶段内的峰值RSS（peak_rss_mb），单位MB
+    """
+
+    def __init__(self, sample_rss=False, interval=0.005):
+        self.totals = {}
+        self.counts = {}
+        self.start_rss_mb = {}
+        self.peak_rss_mb = {}
+        self.sample_rss = sample_rss
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _record_rss(self, name, start_rss, peak_rss):
+        with self._lock:
+            self.start_rss_mb.setdefault(name, start_rss)
+            self.peak_rss_mb[name] = max(self.peak_rss_mb.get(name, 0.0), peak_rss)
+
+    @contextmanager
+    def stage(self, name):
+        if self.sample_rss:
+            stop = threading.Event()
+            start_rss = _current_rss_mb()
+            peak = [start_rss]
+
+            def sample():
+                while not stop.wait(self.interval):
+                    peak[0] = max(peak[0], _current_rss_mb())
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            if self.sample_rss:
+                stop.set()
+                sampler.join()
+                self._record_rss(name, start_rss, max(peak[0], _current_rss_mb()))
+
+    def report(self, wall_seconds):
+        """打印各阶段累计耗时及占总耗时的比例"""
+        print(f"\n⏱️ 分阶段耗时（总耗时 {wall_seconds:.1f} 秒）：")
+        for name, seconds in self.totals.items():
+            share = seconds / wall_seconds if wall_seconds > 0 else 0.0
+            print(f"   {name:<12} {seconds:>9.1f} 秒  {self.counts[name]:>6} 次  占总耗时 {share:>6.1%}")
+
+
+def get_write_settings(writers=None, queue_size=None):
+    """读取写入线程数与写入队列长度（参数优先，其次配置项，最后默认值）"""
+    if writers is None:
+        writers = int(get_config('DAILY_WRITE_WORKERS', DEFAULT_WRITERS))
+    if queue_size is None:
+        queue_size = int(get_config('DAILY_WRITE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+    return max(1, writers), max(1, queue_size)
+
+
+def run_pipeline(results, consume_func, writers=DEFAULT_WRITERS, queue_size=DEFAULT_QUEUE_SIZE, timer=None):
+    """
+    拉取/写入流水线：当前线程迭代results放入有界队列，writers个写入线程并行调用consume_func消费
+
+    参数说明：
+    ----------
+    results : iterable
+        拉取端产出的结果（如 fetch_in_order 的生成器），迭代本身即拉取阶段
+    consume_func : callable
+        写入函数，参数为results中的单个元素；多个写入线程时需自行保证线程安全
+    writers : int, 可选
+        写入线程数，默认1（多个写入线程时写入顺序不再与results一致）
+    queue_size : int, 可选
+        队列长度上限，默认4；队列满时拉取端阻塞，内存中最多保留 queue_size + writers 个结果
+    timer : StageTimer, 可选
+        传入时记录「等待拉取」「背压等待」「写入」「写入空闲」四个阶段的耗时
+
+    返回值：
+    ----------
+    int
+        已消费的结果数
+
+    说明：
+    ----------
+    任一写入线程抛出异常后流水线停止：拉取端不再放入新结果，异常在当前线程重新抛出
+    """
+    timer = timer or StageTimer()
+    work_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    done = [0]
+    done_lock = threading.Lock()
+    finished = object()
+
+    def writer_loop():
+        while True:
+            with timer.stage('写入空闲'):
+                item = work_queue.get()
+            if item is finished:
+                return
+            if stop.is_set():
+                continue
+            try:
+                with timer.stage('写入'):
+                    consume_func(item)
+                with done_lock:
+                    done[0] += 1
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+    threads = [threading.Thread(target=writer_loop, name=f'daily-writer-{i}', daemon=True) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        results = iter(results)
+        while not stop.is_set():
+            with timer.stage('等待拉取'):
+                item = next(results, finished)
+            if item is finished:
+                break
+            # 队列满时阻塞即背压；定时醒来检查写入线程是否已出错
+            with timer.stage('背压等待'):
+                while not stop.is_set():
+                    try:
+                        work_queue.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+    finally:
+        # 出错时清空队列，保证结束标记能放进去
+        if stop.is_set():
+            while True:
+                try:
+                    work_queue.get_nowait()
+                except queue.Empty:
+                    break
+        for _ in threads:
+            work_queue.put(finished)
+        for thread in threads:
+            thread.join()
+        # 提前结束时关闭拉取端（取消尚未开始的拉取任务）
+        if hasattr(results, 'close'):
+            results.close()
+
+    if errors:
+        raise errors[0]
+    return done[0]
@@ -12,25 +12,40 @@
 使用依赖：
 - pandas: 数据处理
 - pymysql/sqlalchemy: MySQL数据库交互
-- chinese_calendar: 节假日/工作日判断
+- chinese_calendar: 节假日/工作日判断（经trade_calendar预计算并缓存）
 - Python 3.7+
 
 配置说明：
 - 修改mysql_config字典中的数据库连接信息
 - 可调整选股参数d1（默认值0）
+- SELECT_MODE=incremental（默认）仅读取每个评估日的回看窗口并跳过已有同版本结果的日期；
+  SELECT_MODE=full 全量评估整个日期区间：默认按 SELECT_MEMORY_MB（默认256）流式读取，
+  或配合 SELECT_WORKERS=N 整区间读取后多进程分片执行
+- 增量模式默认先在SQL端预筛选（SELECT_PREFILTER=1）：只取出回看区间内收盘价涨幅超过条件1阈值的(股票, 日期)，
+  再只读取这些股票的回看区间，结果与读取全部股票一致；SELECT_PREFILTER=0 关闭
+- 配置 UNIVERSE_BOARDS（逗号分隔：main,chinext,star,bj）、UNIVERSE_MIN_LISTED_DAYS、UNIVERSE_EXCLUDE_ST=1 时，
+  先按股票池掩码（universe_masks.py）剔除股票，再计算REF与选股条件
+- USE_DAILY_CACHE=1 时load_stock_data优先读取本地日线缓存（python utils/daily_cache.py sync）
+- SELECT_STRATEGIES=all（或逗号分隔的策略标识）时，一次读取数据后评估strategy_registry中登记的多个策略，
+  结果按strategy_id区分
+- 每次运行记录到stock_select_runs：相同区间、参数与数据版本的重复运行，或内容与已存储结果集相同时，
+  只记录运行、指向已有结果集，不再重复写入stock_selected；增量模式跳过了部分交易日时，
+  结果集不代表整个区间，不记录运行
 ====================
 作者：自动生成
 更新时间：2026-01-26
 """
 
+import numpy as np
 import pandas as pd
 import pymysql
 from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
-# 导入节假日判断库，用于工作日/节假日识别
-from chinese_calendar import is_holiday, is_workday
+import hashlib
+import json
 import os
 import sys
+import time
 from dotenv import load_dotenv
 
 # 添加当前目录到系统路径，以便导入 db_utils
@@ -39,10 +54,28 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
-    from db_utils import get_db_engine, log_task_execution
+    from db_utils import get_config, get_db_engine, log_task_execution
+    from trade_calendar import next_workday, prev_workday, minus_workdays
+    from daily_reader import (
+        read_daily_typed, read_daily_windows, read_day_fingerprints, read_jump_candidates, read_trade_days,
+        read_short_codes, read_history_starts, read_day_codes
+    )
+    from bulk_writer import bulk_upsert, format_upsert_stats
 except ImportError:
     sys.path.append(os.path.join(os.path.dirname(current_dir)))
-    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.db_utils import get_config, get_db_engine, log_task_execution
+    from utils.trade_calendar import next_workday, prev_workday, minus_workdays
+    from utils.daily_reader import (
+        read_daily_typed, read_daily_windows, read_day_fingerprints, read_jump_candidates, read_trade_days,
+        read_short_codes, read_history_starts, read_day_codes
+    )
+    from utils.bulk_writer import bulk_upsert, format_upsert_stats
+
+# 表结构统一定义在仓库根目录的init_tidb.py中（初始化与选股流程共用同一份建表语句）
+root_dir = os.path.dirname(current_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from init_tidb import STOCK_SELECT_METRICS_DDL, STOCK_SELECT_RUNS_DDL
 
 # 加载环境变量
 load_dotenv()
@@ -53,7 +86,7 @@ engine = get_db_engine()
 
 
 # ========================== 数据读取模块 ==========================
-def load_stock_data(start_date='20200101', end_date='20251231'):
+def load_stock_data(start_date='20200101', end_date='20251231', freq='D'):
     """
     从MySQL的cn_stock_daily表读取指定日期区间的股票日线数据
 
@@ -63,12 +96,15 @@ def load_stock_data(start_date='20200101', end_date='20251231'):
         数据起始日期，格式为YYYYMMDD，默认值'20200101'
     end_date : str, 可选
         数据结束日期，格式为YYYYMMDD，默认值'20251231'
+    freq : str, 可选
+        K线周期：D（日线，默认）、W（周线cn_stock_weekly）、M（月线cn_stock_monthly）；
+        周线/月线由period_bars.py维护，trade_date为该周期最后一个交易日，字段与日线相同
 
     返回值：
     ----------
     pandas.DataFrame
         包含股票日线数据的DataFrame，字段说明：
-        - ts_code: 股票代码
+        - ts_code: 股票代码（Categorical类型）
         - trade_date: 交易日期（datetime类型）
         - price_open/price_high/price_low/price_close: 开/高/低/收盘价
         - price_pre_close: 前收盘价
@@ -76,23 +112,78 @@ def load_stock_data(start_date='20200101', end_date='20251231'):
         - pct_chg: 涨跌幅（%）
         - vol: 成交量（手）
         - amount: 成交金额（元）
+        价格/成交量字段均为float64（不再是decimal.Decimal对象）
     """
-    # 构造SQL查询语句，读取指定字段和日期区间的数据
-    sql = f"""
-    SELECT ts_code, trade_date, price_open, price_high, price_low, 
+    if freq != 'D':
+        return read_daily_typed(engine, start_date, end_date, freq=freq)
+    # 配置 USE_DAILY_CACHE=1 时优先读取本地Parquet缓存（见daily_cache.py）
+    if str(get_config('USE_DAILY_CACHE', '0')) == '1':
+        from daily_cache import load_daily_with_cache
+        return load_daily_with_cache(engine, start_date, end_date)
+    # DECIMAL字段在SQL端转为DOUBLE，直接解码为float数组；ts_code为Categorical，trade_date只解析一次
+    return read_daily_typed(engine, start_date, end_date)
+
+
+# 流式读取时每行的内存估算（含数据库行对象与DataFrame转换开销），用于换算内存预算
+ESTIMATED_ROW_BYTES = 1024
+
+
+def iter_stock_data(start_date='20200101', end_date='20251231', memory_budget_mb=256, fetch_size=10000):
+    """
+    流式读取cn_stock_daily：服务端游标逐批拉取，按ts_code顺序分块输出完整股票的数据
+
+    参数说明：
+    ----------
+    start_date / end_date : str, 可选
+        数据起止日期，格式为YYYYMMDD
+    memory_budget_mb : int, 可选
+        单个数据块的内存预算（MB），默认256；单只股票超过预算时该股票单独成块
+    fetch_size : int, 可选
+        每次从服务端游标拉取的行数，默认10000
+
+    返回值：
+    ----------
+    generator of pandas.DataFrame
+        字段与load_stock_data一致；每只股票的全部K线只出现在同一个数据块中
+    """
+    sql = text("""
+    SELECT ts_code, trade_date, price_open, price_high, price_low,
            price_close, price_pre_close, amt_chg, pct_chg, vol, amount
     FROM cn_stock_daily
-    WHERE trade_date BETWEEN '{start_date}' AND '{end_date}'
+    WHERE trade_date BETWEEN :start_date AND :end_date
     ORDER BY ts_code, trade_date
-    """
-    # 执行SQL查询并读取数据
-    df = pd.read_sql(sql, engine)
-    # 将trade_date字段从字符串转换为datetime类型（便于后续日期计算）
-    df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-    return df
+    """)
+    rows_budget = max(int(memory_budget_mb * 1024 * 1024 / ESTIMATED_ROW_BYTES), fetch_size)
+
+    def to_frame(rows, columns):
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
+        return df
+
+    # stream_results 使 PyMySQL 使用服务端游标（SSCursor），客户端不再缓存整个结果集
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=fetch_size) as conn:
+        result = conn.execute(sql, {"start_date": start_date, "end_date": end_date})
+        columns = list(result.keys())
+        buffer = []
+        for partition in result.partitions(fetch_size):
+            buffer.extend(tuple(row) for row in partition)
+            if len(buffer) < rows_budget:
+                continue
+            # 在最后一只股票的起始行处切分，保证输出的都是完整股票
+            last_code = buffer[-1][0]
+            cut = len(buffer)
+            while cut > 0 and buffer[cut - 1][0] == last_code:
+                cut -= 1
+            if cut == 0:
+                continue
+            yield to_frame(buffer[:cut], columns)
+            buffer = buffer[cut:]
+        if buffer:
+            yield to_frame(buffer, columns)
 
 
 # ========================== 日期处理辅助函数 ==========================
+# 单个日期的工作日换算，底层统一走trade_calendar的预计算工作日数组
 def get_nearest_workday_forward(date):
     """
     日期向后顺延：获取输入日期之后最近的工作日（跳过周末和法定节假日）
@@ -111,19 +202,7 @@ def get_nearest_workday_forward(date):
     ----------
     用于计算buy_date字段
     """
-    # 提取date对象的date部分（去除时分秒），适配chinese_calendar库的参数要求
-    check_date = date.date()
-
-    # 循环判断，直到找到工作日
-    while True:
-        # 判断当前日期是否为工作日（非周末+非法定节假日）
-        if is_workday(check_date):
-            break
-        # 非工作日则向后顺延1天
-        check_date += timedelta(days=1)
-
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(check_date, datetime.min.time())
+    return next_workday([date])[0].to_pydatetime()
 
 
 def get_nearest_workday_backward(date):
@@ -144,19 +223,7 @@ def get_nearest_workday_backward(date):
     ----------
     用于计算gold_date字段
     """
-    # 提取date对象的date部分（去除时分秒），适配chinese_calendar库的参数要求
-    check_date = date.date()
-
-    # 循环判断，直到找到工作日
-    while True:
-        # 判断当前日期是否为工作日（非周末+非法定节假日）
-        if is_workday(check_date):
-            break
-        # 非工作日则向前回溯1天
-        check_date -= timedelta(days=1)
-
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(check_date, datetime.min.time())
+    return prev_workday([date])[0].to_pydatetime()
 
 
 def minus_n_workdays(date, n):
@@ -179,44 +246,388 @@ def minus_n_workdays(date, n):
     ----------
     用于计算gold_date的基准日期（buy_date向前推4个工作日）
     """
-    # 提取date对象的date部分（去除时分秒）
-    current_date = date.date()
-    # 计数器：已找到的工作日数量
-    count = 0
+    return minus_workdays([date], n)[0].to_pydatetime()
 
-    # 循环向前找，直到凑够N个工作日
-    while count < n:
-        # 日期向前推1天
-        current_date -= timedelta(days=1)
-        # 如果是工作日，计数器+1
-        if is_workday(current_date):
-            count += 1
 
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(current_date, datetime.min.time())
+def compute_buy_gold_dates(trade_dates, d1=0):
+    """
+    批量计算buy_date和gold_date（一次searchsorted完成整列换算）
+
+    参数说明：
+    ----------
+    trade_dates : pandas.Series
+        入选记录的交易日期（datetime类型）
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+
+    返回值：
+    ----------
+    tuple(pandas.Series, pandas.Series)
+        (buy_date, gold_date)，索引与trade_dates一致
+    """
+    # 1. 计算原始buy_date并调整为最近的工作日
+    raw_buy_date = trade_dates - timedelta(days=d1 - 1)
+    buy_date = next_workday(raw_buy_date)
+    # 2. 基于buy_date向前推4个工作日，再调整为最近的工作日（得到gold_date）
+    gold_date = prev_workday(minus_workdays(buy_date, 4))
+    buy_date.index = trade_dates.index
+    gold_date.index = trade_dates.index
+    return buy_date, gold_date
 
 
 # ========================== 核心选股逻辑模块 ==========================
-def select_stocks(df, d1=0):
+def group_positions(codes):
+    """
+    计算每一行在所属股票分组内的序号（要求数据已按ts_code、trade_date排序）
+
+    参数说明：
+    ----------
+    codes : numpy.ndarray
+        按ts_code排序后的股票代码数组
+
+    返回值：
+    ----------
+    numpy.ndarray
+        与codes等长的int64数组，每只股票的第一行为0，依次递增
+    """
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    row_index = np.arange(n, dtype=np.int64)
+    # 标记每只股票的起始行
+    is_group_start = np.empty(n, dtype=bool)
+    is_group_start[0] = True
+    is_group_start[1:] = codes[1:] != codes[:-1]
+    # 向下传播分组起点的行号，行号差即组内序号
+    group_start = np.maximum.accumulate(np.where(is_group_start, row_index, 0))
+    return row_index - group_start
+
+
+def ref_array(values, n, positions):
+    """
+    向量化的通达信REF函数：在整个股票池上一次性取N天前的值
+
+    参数说明：
+    ----------
+    values : numpy.ndarray
+        按ts_code、trade_date排序后的float数组
+    n : int
+        滞后天数（N>=0）
+    positions : numpy.ndarray
+        group_positions返回的组内序号，用于屏蔽跨股票取值
+
+    返回值：
+    ----------
+    numpy.ndarray
+        滞后N天的float64数组，组内不足N天的位置为NaN（等价于groupby().shift(N)）
+    """
+    if n == 0:
+        return values
+    result = np.full(len(values), np.nan)
+    if n < len(values):
+        result[n:] = values[:-n]
+    # 不足N天的行会取到上一只股票的数据，需置为NaN
+    result[positions < n] = np.nan
+    return result
+
+
+# 选股公式默认阈值：条件1涨幅比、条件2缩量系数、条件3放量倍数
+DEFAULT_THRESHOLDS = {'jump_ratio': 1.08, 'shrink_ratio': 1.1, 'surge_ratio': 1.5}
+
+# 本脚本内置选股公式在stock_selected.strategy_id中的标识（其他策略见strategy_registry.py）
+DEFAULT_STRATEGY_ID = 'tdx_shrink_pullback'
+
+# 选股公式用到的字段：公式变量名 -> cn_stock_daily字段名
+FORMULA_FIELDS = {'close': 'price_close', 'vol': 'vol', 'low': 'price_low'}
+
+
+def prepare_panel(df, fields=None):
+    """
+    将长表日线数据整理为选股所需的排序数组
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        股票日线数据（来自load_stock_data函数的返回值）
+    fields : dict, 可选
+        需要转换为float数组的字段映射，默认FORMULA_FIELDS
+
+    返回值：
+    ----------
+    tuple(pandas.DataFrame, numpy.ndarray, dict)
+        (按ts_code、trade_date稳定排序后的DataFrame, 组内序号, {变量名: float64数组})
+    """
+    fields = fields or FORMULA_FIELDS
+    df = df.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    positions = group_positions(df['ts_code'].to_numpy())
+    arrays = {name: df[column].to_numpy(dtype=np.float64) for name, column in fields.items()}
+    return df, positions, arrays
+
+
+def make_ref(arrays, positions):
+    """
+    构造带缓存的REF函数：同一(字段, 滞后天数)只计算一次
+
+    返回值：
+    ----------
+    function
+        ref(name, n) -> numpy.ndarray
+    """
+    cache = {}
+
+    def ref(name, n):
+        key = (name, n)
+        if key not in cache:
+            cache[key] = ref_array(arrays[name], n, positions)
+        return cache[key]
+
+    return ref
+
+
+def compute_conditions(ref, d1=0, jump_ratio=1.08, shrink_ratio=1.1, surge_ratio=1.5, timings=None):
+    """
+    计算选股条件1-4的布尔掩码
+
+    参数说明：
+    ----------
+    ref : function
+        make_ref返回的REF函数
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+    jump_ratio / shrink_ratio / surge_ratio : float, 可选
+        条件1涨幅比、条件2缩量系数、条件3放量倍数
+    timings : dict, 可选
+        传入时累加各步骤耗时（秒）：ref（全部滞后值）、condition1-condition4
+
+    返回值：
+    ----------
+    list
+        [condition1, condition2, condition3, condition4]，均为bool数组
+    """
+    last_tick = [time.perf_counter()]
+
+    def lap(step):
+        if timings is not None:
+            now = time.perf_counter()
+            timings[step] = timings.get(step, 0.0) + now - last_tick[0]
+            last_tick[0] = now
+
+    # ===================== 计算滞后值（通达信REF函数） =====================
+    ref_close_d1_3 = ref('close', d1 + 3)  # REF(CLOSE,D1+3)
+    ref_close_d1_4 = ref('close', d1 + 4)  # REF(CLOSE,D1+4)
+    ref_vol_d1_0 = ref('vol', d1 + 0)  # REF(VOL,D1+0)
+    ref_vol_d1_1 = ref('vol', d1 + 1)  # REF(VOL,D1+1)
+    ref_vol_d1_2 = ref('vol', d1 + 2)  # REF(VOL,D1+2)
+    ref_vol_d1_3 = ref('vol', d1 + 3)  # REF(VOL,D1+3)
+    ref_vol_d1_4 = ref('vol', d1 + 4)  # REF(VOL,D1+4)
+    ref_low_d1_0 = ref('low', d1 + 0)  # REF(LOW,D1+0)
+    ref_low_d1_1 = ref('low', d1 + 1)  # REF(LOW,D1+1)
+    ref_low_d1_2 = ref('low', d1 + 2)  # REF(LOW,D1+2)
+    ref_low_d1_3 = ref('low', d1 + 3)  # REF(LOW,D1+3)
+    lap('ref')
+
+    # ===================== 选股条件判断 =====================
+    # NaN参与的比较均为False，与逐只股票shift后的判断结果一致
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 条件1：当日涨幅8%以上
+        condition1 = (ref_close_d1_3 / ref_close_d1_4) > jump_ratio
+        lap('condition1')
+
+        # 条件2：成交量逐日递减（三个子条件需同时满足）
+        condition2 = (ref_vol_d1_0 * shrink_ratio < ref_vol_d1_3) & \
+                     (ref_vol_d1_1 * shrink_ratio < ref_vol_d1_2) & \
+                     (ref_vol_d1_2 * shrink_ratio < ref_vol_d1_3)
+        lap('condition2')
+
+        # 条件3：三天前放量
+        condition3 = ref_vol_d1_3 >= surge_ratio * ref_vol_d1_4
+        lap('condition3')
+
+        # 条件4：最低价递增（三个子条件需同时满足）
+        avg_price = (ref_low_d1_3 + ref_close_d1_3) / 2
+        condition4 = (ref_low_d1_0 > avg_price) & \
+                     (ref_low_d1_1 > avg_price) & \
+                     (ref_low_d1_2 > avg_price)
+        lap('condition4')
+
+    return [condition1, condition2, condition3, condition4]
+
+
+def build_condition_funnel(conditions, trade_dates, eval_mask=None):
+    """
+    按交易日统计依次满足条件1-4后剩余的记录数（直接复用已计算的条件掩码）
+
+    参数说明：
+    ----------
+    conditions : list
+        compute_conditions的返回值
+    trade_dates : numpy.ndarray
+        与掩码等长的交易日期数组（datetime64）
+    eval_mask : numpy.ndarray, 可选
+        参与评估的行（其余行只作为回看数据），默认全部行
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        trade_date、candidates（参与评估的记录数）、cond1-cond4（依次满足条件1..N后剩余的记录数）
+    """
+    if eval_mask is None:
+        eval_mask = np.ones(len(trade_dates), dtype=bool)
+    columns = ['trade_date', 'candidates', 'cond1', 'cond2', 'cond3', 'cond4']
+    if not eval_mask.any():
+        return pd.DataFrame(columns=columns)
+    # 交易日换算为相对天数后用bincount计数，避免逐日分组
+    day_numbers = trade_dates.astype('datetime64[D]').astype(np.int64)
+    base_day = day_numbers[eval_mask].min()
+    day_index = np.where(eval_mask, day_numbers - base_day, 0)
+    n_days = int(day_index.max()) + 1
+    counts = {'candidates': np.bincount(day_index, weights=eval_mask, minlength=n_days)}
+    survived = eval_mask
+    for i, condition in enumerate(conditions, start=1):
+        survived = survived & condition
+        counts[f'cond{i}'] = np.bincount(day_index, weights=survived, minlength=n_days)
+    funnel = pd.DataFrame(counts).astype(np.int64)
+    funnel.insert(0, 'trade_date', (base_day + np.arange(n_days)).astype('datetime64[D]').astype('datetime64[ns]'))
+    return funnel[funnel['candidates'] > 0].reset_index(drop=True)[columns]
+
+
+def cross_section_top_n(values, trade_dates, positions, top_n, largest=True):
+    """
+    按交易日在全市场截面上取排名前N的记录（通达信"排名前N"类条件）
+
+    参数说明：
+    ----------
+    values : numpy.ndarray
+        排名指标，与面板行一一对应（NaN/±inf不参与排名）
+    trade_dates : numpy.ndarray
+        与values等长的交易日期数组（datetime64）
+    positions : numpy.ndarray
+        group_positions返回的组内序号（行按ts_code、trade_date排序）
+    top_n : int
+        每个交易日取前N名
+    largest : bool, 可选
+        True（默认）取最大的N个，False取最小的N个
+
+    返回值：
+    ----------
+    numpy.ndarray
+        int32名次数组：入选记录为1..N（1为第一名），其余为0；数值并列时名次先后不保证
+
+    说明：
+    ----------
+    面板展开为 交易日 × 股票 的矩阵后，沿股票轴用argpartition取前N列（O(股票数)），
+    只对选出的N个值排序确定名次，不对整个截面排序
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ranks = np.zeros(len(values), dtype=np.int32)
+    if len(values) == 0 or top_n <= 0:
+        return ranks
+
+    stock_ids = np.cumsum(positions == 0) - 1
+    day_values, day_ids = np.unique(trade_dates, return_inverse=True)
+    n_days, n_stocks = len(day_values), int(stock_ids[-1]) + 1
+    # 统一转为"越大越靠前"，缺失（当日无K线或指标无效）记为-inf
+    scores = np.full((n_days, n_stocks), -np.inf)
+    scores[day_ids, stock_ids] = np.where(np.isfinite(values), values if largest else -values, -np.inf)
+    rows = np.full((n_days, n_stocks), -1, dtype=np.int64)
+    rows[day_ids, stock_ids] = np.arange(len(values))
+
+    k = min(int(top_n), n_stocks)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    valid = np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+    top_rows = np.take_along_axis(rows, top, axis=1)
+    rank_matrix = np.broadcast_to(np.arange(1, k + 1, dtype=np.int32), top.shape)
+    ranks[top_rows[valid]] = rank_matrix[valid]
+    return ranks
+
+
+def get_universe_filter():
+    """
+    按配置生成股票池过滤函数（先增量追加股票池掩码的新交易日），未配置任何股票池条件时返回None；
+    掩码需先显式构建（python utils/universe_masks.py build --start YYYYMMDD），不存在时抛出FileNotFoundError
+
+    配置项：UNIVERSE_BOARDS（逗号分隔：main,chinext,star,bj）、UNIVERSE_MIN_LISTED_DAYS（最少上市自然日数）、
+    UNIVERSE_EXCLUDE_ST（1表示剔除ST股）
+    """
+    filters = {}
+    boards = str(get_config('UNIVERSE_BOARDS', '') or '').strip()
+    if boards:
+        filters['boards'] = [board.strip() for board in boards.split(',') if board.strip()]
+    min_listed_days = int(get_config('UNIVERSE_MIN_LISTED_DAYS', 0) or 0)
+    if min_listed_days:
+        filters['min_listed_days'] = min_listed_days
+    if str(get_config('UNIVERSE_EXCLUDE_ST', '0')) == '1':
+        filters['exclude_st'] = True
+    if not filters:
+        return None
+
+    from universe_masks import make_universe_filter, open_universe, sync_universe
+    sync_universe(engine)
+    universe = open_universe()
+    if filters.get('exclude_st'):
+        st_from = f"自 {universe['st_from']} 起记录" if universe['st_from'] else "尚未记录（sync后开始记录）"
+        print(f"ℹ️ 股票池ST快照{st_from}，没有快照的交易日不按ST剔除")
+    return make_universe_filter(universe, **filters)
+
+
+def restrict_to_universe(df, universe, eval_dates=None):
+    """
+    按股票池预先剔除股票：评估日（默认全部行）中没有任何一行在股票池内的股票不再参与后续计算
+
+    参数说明：
+    ----------
+    universe : function
+        universe_masks.make_universe_filter返回的过滤函数
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        剔除后的日线数据（保留股票的回看K线不受影响）
+    """
+    if df.empty:
+        return df
+    eligible = universe(df['ts_code'], df['trade_date'])
+    if eval_dates is not None:
+        eligible &= df['trade_date'].isin(pd.to_datetime(eval_dates)).to_numpy()
+    keep_codes = pd.unique(df['ts_code'].to_numpy()[eligible])
+    return df[df['ts_code'].isin(keep_codes)]
+
+
+def select_stocks(df, d1=0, eval_dates=None, metrics=None, universe=None, **thresholds):
     """
     核心选股逻辑：基于通达信公式筛选符合条件的股票
 
+    所有REF滞后值在全市场数据上一次性计算（按组内序号屏蔽跨股票取值），
+    条件1-4均为整列布尔掩码，不再逐只股票循环。
+
     参数说明：
     ----------
     df : pandas.DataFrame
         输入的股票日线数据（来自load_stock_data函数的返回值）
     d1 : int, 可选
         选股公式中的D1参数，用于调整滞后值计算，默认值0
+    eval_dates : array-like, 可选
+        仅评估这些交易日（其余行只作为REF的回看数据），默认None表示评估全部行
+    metrics : dict, 可选
+        传入时收集漏斗统计：timings（各步骤累计耗时，秒）、funnels（build_condition_funnel结果列表），
+        多次调用（流式/分段选股）可共用同一个dict
+    universe : function, 可选
+        股票池过滤函数（universe_masks.make_universe_filter），只评估股票池内的记录；
+        不在股票池内的股票在计算REF之前即被剔除
+    **thresholds : 可选
+        覆盖DEFAULT_THRESHOLDS中的阈值（jump_ratio/shrink_ratio/surge_ratio）
 
     返回值：
     ----------
     pandas.DataFrame
-        符合选股条件的股票数据，包含新增字段：
+        符合选股条件的股票数据（按ts_code、trade_date升序），包含新增字段：
         - buy_date: 买入日期（datetime类型）
         - gold_date: 黄金日期（datetime类型）
-        已移除所有ref_开头的临时计算字段
 
-    选股条件（需同时满足）：
+    选股条件（需同时满足，括号内为默认阈值）：
     ----------
     1. 当日涨幅8%以上：REF(CLOSE,D1+3)/REF(CLOSE,D1+4) > 1.08
     2. 成交量逐日递减：REF(VOL,D1+0)*1.1 < REF(VOL,D1+3)
@@ -227,80 +638,687 @@ def select_stocks(df, d1=0):
                    AND REF(LOW,D1+1) > (REF(LOW,D1+3)+REF(CLOSE,D1+3))/2
                    AND REF(LOW,D1+2) > (REF(LOW,D1+3)+REF(CLOSE,D1+3))/2
     """
-    # 存储每个股票符合条件的记录
+    if universe is not None:
+        df = restrict_to_universe(df, universe, eval_dates)
+    if df.empty:
+        return pd.DataFrame()
+
+    # 按股票代码、交易日期排序（稳定排序，与逐只股票处理的输出顺序一致）
+    df, positions, arrays = prepare_panel(df)
+    ref = make_ref(arrays, positions)
+    params = {**DEFAULT_THRESHOLDS, **thresholds}
+
+    # 综合所有条件：需同时满足条件1-4
+    timings = metrics.setdefault('timings', {}) if metrics is not None else None
+    conditions = compute_conditions(ref, d1=d1, timings=timings, **params)
+    final_condition = np.logical_and.reduce(conditions)
+    eval_mask = None
+    if eval_dates is not None:
+        eval_mask = df['trade_date'].isin(pd.to_datetime(eval_dates)).to_numpy()
+    if universe is not None:
+        in_universe = universe(df['ts_code'], df['trade_date'])
+        eval_mask = in_universe if eval_mask is None else eval_mask & in_universe
+    if eval_mask is not None:
+        final_condition &= eval_mask
+    if metrics is not None:
+        metrics.setdefault('funnels', []).append(
+            build_condition_funnel(conditions, df['trade_date'].to_numpy(), eval_mask)
+        )
+    if not final_condition.any():
+        # 无符合条件的记录时，返回空DataFrame
+        return pd.DataFrame()
+
+    Stock_Selected = df[final_condition].reset_index(drop=True)
+
+    # ===================== 计算buy_date和gold_date（仅针对入选记录） =====================
+    Stock_Selected['buy_date'], Stock_Selected['gold_date'] = compute_buy_gold_dates(
+        Stock_Selected['trade_date'], d1=d1
+    )
+
+    return Stock_Selected
+
+
+def select_stocks_streaming(start_date, end_date, d1=0, memory_budget_mb=256, eval_dates=None, metrics=None,
+                            universe=None, **thresholds):
+    """
+    流式选股：逐块读取完整股票的数据并选股，峰值内存由memory_budget_mb决定，与日期区间长度无关
+
+    参数说明：
+    ----------
+    start_date / end_date : str
+        数据起止日期，格式为YYYYMMDD
+    d1 / eval_dates / metrics / universe / **thresholds :
+        同select_stocks
+    memory_budget_mb : int, 可选
+        单个数据块的内存预算（MB），默认256
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与select_stocks(load_stock_data(start_date, end_date))相同的结果
+    """
     result_list = []
+    total_rows = 0
+    for chunk in iter_stock_data(start_date, end_date, memory_budget_mb=memory_budget_mb):
+        total_rows += len(chunk)
+        selected = select_stocks(chunk, d1=d1, eval_dates=eval_dates, metrics=metrics, universe=universe,
+                                 **thresholds)
+        if not selected.empty:
+            result_list.append(selected)
+        print(f"   已处理 {total_rows:,} 行，当前块 {chunk['ts_code'].iloc[0]} - {chunk['ts_code'].iloc[-1]}")
+    if not result_list:
+        return pd.DataFrame()
+    # 各数据块按ts_code顺序输出，直接拼接即保持select_stocks的排序
+    return pd.concat(result_list, ignore_index=True)
+
+
+# ========================== 增量选股模块 ==========================
+def get_lookback_days(d1=0):
+    """选股公式最远引用REF(X,D1+4)，每个评估日需要向前回看的交易日数"""
+    return d1 + 4
+
+
+def get_trade_days(start_date, end_date):
+    """
+    读取cn_stock_daily中[start_date, end_date]区间内有数据的交易日
 
-    # 按股票代码分组，逐只股票处理
-    for ts_code, group in df.groupby('ts_code'):
-        # 按交易日期升序排列，并重置索引（避免分组后索引混乱）
-        group = group.sort_values('trade_date').reset_index(drop=True)
-
-        # ===================== 计算滞后值（通达信REF函数） =====================
-        # REF(X,N) 表示取N天前的X值，这里基于D1参数调整滞后天数
-        group['ref_close_d1_3'] = group['price_close'].shift(d1 + 3)  # REF(CLOSE,D1+3)
-        group['ref_close_d1_4'] = group['price_close'].shift(d1 + 4)  # REF(CLOSE,D1+4)
-        group['ref_vol_d1_0'] = group['vol'].shift(d1 + 0)  # REF(VOL,D1+0)
-        group['ref_vol_d1_1'] = group['vol'].shift(d1 + 1)  # REF(VOL,D1+1)
-        group['ref_vol_d1_2'] = group['vol'].shift(d1 + 2)  # REF(VOL,D1+2)
-        group['ref_vol_d1_3'] = group['vol'].shift(d1 + 3)  # REF(VOL,D1+3)
-        group['ref_vol_d1_4'] = group['vol'].shift(d1 + 4)  # REF(VOL,D1+4)
-        group['ref_low_d1_0'] = group['price_low'].shift(d1 + 0)  # REF(LOW,D1+0)
-        group['ref_low_d1_1'] = group['price_low'].shift(d1 + 1)  # REF(LOW,D1+1)
-        group['ref_low_d1_2'] = group['price_low'].shift(d1 + 2)  # REF(LOW,D1+2)
-        group['ref_low_d1_3'] = group['price_low'].shift(d1 + 3)  # REF(LOW,D1+3)
-
-        # ===================== 计算buy_date和gold_date =====================
-        # 1. 计算原始buy_date并调整为最近的工作日
-        raw_buy_date = group['trade_date'] - timedelta(days=d1 - 1)
-        group['buy_date'] = raw_buy_date.apply(lambda x: get_nearest_workday_forward(x))
-
-        # 2. 基于buy_date向前推4个工作日，再调整为最近的工作日（得到gold_date）
-        raw_gold_date = group['buy_date'].apply(lambda x: minus_n_workdays(x, 4))
-        group['gold_date'] = raw_gold_date.apply(lambda x: get_nearest_workday_backward(x))
-
-        # ===================== 选股条件判断 =====================
-        # 条件1：当日涨幅8%以上
-        condition1 = (group['ref_close_d1_3'] / group['ref_close_d1_4']) > 1.08
+    返回值：
+    ----------
+    pandas.DatetimeIndex
+        升序排列的交易日
+    """
+    return read_trade_days(engine, start_date, end_date)
 
-        # 条件2：成交量逐日递减（三个子条件需同时满足）
-        condition2 = (group['ref_vol_d1_0'] * 1.1 < group['ref_vol_d1_3']) & \
-                     (group['ref_vol_d1_1'] * 1.1 < group['ref_vol_d1_2']) & \
-                     (group['ref_vol_d1_2'] * 1.1 < group['ref_vol_d1_3'])
 
-        # 条件3：三天前放量
-        condition3 = group['ref_vol_d1_3'] >= 1.5 * group['ref_vol_d1_4']
+def get_day_fingerprints(start_date, end_date):
+    """
+    按交易日汇总cn_stock_daily的内容指纹（行数 + 全部行情字段的行签名汇总）
 
-        # 条件4：最低价递增（三个子条件需同时满足）
-        avg_price = (group['ref_low_d1_3'] + group['ref_close_d1_3']) / 2
-        condition4 = (group['ref_low_d1_0'] > avg_price) & \
-                     (group['ref_low_d1_1'] > avg_price) & \
-                     (group['ref_low_d1_2'] > avg_price)
-
-        # 综合所有条件：需同时满足条件1-4
-        final_condition = condition1 & condition2 & condition3 & condition4
-
-        # 筛选出符合条件的记录
-        selected = group[final_condition]
-        # 如果当前股票无符合条件的记录，跳过
-        if selected.empty:
-            continue
-
-        # 清理临时计算字段：移除所有ref_开头的字段
-        ref_cols = [col for col in selected.columns if col.startswith('ref_')]
-        selected = selected.drop(columns=ref_cols)
-        # 将当前股票符合条件的记录加入结果列表
-        result_list.append(selected)
-
-    # 合并所有股票的符合条件记录
-    if result_list:
-        Stock_Selected = pd.concat(result_list, ignore_index=True)
+    任一交易日的数据被补录或修正后，该日指纹随之变化
+
+    返回值：
+    ----------
+    dict
+        {交易日(Timestamp): 指纹字符串}
+    """
+    return read_day_fingerprints(engine, start_date, end_date)
+
+
+def compute_data_versions(trade_days, fingerprints, target_dates, d1=0, lookback=None, salt=''):
+    """
+    计算每个评估日的数据版本：d1参数 + 回看窗口内各交易日指纹的MD5
+
+    参数说明：
+    ----------
+    trade_days : pandas.DatetimeIndex
+        升序排列的交易日（需覆盖评估日及其回看窗口）
+    fingerprints : dict
+        get_day_fingerprints的返回值
+    target_dates : array-like
+        需要计算版本的评估日
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+    lookback : int, 可选
+        回看交易日数，默认get_lookback_days(d1)（其他策略按各自声明的回看天数传入）
+    salt : str, 可选
+        附加到版本中的其他口径（如股票池过滤条件），默认空
+
+    返回值：
+    ----------
+    dict
+        {评估日(Timestamp): 32位MD5字符串}
+    """
+    lookback = get_lookback_days(d1) if lookback is None else lookback
+    versions = {}
+    for target in pd.to_datetime(target_dates):
+        idx = trade_days.searchsorted(target)
+        window = trade_days[max(idx - lookback, 0):idx + 1]
+        payload = f"d1={d1};{salt}" + ";".join(f"{day:%Y%m%d}={fingerprints.get(day, '')}" for day in window)
+        versions[target] = hashlib.md5(payload.encode('utf-8')).hexdigest()
+    return versions
+
+
+def ensure_data_version_column():
+    """确保stock_selected表存在data_version字段（旧表自动补齐）"""
+    with engine.connect() as conn:
+        exists = conn.execute(text("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'stock_selected' AND column_name = 'data_version'
+        """)).scalar()
+        if not exists:
+            conn.execute(text("ALTER TABLE stock_selected ADD COLUMN data_version VARCHAR(32) COMMENT '数据版本'"))
+            conn.commit()
+
+
+def check_strategy_id_key():
+    """
+    检查stock_selected的联合主键是否已包含strategy_id（只读检查）
+
+    旧表的主键迁移是一次性的结构变更（重建表并复制数据），由 python init_tidb.py 执行，
+    选股流程中不做DDL；未迁移时抛出异常并提示先执行迁移
+    """
+    with engine.connect() as conn:
+        key_columns = [row[0].lower() for row in conn.execute(text("""
+        SELECT column_name FROM information_schema.key_column_usage
+        WHERE table_schema = DATABASE() AND table_name = 'stock_selected' AND constraint_name = 'PRIMARY'
+        """)).fetchall()]
+    if key_columns and 'strategy_id' not in key_columns:
+        raise RuntimeError("stock_selected的主键尚未包含strategy_id，请先执行 python init_tidb.py 完成迁移")
+
+
+def get_selected_versions(target_dates, strategy_id=DEFAULT_STRATEGY_ID):
+    """
+    查询stock_selected中指定策略已有结果的评估日及其数据版本
+
+    返回值：
+    ----------
+    set
+        {(交易日(Timestamp), data_version)}
+    """
+    if len(target_dates) == 0:
+        return set()
+    sql = text("""
+    SELECT DISTINCT trade_date, data_version FROM stock_selected
+    WHERE trade_date BETWEEN :start_date AND :end_date AND data_version IS NOT NULL
+      AND strategy_id = :strategy_id
+    """)
+    params = {
+        "start_date": min(target_dates).strftime('%Y%m%d'),
+        "end_date": max(target_dates).strftime('%Y%m%d'),
+        "strategy_id": strategy_id,
+    }
+    with engine.connect() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return {(pd.Timestamp(str(row[0])), row[1]) for row in rows}
+
+
+def merge_lookback_windows(trade_days, target_dates, lookback):
+    """
+    将每个评估日的回看窗口合并为若干段连续的交易日区间
+
+    返回值：
+    ----------
+    list
+        [(区间起始日, 区间结束日, 区间内的评估日列表)]
+    """
+    segments = []
+    for target in sorted(target_dates):
+        idx = trade_days.searchsorted(target)
+        start_idx = max(idx - lookback, 0)
+        # 与上一段重叠或相邻则合并，避免重复读取
+        if segments and start_idx <= segments[-1][1] + 1:
+            segments[-1][1] = idx
+            segments[-1][2].append(target)
+        else:
+            segments.append([start_idx, idx, [target]])
+    return [(trade_days[s], trade_days[e], targets) for s, e, targets in segments]
+
+
+# 预筛选时涨幅比阈值的放宽量：SQL端按DECIMAL计算，Python端按float64计算，放宽后只会多取候选、不会漏选
+PREFILTER_RATIO_SLACK = 1e-3
+
+
+def load_prefiltered_segment(trade_days, seg_start, seg_end, d1=0, jump_ratio=None):
+    """
+    两阶段读取一个回看区间：先在SQL端取出可能满足条件1的大涨记录，再只读取这些股票在区间内的K线
+
+    参数说明：
+    ----------
+    trade_days : pandas.DatetimeIndex
+        升序排列的交易日（需覆盖该区间）
+    seg_start / seg_end : Timestamp
+        merge_lookback_windows返回的区间起止日
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+    jump_ratio : float, 可选
+        条件1涨幅比，默认DEFAULT_THRESHOLDS['jump_ratio']
+
+    返回值：
+    ----------
+    tuple(pandas.DataFrame, int)
+        (候选股票在区间内的日线数据, 大涨记录数)
+
+    说明：
+    ----------
+    条件1要求REF(CLOSE,D1+3)/REF(CLOSE,D1+4)超过阈值，大涨日J之前还需有一根K线，且J之后还有D1+3根K线，
+    因此只有区间第2个交易日至倒数第D1+4个交易日的大涨才可能产生入选记录；
+    其余股票在区间内的任何评估日都不满足条件1，不读取它们不影响结果
+    """
+    jump_ratio = DEFAULT_THRESHOLDS['jump_ratio'] if jump_ratio is None else jump_ratio
+    start_idx = trade_days.searchsorted(seg_start)
+    end_idx = trade_days.searchsorted(seg_end)
+    first_jump_idx = start_idx + 1
+    last_jump_idx = end_idx - (d1 + 3)
+    if first_jump_idx > last_jump_idx:
+        return pd.DataFrame(), 0
+
+    # 上一根K线只在区间内查找，与在区间数据上计算REF的口径一致
+    jumps = read_jump_candidates(engine, seg_start.strftime('%Y%m%d'), trade_days[last_jump_idx].strftime('%Y%m%d'),
+                                 jump_ratio - PREFILTER_RATIO_SLACK,
+                                 jump_start=trade_days[first_jump_idx].strftime('%Y%m%d'))
+    if jumps.empty:
+        return pd.DataFrame(), 0
+
+    windows = pd.DataFrame({'ts_code': jumps['ts_code'].unique()})
+    windows['start_date'] = seg_start.strftime('%Y%m%d')
+    windows['end_date'] = seg_end.strftime('%Y%m%d')
+    return read_daily_windows(engine, windows, verbose=False), len(jumps)
+
+
+def extend_short_histories(seg_df, trade_days, seg_start, seg_end, seg_targets, lookback):
+    """
+    补齐停牌股票的回看K线：回看区间按全市场交易日划分，区间内K线数少于区间交易日数的股票
+    改为从其自身向前第lookback根K线开始读取，使REF与select_stocks在完整历史上的取值一致
+
+    参数说明：
+    ----------
+    seg_df : pandas.DataFrame
+        区间内的日线数据（全部股票或预筛选后的候选股票）
+    trade_days : pandas.DatetimeIndex
+        升序排列的交易日（需覆盖该区间）
+    seg_start / seg_end / seg_targets :
+        merge_lookback_windows返回的区间起止日与评估日
+    lookback : int
+        每个评估日需要向前回看的K线根数
+
+    返回值：
+    ----------
+    tuple(pandas.DataFrame, int)
+        (补齐后的区间数据, 补齐的股票数)
+
+    说明：
+    ----------
+    区间内有停牌的股票，其REF所需的K线可能早于区间起始日；预筛选模式下其大涨日也可能早于区间，
+    因此这些股票全部作为候选，整体替换为补齐后的K线
+    """
+    start_str, end_str = seg_start.strftime('%Y%m%d'), seg_end.strftime('%Y%m%d')
+    n_days = int(((trade_days >= seg_start) & (trade_days <= seg_end)).sum())
+    short_codes = read_short_codes(engine, start_str, end_str, n_days,
+                                   active_from=min(seg_targets).strftime('%Y%m%d'))
+    if not short_codes:
+        return seg_df, 0
+
+    starts = read_history_starts(engine, short_codes, start_str, lookback)
+    windows = pd.DataFrame({'ts_code': short_codes})
+    windows['start_date'] = windows['ts_code'].map(starts).fillna(start_str)
+    windows['end_date'] = end_str
+    extended = read_daily_windows(engine, windows, verbose=False)
+    if not seg_df.empty:
+        kept = seg_df[~seg_df['ts_code'].astype(str).isin(short_codes)]
+        extended = pd.concat([kept.astype({'ts_code': str}), extended.astype({'ts_code': str})], ignore_index=True)
+    extended['ts_code'] = extended['ts_code'].astype(str).astype('category')
+    return extended, len(short_codes)
+
+
+def _merge_select_metrics(metrics, seg_metrics, seg_targets, fingerprints, universe=None):
+    """
+    把预筛选分段的统计并入metrics：candidates改为当日全部记录数（含预筛选排除的股票），
+    与非预筛选模式口径一致——未配置股票池时取指纹中的全市场行数，配置股票池时只统计池内记录
+    """
+    timings = metrics.setdefault('timings', {})
+    for step, seconds in seg_metrics.get('timings', {}).items():
+        timings[step] = timings.get(step, 0.0) + seconds
+    target_days = pd.to_datetime(seg_targets)
+    if universe is None:
+        candidates = [int(fingerprints.get(day, '0').split('|')[0]) for day in seg_targets]
     else:
-        # 无符合条件的记录时，返回空DataFrame
-        Stock_Selected = pd.DataFrame()
+        day_codes = read_day_codes(engine, min(target_days).strftime('%Y%m%d'), max(target_days).strftime('%Y%m%d'))
+        day_codes = day_codes[day_codes['trade_date'].isin(target_days)]
+        in_universe = universe(day_codes['ts_code'], day_codes['trade_date'])
+        counts = day_codes['trade_date'][in_universe].value_counts()
+        candidates = [int(counts.get(day, 0)) for day in target_days]
+    funnel = pd.DataFrame({'trade_date': target_days, 'candidates': candidates})
+    counted = [item.drop(columns='candidates') for item in seg_metrics.get('funnels', []) if not item.empty]
+    if counted:
+        funnel = funnel.merge(pd.concat(counted, ignore_index=True), on='trade_date', how='left')
+    for column in ['cond1', 'cond2', 'cond3', 'cond4']:
+        funnel[column] = funnel[column].fillna(0).astype(np.int64) if column in funnel else 0
+    metrics.setdefault('funnels', []).append(funnel)
+
+
+def evaluate_pending_days(trade_days, pending, fingerprints, d1=0, lookback=None, prefilter=True, metrics=None,
+                          universe=None):
+    """
+    按合并后的回看区间分段读取并评估待选股的交易日（分段之间不共享REF，避免跨区间取值）
+
+    参数说明：
+    ----------
+    trade_days : pandas.DatetimeIndex
+        升序排列的交易日（需覆盖评估日及其回看窗口）
+    pending : list
+        需要评估的交易日
+    fingerprints : dict
+        get_day_fingerprints的返回值（预筛选时用于统计全窗口行数与候选数）
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+    lookback : int, 可选
+        回看交易日数，默认get_lookback_days(d1)
+    prefilter : bool, 可选
+        是否先在SQL端预筛选大涨记录、只读取候选股票（见load_prefiltered_segment），默认True
+    metrics / universe :
+        同select_stocks
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与select_stocks(完整历史数据, eval_dates=pending)相同的结果
+
+    说明：
+    ----------
+    区间内有停牌的股票按自身K线补齐回看窗口（见extend_short_histories），结果不受停牌影响
+    """
+    lookback = get_lookback_days(d1) if lookback is None else lookback
+    result_list = []
+    total_rows = read_rows = 0
+    for seg_start, seg_end, seg_targets in merge_lookback_windows(trade_days, pending, lookback):
+        if prefilter:
+            seg_df, n_jumps = load_prefiltered_segment(trade_days, seg_start, seg_end, d1=d1)
+            seg_df, n_short = extend_short_histories(seg_df, trade_days, seg_start, seg_end, seg_targets, lookback)
+            seg_rows = sum(int(fingerprints.get(day, '0').split('|')[0])
+                           for day in trade_days[(trade_days >= seg_start) & (trade_days <= seg_end)])
+            total_rows += seg_rows
+            read_rows += len(seg_df) + n_jumps
+            print(f"   预筛选 {seg_start:%Y%m%d} - {seg_end:%Y%m%d}：大涨记录 {n_jumps} 条，"
+                  f"候选 {seg_df['ts_code'].nunique() if not seg_df.empty else 0} 只，"
+                  f"停牌补齐 {n_short} 只，读取 {len(seg_df)} / {seg_rows} 行，评估 {len(seg_targets)} 个交易日")
+            seg_metrics = {} if metrics is not None else None
+            selected = select_stocks(seg_df, d1=d1, eval_dates=seg_targets, metrics=seg_metrics, universe=universe)
+            if metrics is not None:
+                _merge_select_metrics(metrics, seg_metrics, seg_targets, fingerprints, universe=universe)
+        else:
+            seg_df = load_stock_data(start_date=seg_start.strftime('%Y%m%d'), end_date=seg_end.strftime('%Y%m%d'))
+            seg_df, n_short = extend_short_histories(seg_df, trade_days, seg_start, seg_end, seg_targets, lookback)
+            print(f"   读取 {seg_start:%Y%m%d} - {seg_end:%Y%m%d}：{len(seg_df)} 行（停牌补齐 {n_short} 只），"
+                  f"评估 {len(seg_targets)} 个交易日")
+            selected = select_stocks(seg_df, d1=d1, eval_dates=seg_targets, metrics=metrics, universe=universe)
+        if not selected.empty:
+            result_list.append(selected)
+    if prefilter and total_rows:
+        print(f"   SQL预筛选共传输 {read_rows:,} 行（含大涨记录），为全窗口 {total_rows:,} 行的 "
+              f"{read_rows / total_rows:.1%}")
+
+    if not result_list:
+        return pd.DataFrame()
+    return pd.concat(result_list, ignore_index=True)
+
+
+def select_stocks_incremental(start_date, end_date, d1=0, lookback_padding=0, metrics=None, prefilter=None,
+                              universe=None, coverage=None):
+    """
+    增量选股：只读取每个评估日所需的最小回看窗口，并跳过已有同版本结果的评估日
 
+    参数说明：
+    ----------
+    start_date : str
+        评估起始日期，格式为YYYYMMDD
+    end_date : str
+        评估结束日期，格式为YYYYMMDD
+    d1 : int, 可选
+        选股公式中的D1参数，默认值0
+    lookback_padding : int, 可选
+        在公式最小回看天数之外额外多读的交易日数，默认值0
+    metrics : dict, 可选
+        同select_stocks，收集各分段的漏斗统计
+    prefilter : bool, 可选
+        是否先在SQL端预筛选大涨记录、只读取候选股票（见load_prefiltered_segment），
+        默认读取配置SELECT_PREFILTER（默认1；启用USE_DAILY_CACHE时默认0）
+    universe : function, 可选
+        同select_stocks；过滤条件计入data_version，更换股票池后会重新评估
+    coverage : dict, 可选
+        传入时写入target_days（区间内交易日数）与evaluated_days（本次实际评估的交易日数）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与select_stocks相同的结果字段，另附data_version字段
+
+    说明：
+    ----------
+    回看窗口按全市场交易日计算，窗口内存在停牌的股票按自身K线补齐回看窗口，结果与全量模式一致；
+    无入选记录的评估日不会落库，因此每次都会重新评估（代价仅为一个回看窗口）
+    """
+    lookback = get_lookback_days(d1) + lookback_padding
+    start = datetime.strptime(start_date, '%Y%m%d')
+    # 预留足够的自然日以覆盖长假，确保能取到lookback个交易日
+    history_start = (start - timedelta(days=lookback * 2 + 30)).strftime('%Y%m%d')
+
+    trade_days = get_trade_days(history_start, end_date)
+    target_dates = [day for day in trade_days if day >= start]
+    if coverage is not None:
+        coverage.update({'target_days': len(target_dates), 'evaluated_days': 0})
+    if not target_dates:
+        print("⚠️ 评估区间内没有交易日数据")
+        return pd.DataFrame()
+
+    # 计算每个评估日的数据版本，并跳过已有同版本结果的评估日
+    fingerprints = get_day_fingerprints(history_start, end_date)
+    versions = compute_data_versions(trade_days, fingerprints, target_dates, d1=d1,
+                                     salt=getattr(universe, 'spec', ''))
+    ensure_data_version_column()
+    existing = get_selected_versions(target_dates)
+    pending = [day for day in target_dates if (day, versions[day]) not in existing]
+    skipped = len(target_dates) - len(pending)
+    if coverage is not None:
+        coverage['evaluated_days'] = len(pending)
+    if skipped:
+        print(f"⏭️ 跳过 {skipped} 个已有同版本选股结果的交易日")
+    if not pending:
+        return pd.DataFrame()
+
+    if prefilter is None:
+        default_prefilter = '0' if str(get_config('USE_DAILY_CACHE', '0')) == '1' else '1'
+        prefilter = str(get_config('SELECT_PREFILTER', default_prefilter)) == '1'
+
+    Stock_Selected = evaluate_pending_days(trade_days, pending, fingerprints, d1=d1, lookback=lookback,
+                                           prefilter=prefilter, metrics=metrics, universe=universe)
+    if Stock_Selected.empty:
+        return Stock_Selected
+    Stock_Selected['data_version'] = Stock_Selected['trade_date'].map(versions)
     return Stock_Selected
 
 
+def attach_data_versions(Stock_Selected, d1=0, lookback=None, salt=''):
+    """为全量模式的选股结果补充data_version字段（与增量模式口径一致，salt同compute_data_versions）"""
+    if Stock_Selected.empty:
+        return Stock_Selected
+    lookback = get_lookback_days(d1) if lookback is None else lookback
+    first_day = Stock_Selected['trade_date'].min()
+    history_start = (first_day - timedelta(days=lookback * 2 + 30)).strftime('%Y%m%d')
+    end_date = Stock_Selected['trade_date'].max().strftime('%Y%m%d')
+    trade_days = get_trade_days(history_start, end_date)
+    fingerprints = get_day_fingerprints(history_start, end_date)
+    target_dates = Stock_Selected['trade_date'].drop_duplicates()
+    versions = compute_data_versions(trade_days, fingerprints, target_dates, d1=d1, lookback=lookback, salt=salt)
+    Stock_Selected['data_version'] = Stock_Selected['trade_date'].map(versions)
+    return Stock_Selected
+
+
+# ========================== 结果集去重模块 ==========================
+# 每次运行记录到stock_select_runs（区间 + 参数 + 数据版本 -> 结果集），
+# 结果集本身仍存放在stock_selected中，以首次写入时的execute_date/execute_time标识
+RESULT_HASH_COLUMNS = ['strategy_id', 'ts_code', 'trade_date', 'buy_date', 'gold_date', 'price_open',
+                       'price_high', 'price_low', 'price_close', 'vol', 'amount']
+
+
+def ensure_select_runs_table():
+    """创建选股运行记录表（如不存在，建表语句见init_tidb.STOCK_SELECT_RUNS_DDL）"""
+    with engine.connect() as conn:
+        conn.execute(text(STOCK_SELECT_RUNS_DDL))
+        conn.commit()
+
+
+def compute_params_hash(params):
+    """选股参数（dict）的规范化JSON及其MD5"""
+    params_json = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return params_json, hashlib.md5(params_json.encode('utf-8')).hexdigest()
+
+
+def compute_range_version(start_date, end_date, d1=0, lookback=None):
+    """
+    区间数据版本：区间内每个交易日的data_version按日期拼接后的MD5
+
+    区间内任一交易日（或其回看窗口）的日线数据变化都会改变区间版本；
+    lookback默认get_lookback_days(d1)，多策略运行时传入各策略回看天数的最大值
+    """
+    lookback = get_lookback_days(d1) if lookback is None else lookback
+    start = datetime.strptime(start_date, '%Y%m%d')
+    history_start = (start - timedelta(days=lookback * 2 + 30)).strftime('%Y%m%d')
+    trade_days = get_trade_days(history_start, end_date)
+    fingerprints = get_day_fingerprints(history_start, end_date)
+    target_dates = [day for day in trade_days if day >= start]
+    versions = compute_data_versions(trade_days, fingerprints, target_dates, d1=d1, lookback=lookback)
+    payload = ";".join(f"{day:%Y%m%d}={versions[day]}" for day in target_dates)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def compute_result_hash(Stock_Selected):
+    """
+    结果集内容MD5（与执行时间、行顺序无关）
+
+    参数说明：
+    ----------
+    Stock_Selected : pandas.DataFrame
+        选股结果，日期字段为YYYYMMDD字符串
+    """
+    if Stock_Selected.empty:
+        return hashlib.md5(b'').hexdigest()
+    columns = [col for col in RESULT_HASH_COLUMNS if col in Stock_Selected.columns]
+    canonical = Stock_Selected[columns].astype(str).sort_values(columns)
+    payload = canonical.to_csv(index=False, header=True)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _result_set_exists(conn, execute_date, execute_time):
+    """检查运行记录指向的结果集是否仍在stock_selected中（可能已在数据管理页被删除）"""
+    sql = text("""
+    SELECT 1 FROM stock_selected WHERE execute_date = :execute_date AND execute_time = :execute_time LIMIT 1
+    """)
+    return conn.execute(sql, {"execute_date": execute_date, "execute_time": execute_time}).first() is not None
+
+
+def find_select_run(start_date, end_date, params_hash, data_version):
+    """
+    查询相同区间、参数与数据版本的运行记录
+
+    返回值：
+    ----------
+    dict or None
+        运行记录（结果集已被删除时返回None，需重新计算）
+    """
+    sql = text("""
+    SELECT content_hash, row_count, execute_date, execute_time FROM stock_select_runs
+    WHERE start_date = :start_date AND end_date = :end_date
+      AND params_hash = :params_hash AND data_version = :data_version
+    """)
+    with engine.connect() as conn:
+        row = conn.execute(sql, {"start_date": start_date, "end_date": end_date,
+                                 "params_hash": params_hash, "data_version": data_version}).mappings().first()
+        if row is None:
+            return None
+        if row['row_count'] and not _result_set_exists(conn, row['execute_date'], row['execute_time']):
+            return None
+    return dict(row)
+
+
+def find_result_set(content_hash):
+    """按内容MD5查找已存储的非空结果集，返回(execute_date, execute_time)或None"""
+    sql = text("""
+    SELECT execute_date, execute_time FROM stock_select_runs
+    WHERE content_hash = :content_hash AND row_count > 0
+    ORDER BY first_run_time
+    """)
+    with engine.connect() as conn:
+        for row in conn.execute(sql, {"content_hash": content_hash}).fetchall():
+            if _result_set_exists(conn, row[0], row[1]):
+                return row[0], row[1]
+    return None
+
+
+def touch_select_run(start_date, end_date, params_hash, data_version):
+    """相同运行再次执行：只更新最近运行时间与运行次数"""
+    sql = text("""
+    UPDATE stock_select_runs SET last_run_time = :now, run_count = run_count + 1
+    WHERE start_date = :start_date AND end_date = :end_date
+      AND params_hash = :params_hash AND data_version = :data_version
+    """)
+    with engine.connect() as conn:
+        conn.execute(sql, {"now": datetime.now(), "start_date": start_date, "end_date": end_date,
+                           "params_hash": params_hash, "data_version": data_version})
+        conn.commit()
+
+
+def save_select_run(start_date, end_date, params_json, params_hash, data_version,
+                    content_hash, row_count, execute_date, execute_time):
+    """写入（或覆盖）运行记录，指向本次使用的结果集"""
+    now = datetime.now()
+    sql = text("""
+    INSERT INTO stock_select_runs (start_date, end_date, params_hash, data_version, params, content_hash,
+                                   row_count, execute_date, execute_time, first_run_time, last_run_time, run_count)
+    VALUES (:start_date, :end_date, :params_hash, :data_version, :params, :content_hash,
+            :row_count, :execute_date, :execute_time, :now, :now, 1)
+    ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash), row_count = VALUES(row_count),
+        execute_date = VALUES(execute_date), execute_time = VALUES(execute_time),
+        last_run_time = VALUES(last_run_time), run_count = run_count + 1
+    """)
+    with engine.connect() as conn:
+        conn.execute(sql, {"start_date": start_date, "end_date": end_date, "params_hash": params_hash,
+                           "data_version": data_version, "params": params_json, "content_hash": content_hash,
+                           "row_count": row_count, "execute_date": execute_date, "execute_time": execute_time,
+                           "now": now})
+        conn.commit()
+
+
+# ========================== 条件漏斗统计模块 ==========================
+def ensure_select_metrics_table():
+    """创建选股漏斗统计表（如不存在，建表语句见init_tidb.STOCK_SELECT_METRICS_DDL）"""
+    with engine.connect() as conn:
+        conn.execute(text(STOCK_SELECT_METRICS_DDL))
+        conn.commit()
+
+
+def summarize_select_metrics(metrics):
+    """
+    合并select_stocks收集的漏斗统计（流式/分段选股的同一交易日按块求和）
+
+    返回值：
+    ----------
+    tuple(pandas.DataFrame, dict)
+        (按交易日的漏斗表, {步骤: 毫秒})
+    """
+    funnels = [funnel for funnel in metrics.get('funnels', []) if not funnel.empty]
+    if funnels:
+        funnel = pd.concat(funnels, ignore_index=True).groupby('trade_date', as_index=False).sum()
+    else:
+        funnel = pd.DataFrame(columns=['trade_date', 'candidates', 'cond1', 'cond2', 'cond3', 'cond4'])
+    timings_ms = {step: seconds * 1000 for step, seconds in metrics.get('timings', {}).items()}
+    return funnel, timings_ms
+
+
+def save_select_metrics(metrics, run_time, strategy_id=DEFAULT_STRATEGY_ID):
+    """
+    写入本次运行的逐日漏斗与区间汇总行（汇总行附各条件耗时），并打印漏斗概要
+    """
+    funnel, timings_ms = summarize_select_metrics(metrics)
+    if funnel.empty:
+        return
+    totals = funnel[['candidates', 'cond1', 'cond2', 'cond3', 'cond4']].sum()
+    print(f"🔎 条件漏斗：候选 {totals['candidates']:,} → 条件1 {totals['cond1']:,} → 条件2 {totals['cond2']:,} "
+          f"→ 条件3 {totals['cond3']:,} → 条件4 {totals['cond4']:,}；"
+          f"耗时(ms) REF {timings_ms.get('ref', 0):.1f}，" +
+          "，".join(f"条件{i} {timings_ms.get(f'condition{i}', 0):.1f}" for i in range(1, 5)))
+
+    rows = funnel.copy()
+    rows['trade_date'] = pd.to_datetime(rows['trade_date']).dt.strftime('%Y%m%d')
+    summary = {'trade_date': None, **totals.to_dict(), 'ref_ms': timings_ms.get('ref')}
+    summary.update({f'cond{i}_ms': timings_ms.get(f'condition{i}') for i in range(1, 5)})
+    rows = pd.concat([rows, pd.DataFrame([summary])], ignore_index=True)
+    rows.insert(0, 'strategy_id', strategy_id)
+    rows.insert(0, 'run_time', run_time.strftime('%Y-%m-%d %H:%M:%S'))
+    ensure_select_metrics_table()
+    rows = rows.astype(object).where(rows.notna(), None)
+    rows.to_sql('stock_select_metrics', engine, if_exists='append', index=False)
+
+
 # ========================== 主程序执行入口 ==========================
 if __name__ == "__main__":
     # ===================== 初始化日期参数 =====================
@@ -334,15 +1352,71 @@ if __name__ == "__main__":
     try:
         log_task_execution("选股", "RUNNING", f"开始执行选股: {start_date} - {end_date}")
         
-        # 加载指定日期区间的股票日线数据
-        print(f"\n📥 正在读取 {start_date} 至 {end_date} 的股票日线数据...")
-        stock_df = load_stock_data(start_date=start_date, end_date=end_date)
-
-        # 执行核心选股逻辑
-        print("🔍 正在执行选股逻辑...")
-        Stock_Selected = select_stocks(stock_df, d1=0)
+        # 选股模式：incremental（默认，仅读取回看窗口）或 full（读取整个区间）
+        select_mode = get_config('SELECT_MODE', 'incremental')
+        # 配置 SELECT_STRATEGIES（逗号分隔的策略标识，或all）时，一次读取并集窗口后评估多个已登记策略
+        strategy_config = get_config('SELECT_STRATEGIES', '')
+        # 配置了股票池条件时，选股前先按股票池掩码剔除股票
+        universe = get_universe_filter()
+        if strategy_config:
+            from strategy_registry import get_union_lookback, resolve_strategy_ids, select_strategies
+            strategy_ids = resolve_strategy_ids(strategy_config)
+            select_params = {'mode': 'strategies', 'strategies': strategy_ids}
+            range_lookback = get_union_lookback(strategy_ids)
+        else:
+            strategy_ids = None
+            select_params = {'mode': select_mode, 'd1': 0, **DEFAULT_THRESHOLDS}
+            range_lookback = None
+        if universe is not None:
+            select_params['universe'] = universe.spec
+            print(f"🧺 股票池过滤：{universe.spec}")
+
+        # 相同区间 + 参数 + 数据版本已运行过时直接指向已有结果集，不再选股与写入
+        params_json, params_hash = compute_params_hash(select_params)
+        ensure_select_runs_table()
+        check_strategy_id_key()
+        range_version = compute_range_version(start_date, end_date, d1=0, lookback=range_lookback)
+        previous_run = find_select_run(start_date, end_date, params_hash, range_version)
+        # 收集单策略选股的逐日条件漏斗与各条件耗时（多进程/多策略模式不收集）
+        select_metrics = {}
+        # 增量模式记录实际评估的交易日数；只有整个区间都重新评估过，结果集才代表该区间
+        coverage = {}
+        if previous_run is not None:
+            touch_select_run(start_date, end_date, params_hash, range_version)
+            Stock_Selected = pd.DataFrame()
+        elif strategy_ids:
+            Stock_Selected = select_strategies(start_date, end_date, strategy_ids, universe=universe)
+        elif select_mode == 'full':
+            # 执行核心选股逻辑（SELECT_WORKERS>1 时整区间读取后按股票分片多进程执行，
+            # 否则按 SELECT_MEMORY_MB 内存预算流式读取并逐块选股）
+            select_workers = int(get_config('SELECT_WORKERS', 1))
+            if select_workers > 1:
+                print(f"\n📥 正在读取 {start_date} 至 {end_date} 的股票日线数据...")
+                stock_df = load_stock_data(start_date=start_date, end_date=end_date)
+                print("🔍 正在执行选股逻辑...")
+                from parallel_select import select_stocks_parallel
+                Stock_Selected = select_stocks_parallel(stock_df, d1=0, workers=select_workers, universe=universe)
+            else:
+                print(f"\n📥 正在流式读取 {start_date} 至 {end_date} 的股票日线数据并选股...")
+                memory_budget_mb = int(get_config('SELECT_MEMORY_MB', 256))
+                Stock_Selected = select_stocks_streaming(start_date, end_date, d1=0, memory_budget_mb=memory_budget_mb,
+                                                         metrics=select_metrics, universe=universe)
+            if not Stock_Selected.empty:
+                ensure_data_version_column()
+                Stock_Selected = attach_data_versions(Stock_Selected, d1=0, salt=getattr(universe, 'spec', ''))
+        else:
+            print(f"\n📥 增量选股：评估 {start_date} 至 {end_date} 的交易日...")
+            Stock_Selected = select_stocks_incremental(start_date, end_date, d1=0, metrics=select_metrics,
+                                                       universe=universe, coverage=coverage)
+        covers_range = coverage.get('evaluated_days', 0) == coverage.get('target_days', 0)
+        partial_msg = (f"（增量模式评估 {coverage.get('evaluated_days', 0)}/{coverage.get('target_days', 0)} "
+                       f"个交易日，其余交易日已有同版本结果，不记录区间运行）") if not covers_range else ''
 
         # ===================== 结果数据处理 =====================
+        # 单策略模式的结果归属本脚本内置策略
+        if not Stock_Selected.empty and 'strategy_id' not in Stock_Selected.columns:
+            Stock_Selected['strategy_id'] = DEFAULT_STRATEGY_ID
+
         # 清理所有ref_开头的临时字段（双重保障）
         ref_columns = [col for col in Stock_Selected.columns if col.startswith('ref_')]
         if ref_columns:
@@ -356,6 +1430,13 @@ if __name__ == "__main__":
         # 执行时间（格式：HH:MM:SS）
         Stock_Selected['execute_time'] = execute_end_time.strftime('%H:%M:%S')
 
+        # 写入条件漏斗统计（统计失败不影响选股结果写入）
+        if select_metrics:
+            try:
+                save_select_metrics(select_metrics, execute_end_time)
+            except Exception as e:
+                print(f"⚠️ 条件漏斗统计写入失败: {e}")
+
         # 调整字段顺序：将execute_date和execute_time放到最前面
         if not Stock_Selected.empty:
             cols = Stock_Selected.columns.tolist()
@@ -371,7 +1452,12 @@ if __name__ == "__main__":
 
         # ===================== 结果输出与数据库写入 =====================
         print("\n📊 ===== 选股结果 ======")
-        if not Stock_Selected.empty:
+        if previous_run is not None:
+            run_msg = (f"相同区间、参数与数据版本已运行过，结果集为 {previous_run['execute_date']} "
+                       f"{previous_run['execute_time']}（{previous_run['row_count']} 条），本次未写入")
+            print(f"⏭️ {run_msg}")
+            log_task_execution("选股", "SUCCESS", run_msg)
+        elif not Stock_Selected.empty:
             # 输出选股结果统计信息
             print(f"✅ 共筛选出 {len(Stock_Selected)} 条符合条件的股票记录")
             # 展示核心字段的结果（便于快速查看）
@@ -379,74 +1465,45 @@ if __name__ == "__main__":
             print(Stock_Selected[['execute_date', 'execute_time', 'ts_code', 'trade_date',
                                   'gold_date', 'buy_date', 'price_close', 'vol', 'price_low']])
 
-            # 将结果写入MySQL数据库（基于4个联合主键实现存在更新、不存在插入）
-            print("\n📤 开始写入MySQL数据库...")
-            try:
-                # 1. 先创建数据库连接游标
-                conn = engine.raw_connection()
-                cursor = conn.cursor()
-
-                # 2. 遍历每条数据，执行INSERT ... ON DUPLICATE KEY UPDATE逻辑
-                # 提取字段列表（排除索引）
-                columns = Stock_Selected.columns.tolist()
-                # 构建字段字符串
-                cols_str = ', '.join(columns)
-                # 构建占位符字符串
-                placeholders = ', '.join(['%s'] * len(columns))
-                # 构建更新字符串（主键字段不更新，其他字段更新）
-                update_str = ', '.join([
-                    f"{col} = VALUES({col})"
-                    for col in columns
-                    if col not in ['execute_date', 'execute_time', 'ts_code', 'trade_date']
-                ])
-
-                # 3. 批量处理数据
-                batch_size = 1000
-                total_rows = len(Stock_Selected)
-                inserted_count = 0
-                updated_count = 0
-
-                for i in range(0, total_rows, batch_size):
-                    # 截取批次数据
-                    batch_data = Stock_Selected.iloc[i:i + batch_size]
-                    # 转换为元组列表
-                    values = [tuple(row) for row in batch_data.values]
-
-                    # 构建批量插入SQL语句（MySQL特有ON DUPLICATE KEY UPDATE）
-                    sql = f"""
-                    INSERT INTO stock_selected ({cols_str}) 
-                    VALUES ({placeholders}) 
-                    ON DUPLICATE KEY UPDATE {update_str}
-                    """
-
-                    # 执行批量插入/更新
-                    cursor.executemany(sql, values)
-                    # 统计插入/更新行数
-                    rowcount = cursor.rowcount
-                    # MySQL behavior: returns 1 for insert, 2 for update, 0 for no change
-                    # But if we use executemany, rowcount is sum of rowcounts.
-                    # This logic might be approximate but good enough for logging
-                    inserted_count += rowcount 
-                    
-                # 4. 提交事务
-                conn.commit()
-                print(f"✅ 数据库写入完成！影响行数: {inserted_count}")
-
-                # 5. 关闭游标和连接
-                cursor.close()
-                conn.close()
-                
-                log_task_execution("选股", "SUCCESS", f"成功筛选出 {len(Stock_Selected)} 条记录，数据库影响行数: {inserted_count}")
-
-            except Exception as e:
-                print(f"❌ 数据库写入失败：{str(e)}")
-                log_task_execution("选股", "FAIL", f"数据库写入失败: {str(e)}")
-                # 出错时回滚事务
-                if 'conn' in locals() and conn.open:
-                    conn.rollback()
+            # 内容与已存储的结果集完全相同时，运行记录直接指向该结果集
+            content_hash = compute_result_hash(Stock_Selected)
+            existing_set = find_result_set(content_hash)
+            if existing_set is not None:
+                if covers_range:
+                    save_select_run(start_date, end_date, params_json, params_hash, range_version,
+                                    content_hash, len(Stock_Selected), existing_set[0], existing_set[1])
+                run_msg = (f"筛选出 {len(Stock_Selected)} 条记录，与已有结果集 {existing_set[0]} {existing_set[1]} "
+                           f"内容相同，本次未写入{partial_msg}")
+                print(f"⏭️ {run_msg}")
+                log_task_execution("选股", "SUCCESS", run_msg)
+            else:
+                # 将结果写入MySQL数据库（基于4个联合主键实现存在更新、不存在插入）
+                # 按max_allowed_packet拼接多行VALUES语句批量写入，并准确统计新增/更新行数
+                print("\n📤 开始写入MySQL数据库...")
+                try:
+                    write_stats = bulk_upsert(
+                        engine, 'stock_selected', Stock_Selected,
+                        key_columns=['execute_date', 'execute_time', 'ts_code', 'trade_date', 'strategy_id']
+                    )
+                    if covers_range:
+                        save_select_run(start_date, end_date, params_json, params_hash, range_version,
+                                        content_hash, len(Stock_Selected),
+                                        Stock_Selected['execute_date'].iloc[0], Stock_Selected['execute_time'].iloc[0])
+                    print(f"✅ 数据库写入完成！{format_upsert_stats(write_stats)}{partial_msg}")
+                    log_task_execution("选股", "SUCCESS",
+                                       f"成功筛选出 {len(Stock_Selected)} 条记录，{format_upsert_stats(write_stats)}，"
+                                       f"写入耗时 {write_stats['seconds']:.2f} 秒{partial_msg}")
+
+                except Exception as e:
+                    print(f"❌ 数据库写入失败：{str(e)}")
+                    log_task_execution("选股", "FAIL", f"数据库写入失败: {str(e)}")
         else:
-            print("⚠️ 未筛选出符合条件的股票")
-            log_task_execution("选股", "SUCCESS", "未筛选出符合条件的股票")
+            # 只有整个区间都评估过且确实无入选记录时，才记录空结果集的运行
+            if covers_range:
+                save_select_run(start_date, end_date, params_json, params_hash, range_version,
+                                compute_result_hash(Stock_Selected), 0, None, None)
+            print(f"⚠️ 未筛选出符合条件的股票{partial_msg}")
+            log_task_execution("选股", "SUCCESS", f"未筛选出符合条件的股票{partial_msg}")
             
     except Exception as e:
         print(f"❌ 执行选股出错: {e}")
@@ -6,12 +6,21 @@ A股日线数据批量拉取与MySQL入库工具
 2. 单日数据实时写入MySQL，内存仅保留单日数据，避免内存累积
 3. 以(ts_code, trade_date)为联合主键，实现重复数据更新、新增数据插入
 4. 精准统计总记录数、更新数、新增数，无负数统计异常
+5. 日线写入完成后，增量刷新涉及的周线/月线周期（见period_bars.py）
+6. 只拉取沪深交易所交易日（见trade_calendar.get_exchange_trade_days），周末和节假日不再调用接口
+7. 多线程并发拉取，令牌桶按每分钟配额限流并在被限流时自动降速，结果仍按日期顺序写库（见tushare_fetcher.py）
+8. 拉取与写入为有界队列连接的流水线，结束时输出分阶段耗时
+9. 按交易日保存内容指纹（cn_stock_daily_fingerprint），重跑已入库日期时内容未变（且表中当日行数与指纹一致）
+   则跳过写入，只合并有变化的行；跳过的条目单独统计，不计入更新数
 """
 
 import tushare as ts
 import pandas as pd
-from datetime import datetime, timedelta
+from sqlalchemy import text
+from datetime import datetime
 import time
+import threading
+import hashlib
 import os
 import sys
 from dotenv import load_dotenv
@@ -22,11 +31,21 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
-    from db_utils import get_db_engine, log_task_execution
+    from db_utils import get_db_engine, get_config, log_task_execution
+    from bulk_writer import bulk_upsert, staged_upsert
+    from period_bars import PERIOD_FREQS, ensure_period_table, refresh_all_period_bars
+    from trade_calendar import get_exchange_trade_days
+    from tushare_fetcher import (TokenBucket, StageTimer, is_rate_limit_error, get_fetch_settings,
+                                 get_write_settings, fetch_in_order, run_pipeline)
 except ImportError:
     # 如果作为模块导入时可能需要这样
     sys.path.append(os.path.join(os.path.dirname(current_dir)))
-    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.db_utils import get_db_engine, get_config, log_task_execution
+    from utils.bulk_writer import bulk_upsert, staged_upsert
+    from utils.period_bars import PERIOD_FREQS, ensure_period_table, refresh_all_period_bars
+    from utils.trade_calendar import get_exchange_trade_days
+    from utils.tushare_fetcher import (TokenBucket, StageTimer, is_rate_limit_error, get_fetch_settings,
+                                       get_write_settings, fetch_in_order, run_pipeline)
 
 # 加载环境变量
 load_dotenv()
@@ -37,39 +56,105 @@ load_dotenv('.env.local')
 tushare_token = os.getenv('TUSHARE_TOKEN', '1f18885fdd078e681cf087e23c1d6f28226103f470ccf8f30fc38809')
 pro = ts.pro_api(tushare_token)
 
+# 接口字段 -> 数据表cn_stock_daily字段
+DAILY_COLUMN_MAP = {
+    'ts_code': 'ts_code',
+    'trade_date': 'trade_date',
+    'open': 'price_open',
+    'high': 'price_high',
+    'low': 'price_low',
+    'close': 'price_close',
+    'pre_close': 'price_pre_close',
+    'change': 'amt_chg',
+    'pct_chg': 'pct_chg',
+    'vol': 'vol',
+    'amount': 'amount',
+}
+
 # ===================== 数据库操作函数 =====================
 
-def write_to_mysql_with_update(df_data):
+# 日线内容指纹表：每个交易日一行（行数 + 排序后内容的MD5）
+FINGERPRINT_TABLE = 'cn_stock_daily_fingerprint'
+# 数据表数值字段的小数位数（DECIMAL(20, 4)），指纹按入库后的精度计算
+DAILY_DECIMALS = 4
+
+
+def ensure_fingerprint_table(engine):
+    """确保日线内容指纹表存在"""
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} (
+            trade_date DATE NOT NULL COMMENT '交易日期',
+            row_count INT NOT NULL COMMENT '当日条目数',
+            content_hash CHAR(32) NOT NULL COMMENT '按股票代码排序后内容的MD5',
+            updated_at DATETIME COMMENT '指纹更新时间',
+            PRIMARY KEY (trade_date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT '日线内容指纹'
+        """))
+        conn.commit()
+
+
+def compute_day_fingerprint(frame):
+    """
+    计算单日数据的内容指纹
+
+    参数：
+        frame: 已按数据表字段改名的单日DataFrame
+    返回：
+        tuple: (条目数, 32位MD5字符串)；数值先按入库精度取整，再按股票代码排序后逐行哈希
+    """
+    ordered = frame.sort_values('ts_code', kind='mergesort').reset_index(drop=True)
+    value_cols = [col for col in ordered.columns if col not in ('ts_code', 'trade_date')]
+    ordered[value_cols] = ordered[value_cols].astype('float64').round(DAILY_DECIMALS)
+    row_hashes = pd.util.hash_pandas_object(ordered, index=False).to_numpy()
+    return len(ordered), hashlib.md5(row_hashes.tobytes()).hexdigest()
+
+
+def read_day_fingerprint(engine, trade_date):
+    """读取已入库的单日指纹，返回(条目数, MD5)，没有记录时返回None"""
+    with engine.connect() as conn:
+        row = conn.execute(text(f"SELECT row_count, content_hash FROM {FINGERPRINT_TABLE} "
+                                f"WHERE trade_date = :trade_date"), {"trade_date": trade_date}).fetchone()
+    return (int(row[0]), row[1]) if row else None
+
+
+def count_daily_rows(engine, trade_date):
+    """cn_stock_daily中某个交易日的实际条目数"""
+    with engine.connect() as conn:
+        return int(conn.execute(text("SELECT COUNT(*) FROM cn_stock_daily WHERE trade_date = :trade_date"),
+                                {"trade_date": trade_date}).scalar() or 0)
+
+
+def save_day_fingerprint(engine, trade_date, fingerprint):
+    """写入（或覆盖）单日指纹"""
+    row = pd.DataFrame([{
+        'trade_date': trade_date, 'row_count': fingerprint[0], 'content_hash': fingerprint[1],
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }])
+    bulk_upsert(engine, FINGERPRINT_TABLE, row, ['trade_date'], verbose=False)
+
+
+def write_to_mysql_with_update(df_data, skip_unchanged=None, engine=None):
     """
     数据写入MySQL核心函数（插入/更新）
     逻辑说明：
         1. 以(ts_code, trade_date)为联合主键，存在则更新，不存在则插入
-        2. 先查询已存在的主键数，精准统计更新数（避免依赖cursor.rowcount的兼容性问题）
-        3. 批量写入（1000条/批），避免单次写入数据量过大导致超时
+        2. 整日数据先载入临时暂存表，再用一次关联统计已存在的主键数（即更新数），
+           最后一条 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并（见bulk_writer.staged_upsert）
+        3. 列改名与空值处理按列整体完成，不再逐行iterrows构造元组
+        4. 写入前对比当日内容指纹：与已入库指纹相同、且cn_stock_daily中当日实际条目数与指纹记录的条目数一致
+           （防止表中数据被删除后指纹仍在）时整日跳过；否则只合并新增或内容有变化的行，写入成功后更新指纹
 
     参数：
         df_data: 待写入的单日数据DataFrame
+        skip_unchanged: 是否启用指纹对比，默认读取配置项 DAILY_SKIP_UNCHANGED（默认开启，设为0关闭）
+        engine: 数据库连接引擎，默认新建（批量任务应传入同一个引擎）
     返回：
-        tuple: (总条目数, 更新条目数)
-    """
-    
-    # 插入/更新SQL语句（字段与数据表cn_stock_daily严格对应）
-    insert_sql = """
-    INSERT INTO cn_stock_daily (
-        ts_code, trade_date, price_open, price_high, price_low, price_close,
-        price_pre_close, amt_chg, pct_chg, vol, amount
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON DUPLICATE KEY UPDATE
-        price_open = VALUES(price_open),
-        price_high = VALUES(price_high),
-        price_low = VALUES(price_low),
-        price_close = VALUES(price_close),
-        price_pre_close = VALUES(price_pre_close),
-        amt_chg = VALUES(amt_chg),
-        pct_chg = VALUES(pct_chg),
-        vol = VALUES(vol),
-        amount = VALUES(amount);
+        tuple: (总条目数, 更新条目数, 跳过条目数)；跳过条目数为内容未变化、未写入的条目，
+               新增条目数 = 总条目数 - 更新条目数 - 跳过条目数
     """
+    if skip_unchanged is None:
+        skip_unchanged = str(get_config('DAILY_SKIP_UNCHANGED', '1')) != '0'
 
     # ========== 新增：处理nan值，替换为0 ==========
     # 定义需要处理的列名（对应DataFrame中的实际列名）
@@ -78,86 +163,63 @@ def write_to_mysql_with_update(df_data):
     df_data[cols_to_clean] = df_data[cols_to_clean].fillna(0)
 
     total_count = len(df_data)  # 当日待写入总条目数
-    update_count = 0  # 实际更新的条目数（主键重复）
-    insert_count = 0  # 实际插入的条目数（新数据）
-    conn = None  # 数据库连接对象
-    cursor = None  # 数据库游标对象
 
+    own_engine = engine is None
     try:
-        # 建立数据库连接
-        engine = get_db_engine()
-        conn = engine.raw_connection()
-        cursor = conn.cursor()
-
-        # 将DataFrame转换为SQL批量插入的元组列表
-        data_tuples = [
-            (
-                row['ts_code'], row['trade_date'], row['open'], row['high'], row['low'],
-                row['close'], row['pre_close'], row['change'], row['pct_chg'],
-                row['vol'], row['amount']
-            ) for _, row in df_data.iterrows()
-        ]
-
-        # 分批执行插入/更新（每批1000条）
-        batch_size = 1000
-        for i in range(0, total_count, batch_size):
-            batch = data_tuples[i:i + batch_size]
-            batch_len = len(batch)
-
-            # 步骤1：查询当前批次中已存在的主键数量（即需要更新的条目数）
-            key_tuples = [(item[0], item[1]) for item in batch]  # 提取(ts_code, trade_date)
-            placeholders = ', '.join(['(%s, %s)'] * batch_len)  # 构造IN查询占位符
-            check_sql = f"""
-            SELECT COUNT(*) FROM cn_stock_daily 
-            WHERE (ts_code, trade_date) IN ({placeholders});
-            """
-            
-            flat_keys = [k for t in key_tuples for k in t]  # 扁平化元组列表（适配SQL参数）
-            cursor.execute(check_sql, flat_keys)
-            batch_update_count = cursor.fetchone()[0]  # 获取当前批次更新数
-            update_count += batch_update_count
-            insert_count += (batch_len - batch_update_count)  # 计算当前批次插入数
-
-            # 步骤2：执行插入/更新操作
-            cursor.executemany(insert_sql, batch)
-
-        conn.commit()  # 提交事务
-
-        # 数据一致性校验：总条目数必须等于插入数+更新数
-        # assert total_count == insert_count + update_count, "统计异常：总条目数≠插入数+更新数"
-        return total_count, update_count
+        if own_engine:
+            engine = get_db_engine()
+        # 按数据表字段整体改名（字段与数据表cn_stock_daily严格对应）
+        frame = df_data[list(DAILY_COLUMN_MAP)].rename(columns=DAILY_COLUMN_MAP)
+
+        fingerprint = None
+        if skip_unchanged:
+            trade_date = frame['trade_date'].iloc[0]
+            fingerprint = compute_day_fingerprint(frame)
+            if (read_day_fingerprint(engine, trade_date) == fingerprint
+                    and count_daily_rows(engine, trade_date) == fingerprint[0]):
+                print(f"           ⏭️ {trade_date} 内容与已入库指纹一致，跳过写入")
+                return total_count, 0, total_count
+
+        stats = staged_upsert(engine, 'cn_stock_daily', frame, ['ts_code', 'trade_date'],
+                              verbose=False, changed_only=skip_unchanged)
+        if fingerprint is not None:
+            save_day_fingerprint(engine, trade_date, fingerprint)
+        if skip_unchanged:
+            # 只合并了有变化的行：内容未变化的条目没有写入，计为跳过
+            return total_count, stats['updated'], stats['unchanged']
+        # 更新数 = 主键已存在的条目数（含内容未变化的条目）
+        return total_count, stats['updated'] + stats['unchanged'], 0
 
     except Exception as err:
-        # 异常处理：回滚事务并提示具体错误
-        if conn:
-            conn.rollback()
+        # 异常处理：staged_upsert已回滚事务，这里提示具体错误
         print(f"❌ 数据写入失败：{err}")
-        return total_count, 0
+        return total_count, 0, 0
     finally:
-        # 资源释放：无论是否异常，都关闭游标和连接
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        if own_engine and engine is not None:
+            engine.dispose()
 
 
 # ===================== 数据拉取函数 =====================
-def get_single_day_data(trade_date):
+def get_single_day_data(trade_date, limiter=None):
     """
     拉取单日A股日线数据（带无限重试机制）
     逻辑说明：
         1. 调用Tushare pro.daily接口拉取指定日期数据
         2. 接口调用失败时，等待65秒后无限重试（直到成功或无数据）
         3. 区分交易日（有数据）和非交易日（无数据）
+        4. 传入限流器时，每次调用前先取令牌；频率限制报错交给限流器降速后立即重试，不再固定等待
 
     参数：
         trade_date: 交易日，格式为'YYYYMMDD'
+        limiter: TokenBucket限流器，可选（多线程拉取时共享同一个）
     返回：
         DataFrame: 成功返回单日数据，无数据返回空DataFrame
     """
     retry_count = 0  # 重试次数计数器
 
     while True:
+        if limiter is not None:
+            limiter.acquire()
         try:
             # 调用Tushare接口拉取数据（字段与数据表严格对应）
             df = pro.daily(
@@ -177,6 +239,9 @@ def get_single_day_data(trade_date):
                 ]
             )
 
+            if limiter is not None:
+                limiter.recover()
+
             # 数据返回处理
             if not df.empty:
                 # 格式化日期输出，提升可读性
@@ -190,79 +255,135 @@ def get_single_day_data(trade_date):
             # 接口调用失败，重试逻辑
             retry_count += 1
             print(f"获取 {trade_date} 数据时出错 (第{retry_count}次重试): {e}")
+            if limiter is not None and is_rate_limit_error(e):
+                new_rate = limiter.throttle()
+                print(f"⚠️ 触发频率限制，降速至每分钟 {new_rate:.0f} 次后重试")
+                continue
             print(f"等待 65 秒后重试...")
             time.sleep(65)  # 重试间隔65秒（避免触发接口频率限制）
 
 
 # ===================== 主逻辑函数 =====================
-def get_daily_data_by_day(start_date, end_date):
+def get_daily_data_by_day(start_date, end_date, workers=None, rate_per_minute=None, writers=None, queue_size=None,
+                          engine=None):
     """
     按日期范围批量拉取+写入数据（内存优化版）
     核心优化：
-        1. 内存仅保留单日数据，循环结束后立即释放，避免内存累积
+        1. 内存仅保留少数几天的数据，写入后立即释放，避免内存累积
         2. 独立变量累加统计，不依赖最终合并的DataFrame
         3. 单日数据拉取完成后，立即写入数据库
+        4. 先解析区间内的交易日列表，只对交易日调用pro.daily，进度与预计剩余时间按交易日计算
+        5. 多线程并发拉取（令牌桶限流），结果按交易日顺序交付
+        6. 拉取与写入组成流水线：拉取结果进入有界队列，由写入线程消费，网络与数据库耗时相互重叠；
+           队列满时拉取端阻塞，内存中最多保留 2×拉取线程数 + 队列长度 + 写入线程数 天的数据
 
     参数：
         start_date: 开始日期，格式为'YYYYMMDD'
         end_date: 结束日期，格式为'YYYYMMDD'
+        workers: 拉取线程数，默认读取配置项 TUSHARE_FETCH_WORKERS（4）
+        rate_per_minute: 每分钟调用配额，默认读取配置项 TUSHARE_RATE_PER_MINUTE（200）
+        writers: 写入线程数，默认读取配置项 DAILY_WRITE_WORKERS（1）
+        queue_size: 写入队列长度，默认读取配置项 DAILY_WRITE_QUEUE_SIZE（4）
+        engine: 数据库连接引擎，整个任务共用；默认新建并在结束时释放
     返回：
-        tuple: (是否获取到数据, 总记录数, 累计写入数, 累计更新数)
+        tuple: (是否获取到数据, 总记录数, 累计写入数, 累计更新数, 累计跳过数, 按年统计)
     """
-    # 日期格式转换：字符串→datetime对象（便于日期遍历）
-    start = datetime.strptime(start_date, '%Y%m%d')
-    end = datetime.strptime(end_date, '%Y%m%d')
-
     # 统计变量初始化（仅保留统计值，不存储原始数据）
     total_record_count = 0  # 总记录数（所有日期有效数据条目累加）
     total_write_count = 0  # 累计写入数据库条目数
     total_update_count = 0  # 累计更新条目数（主键重复）
+    total_skip_count = 0  # 累计跳过条目数（内容未变化，未写入）
     has_data = False  # 标记是否获取到有效数据
-    # 新增：按年统计的字典，结构 {年份: {'累计写入': 0, '累计更新': 0, '新增': 0}}
+    # 新增：按年统计的字典，结构 {年份: {'累计写入': 0, '累计更新': 0, '跳过': 0, '新增': 0}}
     year_stats = {}
+    day_count = 0  # 已处理交易日数
+    stats_lock = threading.Lock()  # 多个写入线程共用统计变量
 
-    # 计算需要处理的总天数
-    total_days = (end - start).days + 1
-    print(f"共需要处理 {total_days} 天")
-
-    # 按日期循环拉取+写入数据
-    for day_count in range(total_days):
-        current_date = start + timedelta(days=day_count)  # 计算当前循环日期
-        trade_date = current_date.strftime('%Y%m%d')  # 转换为YYYYMMDD格式
+    # 整个任务共用一个引擎（连接池线程安全，多个写入线程共享）
+    own_engine = engine is None
+    if own_engine:
+        engine = get_db_engine()
+    # 确保内容指纹表存在（写入前用于跳过未变化的交易日）
+    ensure_fingerprint_table(engine)
+
+    # 解析区间内的交易日（本地缓存的交易所日历，缺失时用trade_cal刷新）
+    trade_days = get_exchange_trade_days(start_date, end_date, pro=pro)
+    total_days = len(trade_days)
+    calendar_days = (datetime.strptime(end_date, '%Y%m%d') - datetime.strptime(start_date, '%Y%m%d')).days + 1
+    print(f"共需要处理 {total_days} 个交易日（区间共 {calendar_days} 个自然日）")
+
+    # 并发拉取配置：所有线程共享同一个令牌桶
+    workers, rate_per_minute = get_fetch_settings(workers, rate_per_minute)
+    writers, queue_size = get_write_settings(writers, queue_size)
+    limiter = TokenBucket(rate_per_minute)
+    timer = StageTimer()
+    print(f"🚀 并发拉取：{workers} 个线程，限流每分钟 {rate_per_minute:.0f} 次；"
+          f"写入：{writers} 个线程，队列长度 {queue_size}")
+    date_strs = pd.DatetimeIndex(trade_days).strftime('%Y%m%d').tolist()
+
+    def fetch_day(trade_date):
+        """拉取阶段：单日数据（含等待令牌与重试的耗时）"""
+        with timer.stage('拉取'):
+            return get_single_day_data(trade_date, limiter)
+
+    def write_day(item):
+        """写入阶段：单日数据写库并累加统计"""
+        nonlocal total_record_count, total_write_count, total_update_count, total_skip_count, has_data, day_count
+        trade_date, df = item
         current_year = trade_date[:4]  # 提取当前日期的年份
 
-        # 拉取单日数据
-        df = get_single_day_data(trade_date)
-
         # 仅处理有数据的日期
         if not df.empty:
-            has_data = True
-            # 累加当日记录数到总统计
-            day_record_count = len(df)
-            total_record_count += day_record_count
-
             # 写入数据库并更新统计值
-            day_total, day_updated = write_to_mysql_with_update(df)
-            day_new = day_total - day_updated  # 当日新增数
-            total_write_count += day_total
-            total_update_count += day_updated
-
-            # 新增：更新按年统计的数据
-            if current_year not in year_stats:
-                year_stats[current_year] = {'累计写入': 0, '累计更新': 0, '新增': 0}
-            year_stats[current_year]['累计写入'] += day_total
-            year_stats[current_year]['累计更新'] += day_updated
-            year_stats[current_year]['新增'] += day_new
+            day_record_count = len(df)
+            day_total, day_updated, day_skipped = write_to_mysql_with_update(df, engine=engine)
+            day_new = day_total - day_updated - day_skipped  # 当日新增数
+
+            with stats_lock:
+                has_data = True
+                # 累加当日记录数到总统计
+                total_record_count += day_record_count
+                total_write_count += day_total
+                total_update_count += day_updated
+                total_skip_count += day_skipped
+
+                # 新增：更新按年统计的数据
+                if current_year not in year_stats:
+                    year_stats[current_year] = {'累计写入': 0, '累计更新': 0, '跳过': 0, '新增': 0}
+                year_stats[current_year]['累计写入'] += day_total
+                year_stats[current_year]['累计更新'] += day_updated
+                year_stats[current_year]['跳过'] += day_skipped
+                year_stats[current_year]['新增'] += day_new
 
             # 输出当日写入结果（格式化输出，提升可读性）
             print(
-                f"           ✅ 写入完成：当日总条目 {day_record_count} 条，更新 {day_updated} 条，新增 {day_total - day_updated} 条")
+                f"           ✅ {trade_date} 写入完成：当日总条目 {day_record_count} 条，更新 {day_updated} 条，"
+                f"跳过 {day_skipped} 条，新增 {day_new} 条")
+
+        # 按已处理交易日的平均耗时估算剩余时间
+        with stats_lock:
+            day_count += 1
+            finished_days = day_count
+        elapsed = time.time() - loop_start
+        remaining = elapsed / finished_days * (total_days - finished_days)
+        print(f"        ⏱️ 进度 {finished_days}/{total_days} 个交易日（{finished_days / total_days:.1%}），"
+              f"已用 {elapsed:.0f} 秒，预计剩余 {remaining:.0f} 秒")
+
+    # 拉取线程池按交易日顺序交付结果，写入线程从有界队列中消费
+    loop_start = time.time()
+    try:
+        fetched = fetch_in_order(fetch_day, date_strs, workers=workers)
+        run_pipeline(fetched, write_day, writers=writers, queue_size=queue_size, timer=timer)
+    finally:
+        if own_engine:
+            engine.dispose()
+    timer.report(time.time() - loop_start)
 
-            # 显式清空当日DataFrame，释放内存（Python自动回收，显式更清晰）
-            df = None
+    if limiter.throttle_count:
+        print(f"⚠️ 拉取期间共触发 {limiter.throttle_count} 次频率限制，结束时速率为每分钟 {limiter.rate_per_minute:.0f} 次")
 
     # 返回统计结果（无合并DataFrame，降低内存占用）
-    return has_data, total_record_count, total_write_count, total_update_count, year_stats
+    return has_data, total_record_count, total_write_count, total_update_count, total_skip_count, year_stats
 
 
 # ===================== 程序入口 =====================
@@ -293,6 +414,7 @@ if __name__ == "__main__":
     print(f"开始按天获取数据，日期范围: {start_date} 到 {end_date}")
     print("=" * 50)
 
+    engine = None
     try:
         # 记录任务开始
         try:
@@ -300,33 +422,38 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"日志记录失败: {e}")
 
-        # 执行主逻辑：拉取+写入数据
-        has_data, total_record, total_write, total_update, year_stats = get_daily_data_by_day(start_date, end_date)
+        # 执行主逻辑：拉取+写入数据（日线写入与周线/月线刷新共用同一个引擎）
+        engine = get_db_engine()
+        has_data, total_record, total_write, total_update, total_skip, year_stats = get_daily_data_by_day(
+            start_date, end_date, engine=engine)
 
         # 新增：按年展示数据条目统计（标题和数值严格右对齐）
         if has_data:
             print("\n📈 按年数据条目统计：")
-            print("-" * 60)
+            print("-" * 75)
             # 核心修改：统一列宽度，标题和数值都右对齐，宽度设为18（适配千分位数字长度）
             col_width = 14
-            print(f"{'年份':<10} {'累计写入':>{col_width}} {'累计更新':>{col_width}} {'新增':>{col_width}}")
-            print("-" * 60)
+            print(f"{'年份':<10} {'累计写入':>{col_width}} {'累计更新':>{col_width}} {'跳过':>{col_width}} "
+                  f"{'新增':>{col_width}}")
+            print("-" * 75)
             # 遍历年份，格式化输出：千分位 + 固定宽度右对齐
             for year in sorted(year_stats.keys()):
                 stats = year_stats[year]
                 # 格式化数字为千分位，并填充到固定宽度，确保和标题右对齐
                 write_count = f"{stats['累计写入']:,}".rjust(col_width)
                 update_count = f"{stats['累计更新']:,}".rjust(col_width)
+                skip_count = f"{stats['跳过']:,}".rjust(col_width)
                 new_count = f"{stats['新增']:,}".rjust(col_width)
-                print(f"{year:<10}{write_count}{update_count}{new_count}")
-            print("-" * 60)
+                print(f"{year:<10}{write_count}{update_count}{skip_count}{new_count}")
+            print("-" * 75)
 
         # 输出最终统计结果
         if has_data:
             print("=" * 50)
             print("数据获取完成!")
             print(f"总记录数: {total_record:,}")
-            result_msg = f"累计写入 {total_write:,} 条，累计更新 {total_update:,} 条，新增 {total_write - total_update:,} 条"
+            result_msg = (f"累计写入 {total_write:,} 条，累计更新 {total_update:,} 条，"
+                          f"跳过（内容未变化） {total_skip:,} 条，新增 {total_write - total_update - total_skip:,} 条")
             print(f"📊 数据库写入汇总：{result_msg}")
             
             # 记录成功日志
@@ -334,6 +461,14 @@ if __name__ == "__main__":
                 log_task_execution("日K线抽取", "SUCCESS", f"执行成功: {result_msg}")
             except Exception:
                 pass
+
+            # 刷新本次日线涉及的周线/月线周期（刷新失败不影响日线入库结果）
+            try:
+                for freq in PERIOD_FREQS:
+                    ensure_period_table(engine, freq)
+                refresh_all_period_bars(engine, start_date, end_date)
+            except Exception as e:
+                print(f"⚠️ 周线/月线刷新失败: {e}")
         else:
             print("没有获取到任何数据")
             try:
@@ -347,3 +482,6 @@ if __name__ == "__main__":
             log_task_execution("日K线抽取", "FAIL", f"执行出错: {str(e)}")
         except Exception:
             pass
+    finally:
+        if engine is not None:
+            engine.dispose()
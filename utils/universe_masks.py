@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+股票池掩码（板块 / 上市天数 / 停牌 / ST），按位压缩存储
+====================
+功能说明：
+1. 每个交易日保存两个按位压缩（np.packbits）的掩码：traded（当日有成交）与st（当日为ST股），
+   每只股票每天只占1位，容量8192只时每个交易日每个掩码仅1KB
+2. 板块由股票代码推出（主板/创业板/科创板/北交所），上市日期取cn_stock_daily中首根K线的日期，
+   二者均按股票保存，无需逐日存储
+3. 构建（build）是显式的一次性步骤；之后的增量更新（sync）只在文件末尾追加新交易日的掩码，
+   不重写历史数据（与panel_store相同的存储方式）
+4. make_universe_filter生成行级过滤函数，选股在计算REF与条件之前先按股票池剔除股票
+
+说明：
+- stock_name只有当前名称，无法还原历史ST状态：构建时历史交易日的st位一律不设置，
+  之后每次增量更新按当时stock_name中名称以ST或*ST开头的股票记录ST快照；
+  meta.json中的st_from为首个有ST快照的交易日，此前的交易日不会按ST剔除
+- 上市天数按自然日计算；数据库历史起点之前上市的股票，以起点为首根K线日期
+
+目录结构（.cache/universe）：
+    meta.json       股票容量、股票数、交易日数、首个有ST快照的交易日（st_from）
+    codes.txt       股票代码（按列序号排列，追加新股票时写在末尾）
+    first_dates.npy 各股票首根K线日期（datetime64[D]）
+    dates.npy       交易日（datetime64[D]）
+    <mask>.bits     uint8数组，形状[n_days, capacity // 8]
+
+命令行用法：
+    python utils/universe_masks.py build --start 20000101 [--end 20251231]
+    python utils/universe_masks.py sync [--end 20251231]
+    python utils/universe_masks.py show --date 20250110 [--boards main,chinext] [--min-listed-days 60] [--exclude-st]
+====================
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_cache_dir, get_db_engine
+    from daily_reader import read_daily_typed, read_trade_days
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_cache_dir, get_db_engine
+    from utils.daily_reader import read_daily_typed, read_trade_days
+
+MASK_NAMES = ('traded', 'st')
+BOARDS = ('main', 'chinext', 'star', 'bj')
+DEFAULT_CAPACITY = 8192
+
+
+# ========================== 板块与名称 ==========================
+def classify_boards(ts_codes):
+    """
+    由股票代码推出所属板块
+
+    返回值：
+    ----------
+    numpy.ndarray
+        main（沪深主板）、chinext（创业板300/301）、star（科创板688/689）、bj（北交所）
+    """
+    codes = pd.Series(np.asarray(ts_codes, dtype=object)).astype(str)
+    boards = np.full(len(codes), 'main', dtype=object)
+    boards[(codes.str.endswith('.SZ') & codes.str.startswith('30')).to_numpy()] = 'chinext'
+    boards[(codes.str.endswith('.SH') & codes.str.startswith('68')).to_numpy()] = 'star'
+    boards[codes.str.endswith('.BJ').to_numpy()] = 'bj'
+    return boards
+
+
+def read_st_codes(engine):
+    """读取stock_name中当前名称以ST或*ST开头的股票代码（名称中间含ST字样的股票不算）"""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT ts_code FROM stock_name "
+            "WHERE UPPER(TRIM(ts_code_name)) LIKE 'ST%' OR UPPER(TRIM(ts_code_name)) LIKE '*ST%'"
+        )).fetchall()
+    return {row[0] for row in rows}
+
+
+def read_first_dates(engine, end_date):
+    """读取各股票在cn_stock_daily中首根K线的日期"""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+        SELECT ts_code, MIN(trade_date) FROM cn_stock_daily
+        WHERE trade_date <= :end_date
+        GROUP BY ts_code
+        """), {"end_date": end_date}).fetchall()
+    return {row[0]: pd.Timestamp(str(row[1])) for row in rows}
+
+
+# ========================== 元数据读写 ==========================
+def _universe_dir(universe_dir=None):
+    return universe_dir or get_cache_dir('universe')
+
+
+def _read_meta(universe_dir):
+    path = os.path.join(universe_dir, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_index(universe_dir, meta, codes, first_dates, dates):
+    """先写索引文件，最后原子替换meta.json（meta中的计数决定可见的数据范围）"""
+    with open(os.path.join(universe_dir, 'codes.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(codes))
+    np.save(os.path.join(universe_dir, 'first_dates.npy'), np.asarray(first_dates, dtype='datetime64[D]'))
+    np.save(os.path.join(universe_dir, 'dates.npy'), np.asarray(dates, dtype='datetime64[D]'))
+    tmp_path = os.path.join(universe_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(universe_dir, 'meta.json'))
+
+
+def _read_codes(universe_dir):
+    with open(os.path.join(universe_dir, 'codes.txt'), 'r', encoding='utf-8') as f:
+        content = f.read()
+    return content.split('\n') if content else []
+
+
+# ========================== 写入 ==========================
+def _append_days(universe_dir, capacity, codes, code_index, first_dates, days, df, st_codes):
+    """
+    将若干交易日的掩码按位压缩后追加到各掩码文件末尾
+
+    新出现的股票会追加到codes/code_index/first_dates中（原地修改），首根K线日期取其在df中的最早日期；
+    st_codes为None时（没有当时的ST快照）st位一律不设置
+    """
+    if len(days) == 0:
+        return
+    df_codes = df['ts_code'].astype(str)
+    new_first = df.groupby(df_codes, sort=False)['trade_date'].min()
+    for code, first_date in new_first.items():
+        if code not in code_index:
+            code_index[code] = len(codes)
+            codes.append(code)
+            first_dates.append(first_date)
+    if len(codes) > capacity:
+        raise ValueError(f"股票数 {len(codes)} 超过股票池容量 {capacity}，请使用更大的capacity重建")
+
+    day_pos = np.searchsorted(days.to_numpy(), df['trade_date'].to_numpy())
+    stock_pos = df_codes.map(code_index).to_numpy()
+    # 有K线且成交量大于0视为当日有成交（部分数据源停牌日也有K线，成交量为0）
+    traded = np.zeros((len(days), capacity), dtype=bool)
+    has_volume = np.nan_to_num(df['vol'].to_numpy(dtype=np.float64)) > 0
+    traded[day_pos[has_volume], stock_pos[has_volume]] = True
+    st_row = np.zeros(capacity, dtype=bool)
+    if st_codes is not None:
+        st_row[[code_index[code] for code in st_codes if code in code_index]] = True
+    blocks = {'traded': traded, 'st': np.broadcast_to(st_row, (len(days), capacity))}
+    for name in MASK_NAMES:
+        with open(os.path.join(universe_dir, f"{name}.bits"), 'ab') as f:
+            f.write(np.packbits(blocks[name], axis=1).tobytes())
+
+
+def build_universe(engine, start_date, end_date=None, universe_dir=None, capacity=DEFAULT_CAPACITY):
+    """
+    从cn_stock_daily重建股票池掩码（按年分批读取；历史交易日没有ST快照，st位不设置）
+
+    参数说明：
+    ----------
+    engine : sqlalchemy.engine.Engine
+        数据库连接引擎
+    start_date / end_date : str
+        起止日期，格式为YYYYMMDD；end_date默认今天
+    universe_dir : str, 可选
+        掩码目录，默认 .cache/universe
+    capacity : int, 可选
+        预留的股票列数（8的倍数），默认8192
+    """
+    universe_dir = _universe_dir(universe_dir)
+    os.makedirs(universe_dir, exist_ok=True)
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    for name in [f"{mask}.bits" for mask in MASK_NAMES] + ['meta.json']:
+        path = os.path.join(universe_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    trade_days = read_trade_days(engine, start_date, end_date)
+    first_known = read_first_dates(engine, end_date)
+    codes, code_index, first_dates = [], {}, []
+    for year in sorted(set(trade_days.year)):
+        year_days = trade_days[trade_days.year == year]
+        df = read_daily_typed(engine, year_days[0].strftime('%Y%m%d'), year_days[-1].strftime('%Y%m%d'),
+                              fields=['vol'], verbose=False)
+        _append_days(universe_dir, capacity, codes, code_index, first_dates, year_days, df, None)
+        print(f"   股票池写入 {year} 年：{len(year_days)} 个交易日，{len(df):,} 行")
+    # 构建区间之前已有K线的股票，以数据库中的首根K线日期为准
+    first_dates = [min(first_date, first_known.get(code, first_date)) for code, first_date in zip(codes, first_dates)]
+
+    meta = {'capacity': capacity, 'n_stocks': len(codes), 'n_days': len(trade_days), 'st_from': None}
+    _write_index(universe_dir, meta, codes, first_dates, trade_days.to_numpy())
+    print(f"✅ 股票池构建完成：{len(codes)} 只股票 × {len(trade_days)} 个交易日"
+          f"（ST状态从之后的增量更新开始记录）")
+
+
+def append_universe(engine, end_date=None, universe_dir=None):
+    """
+    追加最后一个交易日之后的新交易日掩码（ST状态取当前stock_name快照，首次追加时记录st_from）
+
+    返回值：
+    ----------
+    int
+        追加的交易日数
+    """
+    universe_dir = _universe_dir(universe_dir)
+    meta = _read_meta(universe_dir)
+    if meta is None:
+        raise FileNotFoundError("股票池掩码不存在，请先执行build_universe")
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+
+    dates = np.load(os.path.join(universe_dir, 'dates.npy'))[:meta['n_days']]
+    codes = _read_codes(universe_dir)[:meta['n_stocks']]
+    first_dates = list(pd.DatetimeIndex(np.load(os.path.join(universe_dir, 'first_dates.npy'))[:meta['n_stocks']]))
+    next_day = (pd.Timestamp(dates[-1]) + pd.Timedelta(days=1)).strftime('%Y%m%d') if len(dates) else '19900101'
+    new_days = read_trade_days(engine, next_day, end_date)
+    if len(new_days) == 0:
+        return 0
+
+    # 截掉上次追加失败可能残留的多余数据，保证文件长度与meta一致
+    row_bytes = meta['capacity'] // 8
+    for name in MASK_NAMES:
+        with open(os.path.join(universe_dir, f"{name}.bits"), 'r+b') as f:
+            f.truncate(meta['n_days'] * row_bytes)
+
+    df = read_daily_typed(engine, new_days[0].strftime('%Y%m%d'), new_days[-1].strftime('%Y%m%d'),
+                          fields=['vol'], verbose=False)
+    code_index = {code: i for i, code in enumerate(codes)}
+    _append_days(universe_dir, meta['capacity'], codes, code_index, first_dates, new_days, df,
+                 read_st_codes(engine))
+
+    meta['n_stocks'] = len(codes)
+    meta['n_days'] = len(dates) + len(new_days)
+    if not meta.get('st_from'):
+        meta['st_from'] = new_days[0].strftime('%Y%m%d')
+    _write_index(universe_dir, meta, codes, first_dates,
+                 np.concatenate([dates, new_days.to_numpy().astype('datetime64[D]')]))
+    print(f"✅ 股票池追加 {len(new_days)} 个交易日，当前 {meta['n_stocks']} 只股票 × {meta['n_days']} 个交易日")
+    return len(new_days)
+
+
+def sync_universe(engine, end_date=None, universe_dir=None):
+    """
+    只追加新交易日；掩码不存在时抛出FileNotFoundError（全量构建需显式执行build，不在选股流程中隐式进行）
+    """
+    if _read_meta(_universe_dir(universe_dir)) is None:
+        raise FileNotFoundError("股票池掩码不存在，请先执行 python utils/universe_masks.py build --start YYYYMMDD")
+    return append_universe(engine, end_date, universe_dir=universe_dir)
+
+
+# ========================== 读取与过滤 ==========================
+def open_universe(universe_dir=None):
+    """
+    以内存映射方式打开股票池掩码
+
+    返回值：
+    ----------
+    dict
+        - codes: numpy.ndarray，股票代码；code_index: {代码: 列序号}
+        - boards: numpy.ndarray，各股票板块
+        - first_dates: numpy.ndarray，各股票首根K线日期（datetime64[D]）
+        - dates: pandas.DatetimeIndex，交易日
+        - st_from: str or None，首个有ST快照的交易日（YYYYMMDD），此前的交易日st位未设置
+        - bits: {掩码名: [n_days, capacity // 8]的只读uint8视图}
+    """
+    universe_dir = _universe_dir(universe_dir)
+    meta = _read_meta(universe_dir)
+    if meta is None:
+        raise FileNotFoundError("股票池掩码不存在，请先执行 python utils/universe_masks.py build --start YYYYMMDD")
+    n_days, n_stocks, row_bytes = meta['n_days'], meta['n_stocks'], meta['capacity'] // 8
+    bits = {}
+    for name in MASK_NAMES:
+        if n_days == 0:
+            bits[name] = np.zeros((0, row_bytes), dtype=np.uint8)
+            continue
+        bits[name] = np.memmap(os.path.join(universe_dir, f"{name}.bits"), dtype=np.uint8, mode='r',
+                               shape=(n_days, row_bytes))
+    codes = np.array(_read_codes(universe_dir)[:n_stocks], dtype=object)
+    return {
+        'codes': codes,
+        'code_index': {code: i for i, code in enumerate(codes)},
+        'boards': classify_boards(codes),
+        'first_dates': np.load(os.path.join(universe_dir, 'first_dates.npy'))[:n_stocks],
+        'dates': pd.DatetimeIndex(np.load(os.path.join(universe_dir, 'dates.npy'))[:n_days]),
+        'st_from': meta.get('st_from'),
+        'bits': bits,
+    }
+
+
+def _test_bits(packed, day_idx, stock_idx):
+    """从按位压缩的矩阵中取出(day_idx, stock_idx)处的位（np.packbits默认高位在前）"""
+    return ((packed[day_idx, stock_idx >> 3] >> (7 - (stock_idx & 7))) & 1).astype(bool)
+
+
+def universe_row_mask(universe, ts_codes, trade_dates, boards=None, min_listed_days=0, exclude_st=False,
+                      require_traded=True):
+    """
+    逐行判断(股票, 交易日)是否在股票池内
+
+    参数说明：
+    ----------
+    universe : dict
+        open_universe的返回值
+    ts_codes / trade_dates : array-like
+        与日线长表逐行对应的股票代码与交易日期
+    boards : iterable, 可选
+        只保留这些板块（BOARDS的子集），默认全部
+    min_listed_days : int, 可选
+        上市（首根K线）至当日不足该自然日数的股票剔除，默认0
+    exclude_st : bool, 可选
+        是否剔除当日为ST的股票，默认False（只对st_from及之后有ST快照的交易日生效）
+    require_traded : bool, 可选
+        是否剔除当日停牌（无成交）的记录，默认True
+
+    返回值：
+    ----------
+    numpy.ndarray
+        bool数组；股票池未覆盖的股票或交易日一律为False
+    """
+    categorical = pd.Categorical(ts_codes)
+    category_index = np.array([universe['code_index'].get(code, -1) for code in categorical.categories],
+                              dtype=np.int64)
+    stock_idx = category_index[categorical.codes] if len(category_index) else np.full(len(categorical), -1)
+    trade_dates = pd.DatetimeIndex(trade_dates)
+    dates = universe['dates']
+    day_idx = dates.searchsorted(trade_dates)
+    covered = (stock_idx >= 0) & (day_idx < len(dates))
+    covered[covered] = dates[day_idx[covered]] == trade_dates[covered]
+
+    mask = covered.copy()
+    rows = np.flatnonzero(covered)
+    day_idx, stock_idx = day_idx[rows], stock_idx[rows]
+    keep = np.ones(len(rows), dtype=bool)
+    if boards is not None:
+        keep &= np.isin(universe['boards'][stock_idx], list(boards))
+    if min_listed_days:
+        listed_days = (trade_dates[rows].to_numpy().astype('datetime64[D]')
+                       - universe['first_dates'][stock_idx]).astype(np.int64)
+        keep &= listed_days >= min_listed_days
+    if exclude_st:
+        keep &= ~_test_bits(universe['bits']['st'], day_idx, stock_idx)
+    if require_traded:
+        keep &= _test_bits(universe['bits']['traded'], day_idx, stock_idx)
+    mask[rows] = keep
+    return mask
+
+
+def universe_codes(universe, trade_date, **filters):
+    """某个交易日在股票池内的股票代码（filters同universe_row_mask）"""
+    codes = universe['codes']
+    mask = universe_row_mask(universe, codes, np.full(len(codes), pd.Timestamp(trade_date)), **filters)
+    return codes[mask].tolist()
+
+
+def make_universe_filter(universe, **filters):
+    """
+    生成行级股票池过滤函数，供select_stocks / run_strategies的universe参数使用
+
+    返回值：
+    ----------
+    function
+        universe_filter(ts_codes, trade_dates) -> bool数组；spec属性为过滤条件的文本描述，
+        用于区分不同股票池下的选股结果（参与data_version计算）
+    """
+    def universe_filter(ts_codes, trade_dates):
+        return universe_row_mask(universe, ts_codes, trade_dates, **filters)
+
+    universe_filter.spec = ';'.join(
+        f"{key}={','.join(sorted(value)) if isinstance(value, (list, tuple, set)) else value}"
+        for key, value in sorted(filters.items())
+    )
+    return universe_filter
+
+
+# ========================== 命令行入口 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="股票池掩码（板块/上市天数/停牌/ST）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='全量构建掩码（覆盖已有掩码）')
+    build_parser.add_argument('--start', required=True, help='起始日期 YYYYMMDD')
+    build_parser.add_argument('--end', default=None, help='结束日期 YYYYMMDD，默认今天')
+
+    sync_parser = subparsers.add_parser('sync', help='增量追加新交易日的掩码（需先执行build）')
+    sync_parser.add_argument('--end', default=None, help='结束日期 YYYYMMDD，默认今天')
+
+    show_parser = subparsers.add_parser('show', help='查看某个交易日各板块的股票池数量')
+    show_parser.add_argument('--date', required=True, help='交易日 YYYYMMDD')
+    show_parser.add_argument('--boards', default=None, help='逗号分隔的板块：main,chinext,star,bj')
+    show_parser.add_argument('--min-listed-days', type=int, default=0, help='最少上市自然日数')
+    show_parser.add_argument('--exclude-st', action='store_true', help='剔除ST股')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_universe(get_db_engine(), args.start, args.end)
+    elif args.command == 'sync':
+        sync_universe(get_db_engine(), end_date=args.end)
+    else:
+        universe = open_universe()
+        boards = args.boards.split(',') if args.boards else None
+        codes = np.array(universe_codes(universe, args.date, boards=boards,
+                                        min_listed_days=args.min_listed_days, exclude_st=args.exclude_st),
+                         dtype=object)
+        print(f"📊 {args.date} 股票池：{len(codes)} 只")
+        if len(codes):
+            for board, count in pd.Series(classify_boards(codes)).value_counts().items():
+                print(f"   {board}: {count}")
+
+
+if __name__ == "__main__":
+    main()